@@ -17,7 +17,7 @@ def detect_subscriptions(df):
     subscriptions = []
 
     from typing import cast, Any
-    for vendor, group in df.groupby("vendor"):
+    for vendor, group in df.groupby("vendor", observed=True):
         # Explicitly cast group to DataFrame to satisfy Pyright/Pylance
         group = cast(pd.DataFrame, group)
         if len(group) < 2:
@@ -1,9 +1,8 @@
 import streamlit as st  # type: ignore
-import pandas as pd  # type: ignore
 import plotly.express as px  # type: ignore
 import plotly.graph_objects as go  # type: ignore
 from datetime import datetime, timedelta  # type: ignore
-from database.queries import fetch_all_receipts  # type: ignore
+from database.queries import fetch_receipts_frame, get_month_spend, get_spend_summary, get_category_totals  # type: ignore
 from config.translations import get_text, TRANSLATIONS  # type: ignore
 from config.config import CURRENCY_SYMBOL  # type: ignore
 from ai.insights import generate_ai_insights  # type: ignore
@@ -137,19 +136,18 @@ def apply_custom_css():
 def render_analytics():
     apply_custom_css()
     lang = st.session_state.get("language", "en")
+    owner = st.session_state.get("user_email")
     st.markdown(get_text(lang, "analytics_header"))
     st.markdown(get_text(lang, "analytics_subtitle"))
     st.divider()
 
     # ---------------- Fetch Data ----------------
-    receipts = fetch_all_receipts()
+    df = fetch_receipts_frame(owner=owner)
 
-    if not receipts:
+    if df.empty:
         st.info(get_text(lang, "no_receipts_analytics"))
         return
 
-    df = pd.DataFrame(receipts)
-    df["date"] = pd.to_datetime(df["date"])
     df = df.sort_values(by="date")
 
     # ---------------- Sidebar Filters ----------------
@@ -186,8 +184,7 @@ def render_analytics():
     st.session_state["monthly_budget"] = budget_goal
 
     current_month = datetime.now().strftime("%Y-%m")
-    current_month_df = df[df["date"].dt.strftime("%Y-%m") == current_month]
-    current_month_total = current_month_df["amount"].sum()
+    current_month_total = get_month_spend(current_month, owner=owner)
     days_passed = datetime.now().day
 
     budget_stats = calculate_burn_rate(current_month_total, budget_goal, days_passed)
@@ -223,14 +220,20 @@ def render_analytics():
 
     col1, col2, col3, col4 = st.columns(4)
 
-    total_spending = df_filtered["amount"].sum()
-    avg_transaction = df_filtered["amount"].mean() if not df_filtered.empty else 0
-    transaction_count = len(df_filtered)
-
-    if not df_filtered.empty:
-        cat_group = df_filtered.groupby("category")["amount"].sum().sort_values(ascending=False)
-        top_cat = cat_group.index[0]
-        top_cat_amt = cat_group.iloc[0]
+    # KPI cards come from the rollup tables for the selected range
+    if len(date_range) == 2:
+        kpi_start, kpi_end = date_range[0].strftime("%Y-%m-%d"), date_range[1].strftime("%Y-%m-%d")
+    else:
+        kpi_start, kpi_end = None, None
+    summary = get_spend_summary(kpi_start, kpi_end, owner=owner)
+    total_spending = summary["total"]
+    avg_transaction = summary["average"]
+    transaction_count = summary["count"]
+
+    cat_totals = get_category_totals(kpi_start, kpi_end, owner=owner)
+    if cat_totals:
+        top_cat = cat_totals[0]["category"]
+        top_cat_amt = cat_totals[0]["total"]
     else:
         top_cat, top_cat_amt = "N/A", 0
 
@@ -374,7 +377,7 @@ def render_analytics():
     with tab_cats:
         st.markdown(get_text(lang, "category_distribution_header"))
         
-        cat_df = df_filtered.groupby("category")["amount"].sum().reset_index()
+        cat_df = df_filtered.groupby("category", observed=True)["amount"].sum().reset_index()
         cat_df = cat_df.sort_values("amount", ascending=False)
 
         col_a, col_b = st.columns(2)
@@ -445,7 +448,7 @@ def render_analytics():
         st.markdown(get_text(lang, "top_vendors_header"))
         
         vendor_df = (
-            df_filtered.groupby("vendor")["amount"]
+            df_filtered.groupby("vendor", observed=True)["amount"]
             .agg(['sum', 'count'])
             .reset_index()
             .sort_values("sum", ascending=False)
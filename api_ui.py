@@ -18,7 +18,7 @@ def render_api_ui():
         st.markdown("""
         **Base Endpoint:** `http://localhost:8000/api/v1`  
         **Docs:** [Swagger UI](http://localhost:8000/docs)  
-        **Auth:** Default (API Key Required in Production)
+        **Auth:** HTTP Basic with your account email and password
         """)
         
     with col2:
@@ -44,19 +44,32 @@ def render_api_ui():
     with col_b:
         st.text_input("Client ID / API Secret", type="password", value="**************")
 
+    # The API only returns the signed-in account's receipts
+    user_email = st.session_state.get("user_email") or ""
+    api_password = st.text_input("Account Password (API sign-in)", type="password", key="api_password")
+
+    incremental = st.checkbox("Only sync receipts changed since the last sync", value=True)
+
     # Simulation / Sync
     if st.button("🚀 Trigger Manual ERP Sync", type="primary", use_container_width=True):
         with st.spinner(f"Mapping and transmitting data to {erp_system}..."):
             try:
                 # Mock a call to our own local API to get the ERP payload
                 # We use a POST to simulate a transformation
-                res = requests.post("http://localhost:8000/api/v1/erp/sync", params={"system": erp_system}, timeout=5)
+                res = requests.post(
+                    "http://localhost:8000/api/v1/erp/sync",
+                    params={"system": erp_system, "incremental": incremental},
+                    auth=(user_email, api_password),
+                    timeout=5
+                )
                 if res.status_code == 200:
                     result = res.json()
                     st.success(f"Successfully synced {result['exported_records']} records to {erp_system}")
                     
                     with st.expander("📄 View Transmitted ERP Payload (JSON)"):
                         st.json(result["payload_preview"])
+                elif res.status_code == 401:
+                    st.error("API sign-in failed. Check your account password.")
                 else:
                     st.error("Failed to fetch ERP payload from API.")
             except Exception as e:
@@ -70,6 +83,7 @@ def render_api_ui():
     To fetch data for your accounting software, use the following payload structure:
     ```bash
     curl -X GET "http://localhost:8000/api/v1/receipts?vendor=Amazon" \\
+         -u "{user_email or 'you@example.com'}:<password>" \\
          -H "accept: application/json"
     ```
     
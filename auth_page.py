@@ -1,5 +1,7 @@
 import streamlit as st  # type: ignore
 from config.translations import get_text, get_available_languages  # type: ignore
+from config.config import LEGACY_RECEIPTS_OWNER  # type: ignore
+from database.queries import claim_unowned_receipts  # type: ignore
 import hashlib  # type: ignore
 import json  # type: ignore
 import os  # type: ignore
@@ -191,6 +193,13 @@ def verify_user(email: str, password: str) -> bool:
     return False
 
 
+def claim_legacy_receipts(email: str):
+    """Gives receipts saved before receipts had owners to their account (see LEGACY_RECEIPTS_OWNER)"""
+    legacy_owner = LEGACY_RECEIPTS_OWNER or (email if len(load_users()) == 1 else None)
+    if legacy_owner == email:
+        claim_unowned_receipts(email)
+
+
 def google_sign_in_placeholder():
     """Placeholder for Google Sign-In (requires OAuth setup)"""
     st.info("""
@@ -274,6 +283,7 @@ def render_login_page():
         if st.button(get_text(lang, "login"), type="primary", use_container_width=True):
             if email and password:
                 if verify_user(email, password):
+                    claim_legacy_receipts(email)
                     st.session_state["authenticated"] = True
                     st.session_state["user_email"] = email
                     st.session_state["page"] = "app"
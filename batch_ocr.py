@@ -0,0 +1,120 @@
+"""
+Parallel OCR for batch uploads.
+
+Each file is decoded, preprocessed, run through Tesseract and parsed with
+parse_receipt in a worker process (unless the extraction cache already
+has it), so a month-end batch uses every core and the Streamlit thread
+only collects results.
+"""
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+
+class UploadedReceipt(NamedTuple):
+    name: str
+    content: bytes
+    mime_type: str
+
+
+# ---------- WORKER ----------
+
+def _init_worker():
+    import pytesseract  # type: ignore
+    from config.config import TESSERACT_PATH  # type: ignore
+    if os.path.exists(TESSERACT_PATH):
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
+    # One Tesseract thread per worker process; the pool provides the parallelism
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def ocr_receipt(upload: UploadedReceipt) -> Dict[str, Any]:
+    """
+    Runs in a worker process. Returns {"name", "data", "items", "text",
+    "preview", "error"}; preview is a thumbnail-sized copy of the (first
+    page) image for the blob store. Failures are reported in "error"
+    instead of raised so one bad file never aborts the batch.
+    """
+    import pytesseract  # type: ignore
+    from PIL import Image  # type: ignore
+    from database.blob_store import THUMBNAIL_SIZE
+    from ocr.extraction_cache import get_cached, put_cached, tesseract_engine
+    from ocr.image_preprocessing import preprocess_image
+    from ocr.text_parser import apply_date_fallback, parse_receipt
+
+    result: Dict[str, Any] = {
+        "name": upload.name, "data": None, "items": [], "text": None, "preview": None, "error": None
+    }
+
+    def keep_preview(page: int, img: Any):
+        if page == 1:
+            preview = img.copy()
+            preview.thumbnail(THUMBNAIL_SIZE)
+            result["preview"] = preview
+
+    def ocr_page(img: Any) -> str:
+        return pytesseract.image_to_string(preprocess_image(img))
+
+    try:
+        engine = tesseract_engine()
+        cached = get_cached(upload.content, engine)
+        if cached is not None:
+            # Seen before: only the preview needs decoding
+            result["data"], result["items"], result["text"] = cached
+            apply_date_fallback(result["data"])
+            if upload.mime_type == "application/pdf":
+                from ocr.pdf_processor import pdf_first_page
+                keep_preview(1, pdf_first_page(upload.content))
+            else:
+                keep_preview(1, Image.open(io.BytesIO(upload.content)))
+            return result
+
+        if upload.mime_type == "application/pdf":
+            # Every page, OCRed while the next ones render, parsed as one receipt
+            from ocr.pdf_processor import ocr_pdf
+            text = ocr_pdf(upload.content, ocr_page, on_page=keep_preview)
+        else:
+            img = Image.open(io.BytesIO(upload.content))
+            keep_preview(1, img)
+            text = ocr_page(img)
+        if not text.strip():
+            result["error"] = "No readable text detected"
+            return result
+        result["text"] = text
+        # Cached without today's date, which would be stale on a later re-upload
+        result["data"], result["items"] = parse_receipt(text, date_fallback=False)
+        put_cached(upload.content, engine, result["data"], result["items"], text)
+        apply_date_fallback(result["data"])
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+# ---------- POOL ----------
+
+def ocr_receipts(uploads: List[UploadedReceipt], workers: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    OCRs and parses `uploads` in a process pool sized to the cores, yielding
+    each result as soon as its file is done (completion order, so callers
+    can report per-file progress). result["index"] is the file's position
+    in `uploads`. A file whose worker crashed (BrokenProcessPool) or whose
+    result could not be pickled gets an "error" result like any other
+    failure.
+    """
+    if not uploads:
+        return
+    workers = min(workers or os.cpu_count() or 1, len(uploads))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(ocr_receipt, upload): index for index, upload in enumerate(uploads)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {
+                    "name": uploads[index].name, "data": None, "items": [], "text": None, "preview": None,
+                    "error": f"{type(e).__name__}: {e}",
+                }
+            result["index"] = index
+            yield result
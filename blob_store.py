@@ -0,0 +1,156 @@
+import hashlib
+import io
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, BinaryIO, Iterable, Iterator, Tuple, Union
+
+from database.db import DB_PATH
+
+# ================= BLOB STORE =================
+# Original receipt uploads are stored once on local disk, addressed by the
+# SHA-256 of their bytes and sharded two levels deep (ab/cd/abcd...) so no
+# directory grows unbounded. Identical uploads share one file. Blobs are
+# immutable: a file only appears under its final name once it is complete.
+BLOB_DIR = DB_PATH.parent / "blobs"
+THUMBNAIL_DIR = BLOB_DIR / "thumbs"
+_TMP_DIR = BLOB_DIR / "tmp"
+
+CHUNK_SIZE = 1 << 20               # 1 MiB per streamed read
+THUMBNAIL_SIZE = (320, 320)
+
+
+def blob_path(digest: str) -> Path:
+    return BLOB_DIR / digest[:2] / digest[2:4] / digest
+
+
+def thumbnail_path(digest: str) -> Path:
+    return THUMBNAIL_DIR / digest[:2] / f"{digest}.jpg"
+
+
+def has_blob(digest: str) -> bool:
+    return blob_path(digest).is_file()
+
+
+def _publish(tmp_path: Path, final_path: Path) -> bool:
+    """Moves a finished temp file into place; returns False if it already existed."""
+    if final_path.exists():
+        tmp_path.unlink()
+        return False
+    final_path.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp_path, final_path)
+    return True
+
+
+# ================= WRITE =================
+def put_blob(source: Union[bytes, BinaryIO]) -> Tuple[str, int]:
+    """
+    Stores `source` (bytes or a readable binary file object, e.g. a
+    Streamlit upload) and returns (sha256 hex digest, size in bytes).
+    File objects are streamed in CHUNK_SIZE pieces while hashing, so the
+    upload is never held in memory twice. Storing existing content is a
+    no-op apart from the hashing.
+    """
+    _TMP_DIR.mkdir(parents=True, exist_ok=True)
+    sha = hashlib.sha256()
+    size = 0
+    fd, name = tempfile.mkstemp(dir=_TMP_DIR)
+    tmp_path = Path(name)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                chunks: Iterable[Any] = (source,)
+            else:
+                chunks = iter(lambda: source.read(CHUNK_SIZE), b"")
+            for chunk in chunks:
+                sha.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+        digest = sha.hexdigest()
+        _publish(tmp_path, blob_path(digest))
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return digest, size
+
+
+# ================= READ =================
+@contextmanager
+def open_blob(digest: str) -> Iterator[Union[mmap.mmap, bytes]]:
+    """
+    Yields the blob's content memory-mapped read-only, so large files are
+    paged in on demand and shared with the OS cache instead of copied.
+    The mapping is closed on exit; copy anything that must outlive it.
+    Raises FileNotFoundError for unknown digests.
+    """
+    with open(blob_path(digest), "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files cannot be mapped
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+def load_blob_image(digest: str) -> Any:
+    """Decodes an image blob straight from its memory map into a PIL image."""
+    from PIL import Image  # type: ignore
+    with open_blob(digest) as mapped:
+        img = Image.open(mapped if isinstance(mapped, mmap.mmap) else io.BytesIO(mapped))
+        # Decode fully before the mapping closes
+        img.load()
+    return img
+
+
+# ================= THUMBNAILS =================
+def make_thumbnail(digest: str, image: Any = None, size: Tuple[int, int] = THUMBNAIL_SIZE) -> Path:
+    """
+    Writes the JPEG thumbnail of a blob once and returns its path. Pass the
+    already decoded `image` at ingest (required for non-image blobs such as
+    PDFs, e.g. the rendered first page) to skip decoding the blob again.
+    """
+    path = thumbnail_path(digest)
+    if path.exists():
+        return path
+    img = (image if image is not None else load_blob_image(digest)).copy()
+    img.thumbnail(size)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    _TMP_DIR.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(dir=_TMP_DIR, suffix=".jpg")
+    with os.fdopen(fd, "wb") as out:
+        img.save(out, format="JPEG", quality=80)
+    _publish(Path(name), path)
+    return path
+
+
+# ================= MAINTENANCE =================
+def iter_blob_digests() -> Iterator[str]:
+    if not BLOB_DIR.is_dir():
+        return
+    for path in BLOB_DIR.glob("[0-9a-f][0-9a-f]/[0-9a-f][0-9a-f]/*"):
+        yield path.name
+
+
+def remove_unreferenced_blobs(referenced: Iterable[str]) -> int:
+    """
+    Deletes blobs (and their thumbnails) whose digest is not in
+    `referenced`, plus leftover temp files. Returns the number of blobs
+    removed. Run it while no uploads are in flight.
+    """
+    keep = set(referenced)
+    removed = 0
+    for digest in list(iter_blob_digests()):
+        if digest not in keep:
+            blob_path(digest).unlink(missing_ok=True)
+            thumbnail_path(digest).unlink(missing_ok=True)
+            removed += 1
+    if _TMP_DIR.is_dir():
+        for leftover in _TMP_DIR.iterdir():
+            leftover.unlink(missing_ok=True)
+    return removed
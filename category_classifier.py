@@ -0,0 +1,107 @@
+"""
+Keyword-based receipt categorization.
+
+Categories and their keywords come from a JSON file (CATEGORY_KEYWORDS_PATH
+in config, overridable with the CATEGORY_KEYWORDS_PATH environment
+variable): an object mapping each category to its keywords, in priority
+order. A receipt gets the first category with a keyword in the vendor
+name, else the first category with a keyword anywhere in its text.
+Keywords match as case-insensitive substrings.
+
+All keywords are compiled into one prefix-trie regex inside a zero-width
+lookahead, so a single pass over the text finds the longest keyword
+starting at each position, whatever the number of keywords. Each keyword
+maps to the best category among itself and the keywords that are its
+prefixes (which start at the same position), so the longest match is
+enough.
+"""
+import hashlib
+import json
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from config.config import CATEGORY_KEYWORDS_PATH  # type: ignore
+from utils.helpers import keyword_trie_pattern  # type: ignore
+
+UNCATEGORIZED = "Uncategorized"
+VENDOR_MEMO_SIZE = 4096
+
+
+class CategoryMatcher:
+    """Compiled keyword set; categorize() is safe to call from any thread."""
+
+    def __init__(self, keywords: Dict[str, List[str]]):
+        self.categories: List[str] = list(keywords)
+        rank: Dict[str, int] = {}
+        for index, category in enumerate(self.categories):
+            for word in keywords[category]:
+                if word:
+                    rank.setdefault(word.lower(), index)
+        self.keyword_count = len(rank)
+        # Best category of any keyword that is a prefix of this one
+        self._best: Dict[str, int] = {
+            word: min(rank[word[:end]] for end in range(1, len(word) + 1) if word[:end] in rank)
+            for word in rank
+        }
+        self._pattern = re.compile(f"(?=({keyword_trie_pattern(sorted(rank))}))") if rank else None
+        self.digest = hashlib.sha256(json.dumps(keywords).encode("utf-8")).hexdigest()
+        self._vendor_category = lru_cache(maxsize=VENDOR_MEMO_SIZE)(self._scan)
+
+    def _scan(self, text: str) -> Optional[str]:
+        """Highest-priority category with a keyword in lowercased `text`."""
+        if self._pattern is None:
+            return None
+        best = len(self.categories)
+        for m in self._pattern.finditer(text):
+            index = self._best[m.group(1)]
+            if index < best:
+                best = index
+                if best == 0:
+                    break
+        return self.categories[best] if best < len(self.categories) else None
+
+    def categorize(self, text: str, vendor: str = "") -> str:
+        # Vendor names repeat across receipts, so their lookups are memoized
+        category = self._vendor_category(vendor.lower()) if vendor else None
+        return category or self._scan(text.lower()) or UNCATEGORIZED
+
+    def vendor_memo_info(self):
+        return self._vendor_category.cache_info()
+
+
+# ================= LOADING =================
+def load_category_keywords(path: str = CATEGORY_KEYWORDS_PATH) -> Dict[str, List[str]]:
+    with open(path, encoding="utf-8") as f:
+        keywords = json.load(f)
+    if not isinstance(keywords, dict) or not all(isinstance(v, list) for v in keywords.values()):
+        raise ValueError(f"{path}: expected an object mapping categories to keyword lists")
+    return keywords
+
+
+_matcher: Optional[CategoryMatcher] = None
+_matcher_lock = threading.Lock()
+
+
+def get_category_matcher() -> CategoryMatcher:
+    """The matcher for the configured keyword file, built on first use."""
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                _matcher = CategoryMatcher(load_category_keywords())
+    return _matcher
+
+
+def reload_category_keywords(path: str = CATEGORY_KEYWORDS_PATH) -> CategoryMatcher:
+    """Re-reads the keyword file (and drops the vendor memo), e.g. after editing it."""
+    global _matcher
+    matcher = CategoryMatcher(load_category_keywords(path))
+    with _matcher_lock:
+        _matcher = matcher
+    return matcher
+
+
+def categorize(text: str, vendor: str = "") -> str:
+    return get_category_matcher().categorize(text, vendor)
@@ -1,7 +1,6 @@
 # Receipt Vault - Chat with Data
 import streamlit as st  # type: ignore
-import pandas as pd  # type: ignore
-from database.queries import fetch_all_receipts  # type: ignore
+from database.queries import fetch_receipts_frame  # type: ignore
 from ai.gemini_client import GeminiClient  # type: ignore
 
 def render_chat():
@@ -9,12 +8,10 @@ def render_chat():
     st.info("Ask questions about your spending, vendors, or trends using natural language.")
 
     # 1. Fetch Data for Context
-    receipts = fetch_all_receipts()
-    if not receipts:
+    df = fetch_receipts_frame(owner=st.session_state.get("user_email"))
+    if df.empty:
         st.warning("No data found. Please upload receipts first to enable chat.")
         return
-
-    df = pd.DataFrame(receipts)
     
     # 2. Chat history initialization
     if "messages" not in st.session_state:
@@ -0,0 +1,36 @@
+"""
+Assigns receipts saved before receipts had owners (they are stored under
+the empty owner '' and no account can see them) to an account.
+
+    python -m database.claim_receipts user@example.com
+
+Single-account installs do not need this: the only account claims them
+at sign-in (see LEGACY_RECEIPTS_OWNER in config/config.py).
+"""
+import argparse
+import logging
+import os
+import sys
+from typing import List, Optional
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.db import init_db
+from database.queries import claim_unowned_receipts
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Assign unowned (pre-accounts) receipts to an account.")
+    parser.add_argument("owner", help="email of the account that gets the receipts")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    init_db()
+    claimed = claim_unowned_receipts(args.owner)
+    logger.info("%d receipts assigned to %s", claimed, args.owner)
+
+
+if __name__ == "__main__":
+    main()
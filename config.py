@@ -36,6 +36,29 @@ MAX_FILE_SIZE_MB = 10
 IMAGE_DPI = 300
 GRAYSCALE = True
 
+# =========================================================
+# CATEGORY KEYWORDS (category -> keywords, in priority order)
+# =========================================================
+CATEGORY_KEYWORDS_PATH = os.environ.get(
+    "CATEGORY_KEYWORDS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "category_keywords.json")
+)
+
+# =========================================================
+# VENDOR TEMPLATES (JSON/YAML files, reloaded when they change)
+# =========================================================
+TEMPLATE_DIR = os.environ.get(
+    "RECEIPT_TEMPLATE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "vendor_templates")
+)
+
+# =========================================================
+# RECEIPTS SAVED BEFORE RECEIPTS HAD OWNERS
+# =========================================================
+# Account that claims them at sign-in. When unset, a single-account
+# install gives them to its only account.
+LEGACY_RECEIPTS_OWNER = os.environ.get("LEGACY_RECEIPTS_OWNER") or None
+
 # =========================================================
 # ANALYTICS CONFIGURATION
 # =========================================================
@@ -2,7 +2,8 @@
 import streamlit as st  # type: ignore
 import pandas as pd  # type: ignore
 import plotly.express as px  # type: ignore
-from database.queries import fetch_all_receipts, search_receipts, delete_receipt  # type: ignore
+from database.queries import fetch_receipts_frame, delete_receipts, update_receipts, get_spend_summary  # type: ignore
+from database.writer import submit_write  # type: ignore
 from ai.insights import generate_ai_insights  # type: ignore
 from config.config import CURRENCY_SYMBOL  # type: ignore
 from datetime import datetime  # type: ignore
@@ -96,6 +97,7 @@ def generate_pdf_report(df, lang="en"):
 
 def render_dashboard():
     lang = st.session_state.get("language", "en")
+    owner = st.session_state.get("user_email")
     st.markdown(f"## 📊 {get_text(lang, 'dashboard_header')}")
 
     # --- 1. SEARCH & FILTERS (Server-Side) ---
@@ -121,34 +123,40 @@ def render_dashboard():
             apply_filters = st.button("🔎 Apply Filters", use_container_width=True, type="primary")
 
     # Fetch Data based on filters
+    filtered = False
+    filters = None
     if apply_filters or search_vendor or (search_category != "All") or search_date or min_amt or max_amt:
         # Format date string matches
         s_date_str = search_date.strftime("%Y-%m-%d") if search_date else None
         
-        receipts = search_receipts(
+        filters = dict(
             vendor=search_vendor,
             category=search_category if search_category != "All" else None,
             min_amount=min_amt if min_amt > 0 else None,
             max_amount=max_amt if max_amt > 0 else None,
             start_date=s_date_str # Simple exact match or start match logic in query
         )
-        st.caption(f"Found {len(receipts)} matching receipts")
-    else:
-        receipts = fetch_all_receipts()
+        filtered = True
+
+    # Loaded newest first with compact dtypes
+    df = fetch_receipts_frame(filters, owner=owner)
+    if filtered:
+        st.caption(f"Found {len(df)} matching receipts")
 
-    if not receipts:
+    if df.empty:
         st.info(get_text(lang, "no_receipts_found"))
         return
-
-    df = pd.DataFrame(receipts)
-    df["date"] = pd.to_datetime(df["date"])
-    df = df.sort_values(by="date", ascending=False)
     
     # --- 2. Key Metrics ---
-    total_spend = df["amount"].sum()
-    total_tax = df["tax"].sum()
-    count = len(df)
-    avg = df["amount"].mean()
+    if filtered:
+        total_spend = df["amount"].sum()
+        total_tax = df["tax"].sum()
+        count = len(df)
+        avg = df["amount"].mean()
+    else:
+        # Unfiltered view: read the trigger-maintained rollups
+        summary = get_spend_summary(owner=owner)
+        total_spend, total_tax, count, avg = summary["total"], summary["tax"], summary["count"], summary["average"]
 
     m1, m2, m3, m4 = st.columns(4)
     m1.metric(get_text(lang, "total_spending"), f"{CURRENCY_SYMBOL}{total_spend:,.2f}")
@@ -224,6 +232,7 @@ def render_dashboard():
     
     # Selection/Delete
     df_display = df.copy()
+    df_display["vendor"] = df_display["vendor"].astype(str)  # free-text editable
     df_display.insert(0, "Select", False)
     
     edited_df = st.data_editor(
@@ -234,21 +243,38 @@ def render_dashboard():
             "amount": st.column_config.NumberColumn(format=f"{CURRENCY_SYMBOL}%.2f"),
             "tax": st.column_config.NumberColumn(format=f"{CURRENCY_SYMBOL}%.2f"),
         },
-        disabled=["bill_id", "vendor", "date", "amount", "tax", "category"],
+        disabled=["bill_id", "date", "subtotal"],
         hide_index=True,
         use_container_width=True,
         key="dashboard_editor"
     )
 
-    col_actions, _ = st.columns([1, 1])
+    col_actions, col_save = st.columns([1, 1])
     
     with col_actions:
         if st.button(get_text(lang, "delete_selected_btn"), type="secondary"):
             to_delete = edited_df[edited_df["Select"] == True]
             if not to_delete.empty:
-                for bid in to_delete["bill_id"]:
-                    delete_receipt(bid)
-                st.success(f"Deleted {len(to_delete)} receipts!")
+                deleted = submit_write(delete_receipts, to_delete["bill_id"].tolist(), owner=owner).result()
+                st.success(f"Deleted {deleted} receipts!")
+                st.rerun()
+            else:
+                st.warning("Select receipts to delete")
+
+    with col_save:
+        if st.button("💾 Save Changes", type="secondary"):
+            # Diff the editable columns against the loaded data, one transaction for all edits
+            editable = ["vendor", "category", "amount", "tax"]
+            original = df_display.set_index("bill_id")[editable].astype(object)
+            edited = edited_df.set_index("bill_id")[editable].astype(object)
+            changed = (original != edited).any(axis=1)
+            changes = {
+                bid: {col: edited.at[bid, col] for col in editable if original.at[bid, col] != edited.at[bid, col]}
+                for bid in edited.index[changed]
+            }
+            if changes:
+                updated = submit_write(update_receipts, changes, owner=owner).result()
+                st.success(f"Updated {updated} receipts!")
                 st.rerun()
             else:
-                st.warning("Select receipts to delete")
\ No newline at end of file
+                st.info("No changes to save")
\ No newline at end of file
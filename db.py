@@ -1,48 +1,754 @@
+import atexit
+import logging
+import os
+import re
 import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date as date_type, datetime
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
 from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 # ================= DATABASE FILE =================
-DB_PATH = Path("receipts.db")
+# RECEIPTS_DB_PATH points tools and benchmarks at another database file
+DB_PATH = Path(os.environ.get("RECEIPTS_DB_PATH", "receipts.db"))
+
+# ================= DUPLICATE FINGERPRINT =================
+# Normalized vendor | ISO date | amount in integer cents. Used both as the
+# generated receipts.fingerprint column and to build probe values, so the
+# stored and probed forms can never drift apart.
+FINGERPRINT_SQL = "lower(trim({vendor})) || '|' || {date} || '|' || {cents}"
+
+
+# ================= MONEY & DATE NORMALIZATION =================
+def to_cents(value: Any) -> int:
+    """Converts a money amount (float, str, Decimal) to integer cents, rounding half up."""
+    try:
+        return int(Decimal(str(value).replace(",", "")).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) * 100)
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Invalid amount: {value!r}")
+
+
+_LOOSE_DATE = re.compile(r"^\s*(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})")
+
+
+def iso_date(value: Any) -> str:
+    """
+    Normalizes a date (date, datetime or Y-M-D string, padded or not) to
+    zero-padded ISO YYYY-MM-DD so it sorts and compares correctly.
+    Strings in any other shape are returned stripped but unchanged.
+    """
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date_type):
+        return value.isoformat()
+    text = str(value).strip()
+    m = _LOOSE_DATE.match(text)
+    if m:
+        try:
+            return date_type(int(m.group(1)), int(m.group(2)), int(m.group(3))).isoformat()
+        except ValueError:
+            pass
+    return text
+
+
+def date_ordinal(value: Any) -> Optional[int]:
+    """Day number matching the receipts.date_ord column (integer Julian day)."""
+    text = iso_date(value)
+    try:
+        return date_type.fromisoformat(text).toordinal() + 1721424
+    except ValueError:
+        return None
+
+# ================= CONNECTION TUNING =================
+# Applied once per connection. WAL lets Streamlit sessions read while the
+# API writes; busy_timeout makes writers wait instead of raising
+# "database is locked" straight away.
+DB_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,        # KiB (negative) -> ~64 MB page cache
+    "mmap_size": 268435456,      # 256 MB memory-mapped I/O
+    "busy_timeout": 5000,        # ms
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+
+_connections: Dict[threading.Thread, sqlite3.Connection] = {}
+_conn_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=DB_PRAGMAS["busy_timeout"] / 1000)
+    conn.row_factory = sqlite3.Row
+    for name, value in DB_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def _reap_dead_connections():
+    """Close connections owned by threads that have finished (caller holds the lock)."""
+    for thread in [t for t in _connections if not t.is_alive()]:
+        try:
+            _connections.pop(thread).close()
+        except sqlite3.Error:
+            pass
 
 
 # ================= GET DB CONNECTION =================
 def get_db():
     """
-    Returns a SQLite connection with row_factory enabled
+    Returns the calling thread's SQLite connection with row_factory enabled
     so rows behave like dictionaries.
+    Connections are opened once per thread, tuned with DB_PRAGMAS and
+    reused across calls; connections of finished threads are closed.
     """
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
+    thread = threading.current_thread()
+    conn = _connections.get(thread)
+    if conn is not None:
+        return conn
+
+    with _conn_lock:
+        _reap_dead_connections()
+        conn = _connect()
+        _connections[thread] = conn
     return conn
 
 
+# ================= TRANSACTIONS =================
+@contextmanager
+def transaction(immediate: bool = True) -> Iterator[sqlite3.Connection]:
+    """
+    Runs the enclosed statements in one transaction on the thread's connection.
+    Commits on success, rolls back on error. BEGIN IMMEDIATE takes the write
+    lock up front so concurrent writers queue on busy_timeout instead of
+    failing mid-transaction. Nested use joins the outer transaction.
+    """
+    conn = get_db()
+    if conn.in_transaction:
+        yield conn
+        return
+
+    conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+# ================= SHUTDOWN =================
+def close_db():
+    """Closes every pooled connection. Registered to run at interpreter exit."""
+    with _conn_lock:
+        for conn in _connections.values():
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _connections.clear()
+
+
+atexit.register(close_db)
+
+
+# ================= RECEIPTS SCHEMA =================
+# Money is stored as integer cents and dates as zero-padded ISO text with a
+# numeric date_ord (Julian day, see date_ordinal). date_ord is a plain column
+# written alongside date because SQLite cannot use an index on a generated
+# column as a covering index. amount/tax/subtotal remain readable as
+# generated REAL columns so existing SELECTs keep working.
+# owner_id is the signed-in user's email; '' holds receipts saved before
+# receipts had owners. Bill IDs are unique per owner, not globally: two
+# users may both store an INV-001.
+RECEIPTS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        bill_id TEXT NOT NULL,
+        vendor TEXT NOT NULL,
+        date TEXT NOT NULL,
+        amount_cents INTEGER NOT NULL,
+        tax_cents INTEGER NOT NULL,
+        subtotal_cents INTEGER NOT NULL DEFAULT 0,
+        category TEXT DEFAULT 'Uncategorized',
+        date_ord INTEGER,
+        owner_id TEXT NOT NULL DEFAULT '',
+        amount REAL GENERATED ALWAYS AS (amount_cents / 100.0) VIRTUAL,
+        tax REAL GENERATED ALWAYS AS (tax_cents / 100.0) VIRTUAL,
+        subtotal REAL GENERATED ALWAYS AS (subtotal_cents / 100.0) VIRTUAL,
+        fingerprint TEXT GENERATED ALWAYS AS ({fingerprint}) VIRTUAL,
+        PRIMARY KEY (owner_id, bill_id)
+    )
+"""
+# Stored (non-generated) receipts columns, for copying rows between tables
+RECEIPT_STORED_COLUMNS = "bill_id, vendor, date, date_ord, amount_cents, tax_cents, subtotal_cents, category, owner_id"
+
+
+def _receipts_schema(table: str = "receipts") -> str:
+    return RECEIPTS_SCHEMA.format(
+        table=table,
+        fingerprint=FINGERPRINT_SQL.format(vendor="vendor", date="date", cents="amount_cents"),
+    )
+
+
+# Per-user queries filter on owner_id first, so every index leads with it
+# and a user's reads stay inside their own slice of each index.
+RECEIPT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_vendor ON receipts(vendor)",
+    # (owner_id, date, bill_id) backs the keyset-paginated readers
+    "CREATE INDEX IF NOT EXISTS idx_owner_date_bill ON receipts(owner_id, date, bill_id)",
+    # Covering indexes for date range + amount and date range + category filters
+    "CREATE INDEX IF NOT EXISTS idx_owner_date_amount ON receipts(owner_id, date_ord, amount_cents)",
+    "CREATE INDEX IF NOT EXISTS idx_owner_category_date ON receipts(owner_id, category, date_ord, amount_cents)",
+    "CREATE INDEX IF NOT EXISTS idx_owner_fingerprint ON receipts(owner_id, fingerprint)",
+    # Unscoped (owner=None) lookups by bill ID; scoped ones use the primary key
+    "CREATE INDEX IF NOT EXISTS idx_bill ON receipts(bill_id)",
+    "DROP INDEX IF EXISTS idx_date",
+    "DROP INDEX IF EXISTS idx_category",
+    "DROP INDEX IF EXISTS idx_date_bill",
+    "DROP INDEX IF EXISTS idx_date_amount",
+    "DROP INDEX IF EXISTS idx_category_date",
+    "DROP INDEX IF EXISTS idx_fingerprint",
+]
+
+
+def _receipt_columns(db) -> set:
+    return {r["name"] for r in db.execute("PRAGMA table_xinfo(receipts)")}
+
+
+def _primary_key(db, table: str) -> List[str]:
+    """Primary key columns of `table` in key order."""
+    rows = [r for r in db.execute(f"PRAGMA table_info({table})") if r[5]]
+    return [r[1] for r in sorted(rows, key=lambda r: r[5])]
+
+
+def _add_owner_column(db):
+    if "owner_id" not in _receipt_columns(db):
+        db.execute("ALTER TABLE receipts ADD COLUMN owner_id TEXT NOT NULL DEFAULT ''")
+
+
+def _migrate_receipts_to_cents(db, progress: "ProgressCallback", batch_size: int = 5000):
+    """
+    Rebuilds a legacy receipts table (REAL money, free-text dates) into
+    RECEIPTS_SCHEMA in batches, converting amounts to cents and padding dates.
+    Rowids are preserved so the full-text index stays aligned; rollups are
+    dropped here and rebuilt by a later migration.
+    """
+    if "amount_cents" in _receipt_columns(db):
+        return
+
+    total = db.execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
+    done = 0
+    db.execute("DROP TABLE IF EXISTS receipts_migrating")
+    db.execute(_receipts_schema("receipts_migrating"))
+    cur = db.execute(
+        "SELECT rowid, bill_id, vendor, date, amount, tax, subtotal, category FROM receipts"
+    )
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        db.executemany(
+            """
+            INSERT INTO receipts_migrating
+                (rowid, bill_id, vendor, date, date_ord, amount_cents, tax_cents, subtotal_cents, category)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    r["rowid"], r["bill_id"], r["vendor"], iso_date(r["date"]), date_ordinal(r["date"]),
+                    to_cents(r["amount"] or 0), to_cents(r["tax"] or 0), to_cents(r["subtotal"] or 0),
+                    r["category"],
+                )
+                for r in rows
+            ],
+        )
+        done += len(rows)
+        progress("integer cents and ISO dates", done, total)
+
+    # Dropping the old table also drops its indexes and triggers
+    db.execute("DROP TABLE receipts")
+    db.execute("ALTER TABLE receipts_migrating RENAME TO receipts")
+    for table in ROLLUP_TABLES:
+        db.execute(f"DROP TABLE IF EXISTS {table}")
+
+
 # ================= INITIALIZE DATABASE =================
-def init_db():
+def init_db(progress: Optional["ProgressCallback"] = None):
     """
-    Creates receipts table if it does not exist.
-    Call this once at app startup.
+    Brings the database schema up to date by running pending migrations.
+    Call this once at app startup; when the schema is current it costs a
+    single PRAGMA read.
     """
-    db = get_db()
+    return run_migrations(progress)
+
+
+# ================= LINE ITEMS =================
+ITEMS_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS receipt_items (
+        item_id INTEGER PRIMARY KEY,
+        owner_id TEXT NOT NULL DEFAULT '',
+        bill_id TEXT NOT NULL,
+        line_no INTEGER NOT NULL,
+        name TEXT NOT NULL COLLATE NOCASE,
+        qty REAL NOT NULL DEFAULT 1,
+        unit_price_cents INTEGER NOT NULL,
+        line_total_cents INTEGER NOT NULL,
+        FOREIGN KEY (owner_id, bill_id) REFERENCES receipts(owner_id, bill_id) ON DELETE CASCADE ON UPDATE CASCADE
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_items_bill ON receipt_items(owner_id, bill_id, line_no)",
+    # name + total lets item-level spend roll up from the index alone
+    "CREATE INDEX IF NOT EXISTS idx_items_name ON receipt_items(name, line_total_cents)",
+]
+# Stored receipt_items columns other than owner_id
+ITEM_STORED_COLUMNS = "item_id, bill_id, line_no, name, qty, unit_price_cents, line_total_cents"
+
+
+# ================= FULL-TEXT SEARCH INDEX =================
+# receipts_fts rows share the rowid of their receipts row. `details` holds
+# the line item names, the searchable text that is not a receipts column
+# (raw OCR text is stored compressed and is not indexed). FTS_DETAILS_SQL
+# computes it for the receipts row aliased `r` of the partition whose
+# schema ('main', 'archive_YYYY') is {schema}.
+FTS_DETAILS_SQL = (
+    "COALESCE((SELECT group_concat(i.name, ' ') FROM {schema}.receipt_items i "
+    "WHERE i.owner_id = r.owner_id AND i.bill_id = r.bill_id), '')"
+)
+
+FTS_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS receipts_fts USING fts5(
+        bill_id, vendor, category, details,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS receipts_fts_ai AFTER INSERT ON receipts BEGIN
+        INSERT INTO receipts_fts(rowid, bill_id, vendor, category, details)
+        VALUES (new.rowid, new.bill_id, new.vendor, new.category, '');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS receipts_fts_ad AFTER DELETE ON receipts BEGIN
+        DELETE FROM receipts_fts WHERE rowid = old.rowid;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS receipts_fts_au AFTER UPDATE OF bill_id, vendor, category ON receipts BEGIN
+        UPDATE receipts_fts
+        SET bill_id = new.bill_id, vendor = new.vendor, category = new.category
+        WHERE rowid = old.rowid;
+    END
+    """,
+]
 
+
+def rebuild_search_index(db=None):
+    """
+    Repopulates receipts_fts from receipts.
+    Run after bulk maintenance that renumbers rowids (e.g. VACUUM).
+    """
+    db = db or get_db()
+    db.execute("DELETE FROM receipts_fts")
     db.execute(
         """
-        CREATE TABLE IF NOT EXISTS receipts (
-            bill_id TEXT PRIMARY KEY,
-            vendor TEXT NOT NULL,
-            date TEXT NOT NULL,
-            amount REAL NOT NULL,
-            tax REAL NOT NULL,
-            subtotal REAL DEFAULT 0.0,
-            category TEXT DEFAULT 'Uncategorized'
+        INSERT INTO receipts_fts(rowid, bill_id, vendor, category, details)
+        SELECT r.rowid, r.bill_id, r.vendor, r.category, {details} FROM receipts r
+        """.format(details=FTS_DETAILS_SQL.format(schema="main"))
+    )
+
+
+# ================= SPENDING ROLLUPS =================
+# table -> (key columns, key expressions over a receipts row alias)
+# Every rollup is keyed by owner first so per-user totals are a PK range.
+# Category and vendor are keyed by day so any date range can be summed exactly.
+# Months come from date_ord (integer Julian days start at noon, hence +0.5);
+# receipts stored before dates were validated may have none and share the
+# '' month.
+ROLLUP_TABLES = {
+    "spend_by_day": (("owner_id", "day"), ("{r}.owner_id", "{r}.date")),
+    "spend_by_month": (
+        ("owner_id", "month"),
+        ("{r}.owner_id", "coalesce(strftime('%Y-%m', {r}.date_ord + 0.5), '')"),
+    ),
+    "spend_by_category": (
+        ("owner_id", "day", "category"),
+        ("{r}.owner_id", "{r}.date", "coalesce({r}.category, 'Uncategorized')"),
+    ),
+    "spend_by_vendor": (("owner_id", "day", "vendor"), ("{r}.owner_id", "{r}.date", "{r}.vendor")),
+}
+ROLLUP_TRIGGERS = ("receipts_rollup_ai", "receipts_rollup_ad", "receipts_rollup_au")
+
+
+def _rollup_add(table: str, r: str) -> str:
+    keys, exprs = ROLLUP_TABLES[table]
+    values = ", ".join(e.format(r=r) for e in exprs)
+    return (
+        f"INSERT INTO {table} ({', '.join(keys)}, total_cents, tax_cents, receipt_count) "
+        f"VALUES ({values}, {r}.amount_cents, {r}.tax_cents, 1) "
+        f"ON CONFLICT({', '.join(keys)}) DO UPDATE SET "
+        "total_cents = total_cents + excluded.total_cents, tax_cents = tax_cents + excluded.tax_cents, "
+        "receipt_count = receipt_count + 1;"
+    )
+
+
+def _rollup_subtract(table: str, r: str) -> str:
+    keys, exprs = ROLLUP_TABLES[table]
+    match = " AND ".join(f"{k} = {e.format(r=r)}" for k, e in zip(keys, exprs))
+    return (
+        f"UPDATE {table} SET total_cents = total_cents - {r}.amount_cents, tax_cents = tax_cents - {r}.tax_cents, "
+        f"receipt_count = receipt_count - 1 WHERE {match}; "
+        f"DELETE FROM {table} WHERE receipt_count <= 0 AND {match};"
+    )
+
+
+ROLLUP_SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        {', '.join(f'{k} TEXT NOT NULL' for k in keys)},
+        total_cents INTEGER NOT NULL DEFAULT 0,
+        tax_cents INTEGER NOT NULL DEFAULT 0,
+        receipt_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY ({', '.join(keys)})
+    ) WITHOUT ROWID
+    """
+    for table, (keys, _) in ROLLUP_TABLES.items()
+] + [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS receipts_rollup_ai AFTER INSERT ON receipts BEGIN
+        {' '.join(_rollup_add(t, 'new') for t in ROLLUP_TABLES)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS receipts_rollup_ad AFTER DELETE ON receipts BEGIN
+        {' '.join(_rollup_subtract(t, 'old') for t in ROLLUP_TABLES)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS receipts_rollup_au AFTER UPDATE OF owner_id, date, date_ord, vendor, category, amount_cents, tax_cents ON receipts BEGIN
+        {' '.join(_rollup_subtract(t, 'old') for t in ROLLUP_TABLES)}
+        {' '.join(_rollup_add(t, 'new') for t in ROLLUP_TABLES)}
+    END
+    """,
+]
+
+
+def rebuild_rollups(db=None):
+    """
+    Recomputes every spending rollup table from receipts and the archive
+    partitions. Called outside a transaction it attaches the archives a
+    group at a time; inside one (e.g. a migration), where attaching is not
+    possible, each archive is read on a connection of its own.
+    """
+    db = db or get_db()
+    # table -> key -> [total_cents, tax_cents, receipt_count]
+    totals: Dict[str, Dict[Tuple[Any, ...], List[int]]] = {table: {} for table in ROLLUP_TABLES}
+
+    def accumulate(conn, schemas: List[str]):
+        source = " UNION ALL ".join(
+            f"SELECT owner_id, date, date_ord, vendor, category, amount_cents, tax_cents FROM {s}.receipts"
+            for s in schemas
         )
-        """
+        for table, (keys, exprs) in ROLLUP_TABLES.items():
+            group_by = ", ".join(e.format(r="r") for e in exprs)
+            cur = conn.execute(
+                f"SELECT {group_by}, SUM(r.amount_cents), SUM(r.tax_cents), COUNT(*) FROM ({source}) r GROUP BY {group_by}"
+            )
+            for row in cur:
+                sums = totals[table].setdefault(tuple(row[:len(keys)]), [0, 0, 0])
+                for j, value in enumerate(row[len(keys):]):
+                    sums[j] += value
+
+    if db.in_transaction:
+        accumulate(db, ["main"])
+        for year in archived_years():
+            conn = sqlite3.connect(archive_path(year))
+            try:
+                accumulate(conn, ["main"])
+            finally:
+                conn.close()
+    else:
+        years = archived_years()
+        groups = [years[i:i + MAX_ATTACHED_ARCHIVES] for i in range(0, len(years), MAX_ATTACHED_ARCHIVES)] or [[]]
+        for i, group in enumerate(groups):
+            accumulate(db, (["main"] if i == 0 else []) + attach_archives(db, group))
+
+    with transaction() as db:
+        for table, (keys, _) in ROLLUP_TABLES.items():
+            db.execute(f"DELETE FROM {table}")
+            db.executemany(
+                f"INSERT INTO {table} ({', '.join(keys)}, total_cents, tax_cents, receipt_count) "
+                f"VALUES ({', '.join('?' * (len(keys) + 3))})",
+                [(*key, *sums) for key, sums in totals[table].items()],
+            )
+
+
+# ================= CHANGE LOG =================
+# Append-only change-data-capture feed. Every insert, update and delete of a
+# receipt appends a row; AUTOINCREMENT keeps seq strictly increasing even
+# after old entries are pruned. A bill ID or owner change is logged as a
+# delete of the old key followed by an update of the new one.
+# consumer_offsets stores the last seq each named consumer has processed.
+CDC_INSERT_SQL = "INSERT INTO receipt_changes (bill_id, owner_id, op) VALUES (new.bill_id, new.owner_id, 'insert');"
+CDC_DELETE_SQL = "INSERT INTO receipt_changes (bill_id, owner_id, op) VALUES (old.bill_id, old.owner_id, 'delete');"
+CDC_UPDATE_SQL = """
+    INSERT INTO receipt_changes (bill_id, owner_id, op)
+    SELECT old.bill_id, old.owner_id, 'delete'
+    WHERE old.bill_id IS NOT new.bill_id OR old.owner_id IS NOT new.owner_id;
+    INSERT INTO receipt_changes (bill_id, owner_id, op) VALUES (new.bill_id, new.owner_id, 'update');
+"""
+CHANGES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS receipt_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        bill_id TEXT NOT NULL,
+        owner_id TEXT NOT NULL,
+        op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+        changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_changes_owner ON receipt_changes(owner_id, seq)",
+    """
+    CREATE TABLE IF NOT EXISTS consumer_offsets (
+        consumer TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    f"CREATE TRIGGER IF NOT EXISTS receipts_cdc_ai AFTER INSERT ON receipts BEGIN {CDC_INSERT_SQL} END",
+    f"CREATE TRIGGER IF NOT EXISTS receipts_cdc_ad AFTER DELETE ON receipts BEGIN {CDC_DELETE_SQL} END",
+    f"CREATE TRIGGER IF NOT EXISTS receipts_cdc_au AFTER UPDATE ON receipts BEGIN {CDC_UPDATE_SQL} END",
+]
+
+
+# ================= RECEIPT IMAGES =================
+# Links receipts to their original uploads in the content-addressed blob
+# store (database/blob_store.py). page numbers the pages of multi-page
+# uploads; several receipts may share one blob. There is deliberately no
+# foreign key: links outlive archiving of the receipt, and the receipt
+# delete functions remove them explicitly.
+IMAGES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS receipt_images (
+        bill_id TEXT NOT NULL,
+        page INTEGER NOT NULL DEFAULT 0,
+        owner_id TEXT NOT NULL DEFAULT '',
+        blob_sha256 TEXT NOT NULL,
+        mime_type TEXT,
+        byte_size INTEGER NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (owner_id, bill_id, page)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_images_blob ON receipt_images(blob_sha256)",
+]
+IMAGE_COLUMNS = "bill_id, page, owner_id, blob_sha256, mime_type, byte_size, created_at"
+
+
+# ================= RAW OCR TEXT =================
+# The Tesseract output each receipt was parsed from, compressed (codec
+# names the compression, currently always 'zlib'). Keeping it lets parser
+# and template fixes be re-applied to existing receipts without re-running
+# OCR (see ocr/reparse.py). Like receipt_images it has no foreign key and
+# is removed by the receipt delete functions.
+OCR_TEXT_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS receipt_ocr_text (
+        bill_id TEXT NOT NULL,
+        owner_id TEXT NOT NULL DEFAULT '',
+        codec TEXT NOT NULL DEFAULT 'zlib',
+        raw BLOB NOT NULL,
+        char_count INTEGER NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (owner_id, bill_id)
     )
-    
-    # --- Optimization: Add Indexes for Search ---
-    db.execute("CREATE INDEX IF NOT EXISTS idx_vendor ON receipts(vendor)")
-    db.execute("CREATE INDEX IF NOT EXISTS idx_date ON receipts(date)")
-    db.execute("CREATE INDEX IF NOT EXISTS idx_category ON receipts(category)")
+    """,
+]
+OCR_TEXT_COLUMNS = "bill_id, owner_id, codec, raw, char_count, created_at"
+
+
+# ================= ARCHIVE PARTITIONS =================
+# Closed years move out of the hot receipts table into one SQLite file per
+# year (archive/receipts_YYYY.db) with the same receipts, items and
+# full-text schema. They are attached to a connection on demand as schema
+# archive_YYYY and queried alongside main (see the partitioned readers in
+# database/queries.py). Rollups keep covering archived receipts, so period
+# totals do not change. Archived receipts can still be edited and deleted:
+# archive files cannot hold triggers on main's tables, so every connection
+# adds TEMP triggers (_archive_triggers) that keep main's rollups and
+# change log in step with the archives it attaches.
+ARCHIVE_DIR = DB_PATH.parent / "archive"
+ARCHIVE_SCHEMA_PREFIX = "archive_"
+# SQLite allows 10 attached databases by default; leave room for temp use
+MAX_ATTACHED_ARCHIVES = 8
+
+
+def archive_path(year: int) -> Path:
+    return ARCHIVE_DIR / f"receipts_{year:04d}.db"
+
+
+def archived_years() -> List[int]:
+    """Years that have an archive file, oldest first."""
+    if not ARCHIVE_DIR.is_dir():
+        return []
+    years = []
+    for path in ARCHIVE_DIR.glob("receipts_*.db"):
+        suffix = path.stem.rsplit("_", 1)[-1]
+        if suffix.isdigit():
+            years.append(int(suffix))
+    return sorted(years)
+
+
+def _archive_triggers(schema: str) -> List[str]:
+    # Inserts into archives only come from archive_receipts, which keeps
+    # the rollups itself and does not log the move
+    return [
+        f"""
+        CREATE TEMP TRIGGER IF NOT EXISTS {schema}_receipts_ad AFTER DELETE ON {schema}.receipts BEGIN
+            {' '.join(_rollup_subtract(t, 'old') for t in ROLLUP_TABLES)}
+            {CDC_DELETE_SQL}
+        END
+        """,
+        f"""
+        CREATE TEMP TRIGGER IF NOT EXISTS {schema}_receipts_au AFTER UPDATE ON {schema}.receipts BEGIN
+            {' '.join(_rollup_subtract(t, 'old') for t in ROLLUP_TABLES)}
+            {' '.join(_rollup_add(t, 'new') for t in ROLLUP_TABLES)}
+            {CDC_UPDATE_SQL}
+        END
+        """,
+    ]
+
+
+def _create_archive(path: Path):
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    try:
+        for statement in [_receipts_schema(), *RECEIPT_INDEXES, *ITEMS_SCHEMA, *FTS_SCHEMA]:
+            conn.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
 
+
+def attach_archives(db, years: Iterable[int], create: bool = False) -> List[str]:
+    """
+    Attaches the archive files of `years` to `db` (if not attached yet) and
+    returns their schema names. Years without a file are skipped unless
+    create=True. Archives not in `years` are detached when the attach limit
+    would be exceeded. Must be called outside a transaction.
+    """
+    wanted = {f"{ARCHIVE_SCHEMA_PREFIX}{year:04d}": year for year in years}
+    attached = [r[1] for r in db.execute("PRAGMA database_list") if r[1].startswith(ARCHIVE_SCHEMA_PREFIX)]
+    schemas = []
+    for schema, year in wanted.items():
+        if schema not in attached:
+            path = archive_path(year)
+            if not path.exists():
+                if not create:
+                    continue
+                _create_archive(path)
+            idle = [s for s in attached if s not in wanted]
+            if len(attached) >= MAX_ATTACHED_ARCHIVES and idle:
+                db.execute(f"DETACH DATABASE {idle[0]}")
+                attached.remove(idle[0])
+            db.execute(f"ATTACH DATABASE ? AS {schema}", (str(path),))
+            for statement in _archive_triggers(schema):
+                db.execute(statement)
+            attached.append(schema)
+        schemas.append(schema)
+    return schemas
+
+
+def archive_receipts(before_year: Optional[int] = None, progress: Optional["ProgressCallback"] = None) -> Dict[int, int]:
+    """
+    Moves receipts (and their line items) dated before `before_year` into
+    per-year archive files. Defaults to keeping the current and previous
+    year hot. Rollup totals are unchanged and the move is not reported as
+    deletes in the change log. Safe to re-run after an interruption.
+    Returns {year: receipts moved}.
+    """
+    progress = progress or _log_progress
+    if before_year is None:
+        before_year = date_type.today().year - 1
+    db = get_db()
+    years = [
+        int(r[0])
+        for r in db.execute(
+            "SELECT DISTINCT substr(date, 1, 4) FROM receipts WHERE date GLOB '[0-9][0-9][0-9][0-9]-*' AND date < ?",
+            (f"{before_year:04d}",),
+        )
+    ]
+
+    receipt_columns = RECEIPT_STORED_COLUMNS
+    item_columns = f"owner_id, {ITEM_STORED_COLUMNS}"
+    moved: Dict[int, int] = {}
+    for done, year in enumerate(sorted(years), 1):
+        (schema,) = attach_archives(db, [year], create=True)
+        in_year = "r.date >= ? AND r.date < ?"
+        bounds = (f"{year:04d}-", f"{year + 1:04d}-")
+        with transaction() as db:
+            last_seq = db.execute("SELECT COALESCE(MAX(seq), 0) FROM receipt_changes").fetchone()[0]
+            db.execute(
+                f"INSERT OR IGNORE INTO {schema}.receipts ({receipt_columns}) "
+                f"SELECT {receipt_columns} FROM main.receipts r WHERE {in_year}",
+                bounds,
+            )
+            db.execute(
+                f"INSERT OR IGNORE INTO {schema}.receipt_items ({item_columns}) "
+                f"SELECT {', '.join('i.' + c for c in item_columns.split(', '))} FROM main.receipt_items i "
+                f"JOIN main.receipts r ON r.owner_id = i.owner_id AND r.bill_id = i.bill_id WHERE {in_year}",
+                bounds,
+            )
+            # Pre-add the moved rows to the rollups; the delete triggers then net them out
+            for table, (keys, exprs) in ROLLUP_TABLES.items():
+                group = ", ".join(e.format(r="r") for e in exprs)
+                db.execute(
+                    f"""
+                    INSERT INTO main.{table} ({', '.join(keys)}, total_cents, tax_cents, receipt_count)
+                    SELECT {group}, SUM(r.amount_cents), SUM(r.tax_cents), COUNT(*)
+                    FROM main.receipts r WHERE {in_year} GROUP BY {group}
+                    ON CONFLICT({', '.join(keys)}) DO UPDATE SET
+                        total_cents = total_cents + excluded.total_cents,
+                        tax_cents = tax_cents + excluded.tax_cents,
+                        receipt_count = receipt_count + excluded.receipt_count
+                    """,
+                    bounds,
+                )
+            cur = db.execute("DELETE FROM main.receipts WHERE date >= ? AND date < ?", bounds)
+            moved[year] = cur.rowcount
+            db.execute("DELETE FROM receipt_changes WHERE seq > ?", (last_seq,))
+
+        # Item names go into the archive's full-text details
+        conn = sqlite3.connect(archive_path(year))
+        try:
+            rebuild_search_index(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        progress(f"archive {year}", done, len(years))
+
+    return moved
+
+
+# ================= SCHEMA MIGRATIONS =================
+# Ordered, idempotent steps keyed on PRAGMA user_version. Each step runs in
+# its own transaction together with the version bump, so an interrupted
+# upgrade resumes at the first unfinished step.
+ProgressCallback = Callable[[str, int, int], None]
+
+
+def _log_progress(step: str, done: int, total: int):
+    logger.info("Migration '%s': %d/%d", step, done, total)
+
+
+def _migration_base_tables(db, progress: ProgressCallback):
+    db.execute(_receipts_schema())
     db.execute(
         """
         CREATE TABLE IF NOT EXISTS users (
@@ -54,17 +760,194 @@ def init_db():
         )
         """
     )
-
-    # Migration: Add subtotal column if it doesn't exist
-    try:
+    # Legacy tables may predate subtotal/category/owner_id
+    columns = _receipt_columns(db)
+    if "subtotal" not in columns:
         db.execute("ALTER TABLE receipts ADD COLUMN subtotal REAL DEFAULT 0.0")
-    except sqlite3.OperationalError:
-        pass
-
-    # Migration: Add category column if it doesn't exist
-    try:
+    if "category" not in columns:
         db.execute("ALTER TABLE receipts ADD COLUMN category TEXT DEFAULT 'Uncategorized'")
-    except sqlite3.OperationalError:
-        pass
+    _add_owner_column(db)
+
+
+def _migration_receipt_indexes(db, progress: ProgressCallback):
+    for statement in RECEIPT_INDEXES:
+        db.execute(statement)
+
+
+def _migration_line_items(db, progress: ProgressCallback):
+    for statement in ITEMS_SCHEMA:
+        db.execute(statement)
+
+
+def _migration_search_index(db, progress: ProgressCallback):
+    # Items created at version 4 may still be keyed by bill_id alone
+    _rekey_receipts(db)
+    for statement in FTS_SCHEMA:
+        db.execute(statement)
+    rebuild_search_index(db)
+
+
+def _migration_rollups(db, progress: ProgressCallback):
+    for statement in ROLLUP_SCHEMA:
+        db.execute(statement)
+    rebuild_rollups(db)
+
+
+def _migration_receipt_owners(db, progress: ProgressCallback):
+    # Existing receipts land in the unowned ('') partition
+    _add_owner_column(db)
+    _migration_receipt_indexes(db, progress)
+    # Rollups are re-keyed by owner
+    for trigger in ROLLUP_TRIGGERS:
+        db.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    for table in ROLLUP_TABLES:
+        db.execute(f"DROP TABLE IF EXISTS {table}")
+    _migration_rollups(db, progress)
+
+
+def _migration_change_log(db, progress: ProgressCallback):
+    for statement in CHANGES_SCHEMA:
+        db.execute(statement)
+    # Seed the log with the current receipts so a consumer starting at
+    # seq 0 sees a full snapshot followed by every later change
+    db.execute(
+        """
+        INSERT INTO receipt_changes (bill_id, owner_id, op)
+        SELECT bill_id, owner_id, 'insert' FROM receipts ORDER BY rowid
+        """
+    )
+
+
+def _migration_receipt_images(db, progress: ProgressCallback):
+    for statement in IMAGES_SCHEMA:
+        db.execute(statement)
+
+
+def _migration_ocr_text(db, progress: ProgressCallback):
+    for statement in OCR_TEXT_SCHEMA:
+        db.execute(statement)
+
+
+def _rekey_receipts(db):
+    """
+    Rebuilds a receipts table keyed by bill_id alone, and its line items,
+    keyed by (owner_id, bill_id). Rowids are preserved so the full-text
+    index stays aligned; the table's triggers are re-created as they were.
+    Works on the main database and on archive files.
+    """
+    if _primary_key(db, "receipts") == ["owner_id", "bill_id"]:
+        return
+
+    triggers = [
+        r[0] for r in db.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'receipts'")
+    ]
+    # Items go first: dropping receipts with items attached would cascade
+    db.execute(
+        f"CREATE TEMP TABLE items_rekey AS SELECT r.owner_id AS owner_id, "
+        f"{', '.join('i.' + c for c in ITEM_STORED_COLUMNS.split(', '))} "
+        "FROM receipt_items i JOIN receipts r ON r.bill_id = i.bill_id"
+    )
+    db.execute("DROP TABLE receipt_items")
+    db.execute("DROP TABLE IF EXISTS receipts_migrating")
+    db.execute(_receipts_schema("receipts_migrating"))
+    db.execute(
+        f"INSERT INTO receipts_migrating (rowid, {RECEIPT_STORED_COLUMNS}) "
+        f"SELECT rowid, {RECEIPT_STORED_COLUMNS} FROM receipts"
+    )
+    db.execute("DROP TABLE receipts")
+    db.execute("ALTER TABLE receipts_migrating RENAME TO receipts")
+    for statement in [*RECEIPT_INDEXES, *ITEMS_SCHEMA, *triggers]:
+        db.execute(statement)
+    db.execute(
+        f"INSERT INTO receipt_items (owner_id, {ITEM_STORED_COLUMNS}) "
+        f"SELECT owner_id, {ITEM_STORED_COLUMNS} FROM temp.items_rekey"
+    )
+    db.execute("DROP TABLE temp.items_rekey")
+
+
+def _rekey_table(db, table: str, columns: str, schema: List[str]):
+    """Rebuilds a per-receipt side table with `schema` unless its key already leads with owner_id."""
+    if _primary_key(db, table)[:1] == ["owner_id"]:
+        return
+    db.execute(f"CREATE TEMP TABLE {table}_rekey AS SELECT {columns} FROM {table}")
+    db.execute(f"DROP TABLE {table}")
+    for statement in schema:
+        db.execute(statement)
+    db.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM temp.{table}_rekey")
+    db.execute(f"DROP TABLE temp.{table}_rekey")
+
+
+def _migration_owner_keys(db, progress: ProgressCallback):
+    # Bill IDs become unique per owner: receipts, items, images and OCR
+    # text are re-keyed by (owner_id, bill_id), archives included
+    _rekey_receipts(db)
+    _rekey_table(db, "receipt_images", IMAGE_COLUMNS, IMAGES_SCHEMA)
+    _rekey_table(db, "receipt_ocr_text", OCR_TEXT_COLUMNS, OCR_TEXT_SCHEMA)
+    years = archived_years()
+    for done, year in enumerate(years, 1):
+        conn = sqlite3.connect(archive_path(year), isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            _rekey_receipts(conn)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        progress(f"archive {year}", done, len(years))
+
+
+def _migration_month_rollups(db, progress: ProgressCallback):
+    # Months were keyed on the first 7 characters of the date text, so
+    # receipts with unparseable dates made up months of their own
+    for trigger in ROLLUP_TRIGGERS:
+        db.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    for table in ROLLUP_TABLES:
+        db.execute(f"DROP TABLE IF EXISTS {table}")
+    _migration_rollups(db, progress)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Any, ProgressCallback], None]]] = [
+    (1, "base tables", _migration_base_tables),
+    (2, "integer cents and ISO dates", _migrate_receipts_to_cents),
+    (3, "receipt indexes", _migration_receipt_indexes),
+    (4, "line items", _migration_line_items),
+    (5, "full-text search index", _migration_search_index),
+    (6, "spending rollups", _migration_rollups),
+    (7, "receipt owners", _migration_receipt_owners),
+    (8, "change log", _migration_change_log),
+    (9, "receipt images", _migration_receipt_images),
+    (10, "raw OCR text", _migration_ocr_text),
+    (11, "per-owner bill IDs", _migration_owner_keys),
+    (12, "month rollups by date_ord", _migration_month_rollups),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(db=None) -> int:
+    db = db or get_db()
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(progress: Optional[ProgressCallback] = None) -> int:
+    """
+    Applies every migration newer than the database's user_version.
+    `progress(step, done, total)` receives batch progress of data migrations
+    and one call per finished step (defaults to logging).
+    Returns the resulting schema version.
+    """
+    progress = progress or _log_progress
+    current = schema_version()
+    if current >= SCHEMA_VERSION:
+        return current
+
+    for version, name, step in MIGRATIONS:
+        if version <= current:
+            continue
+        with transaction() as db:
+            # Another process may have migrated while we waited for the write lock
+            if schema_version(db) >= version:
+                continue
+            step(db, progress)
+            db.execute(f"PRAGMA user_version = {version}")
+        progress(name, version, SCHEMA_VERSION)
 
-    db.commit()
\ No newline at end of file
+    return SCHEMA_VERSION
@@ -0,0 +1,192 @@
+"""
+Persistent cache of receipt extraction results.
+
+Re-uploading a receipt (or re-running the upload page) would otherwise
+repeat the whole Tesseract or Gemini extraction. Results are stored in a
+small SQLite file next to the receipts database, keyed by the SHA-256 of
+the uploaded bytes plus an engine string that changes whenever the
+extraction would produce a different result (engine and its version,
+preprocessing settings, parser or prompt version). The cache is bounded
+by MAX_CACHE_BYTES; the least recently used entries are evicted first.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from database.db import DB_PATH
+
+CACHE_PATH = DB_PATH.parent / "extraction_cache.db"
+MAX_CACHE_BYTES = 64 * 1024 * 1024     # compressed payload bytes
+EVICT_TO = 0.9                         # evict down to this share of the bound
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS extraction_cache (
+    cache_key TEXT PRIMARY KEY,
+    engine TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_extraction_cache_last_used ON extraction_cache(last_used);
+CREATE TABLE IF NOT EXISTS extraction_cache_stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+Extraction = Tuple[Dict[str, Any], List[Dict[str, Any]], Optional[str]]
+
+_local = threading.local()
+
+
+def _get_conn() -> sqlite3.Connection:
+    """One connection per thread (and per process, for the batch OCR workers)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        Path(CACHE_PATH).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(CACHE_PATH, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.executescript(CACHE_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def cache_key(content: bytes, engine: str) -> str:
+    sha = hashlib.sha256(content).hexdigest()
+    return f"{sha}:{engine}"
+
+
+def _bump(conn: sqlite3.Connection, name: str, by: int = 1):
+    conn.execute(
+        "INSERT INTO extraction_cache_stats (name, value) VALUES (?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+        (name, by)
+    )
+
+
+# ================= READ / WRITE =================
+def get_cached(content: bytes, engine: str) -> Optional[Extraction]:
+    """Returns the cached (data, items, text) for this upload and engine, or None."""
+    conn = _get_conn()
+    key = cache_key(content, engine)
+    row = conn.execute("SELECT payload FROM extraction_cache WHERE cache_key = ?", (key,)).fetchone()
+    if row is None:
+        _bump(conn, "misses")
+        return None
+    conn.execute("UPDATE extraction_cache SET last_used = ? WHERE cache_key = ?", (time.time(), key))
+    _bump(conn, "hits")
+    entry = json.loads(zlib.decompress(row[0]))
+    return entry["data"], entry["items"], entry["text"]
+
+
+def put_cached(content: bytes, engine: str, data: Dict[str, Any], items: List[Dict[str, Any]], text: Optional[str] = None):
+    """Stores an extraction result, then evicts least recently used entries over MAX_CACHE_BYTES."""
+    payload = zlib.compress(json.dumps({"data": data, "items": items, "text": text}, default=str).encode("utf-8"))
+    now = time.time()
+    conn = _get_conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO extraction_cache (cache_key, engine, payload, size, created_at, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (cache_key(content, engine), engine, payload, len(payload), now, now)
+        )
+        _evict(conn)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _evict(conn: sqlite3.Connection):
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM extraction_cache").fetchone()[0]
+    if total <= MAX_CACHE_BYTES:
+        return
+    excess = total - int(MAX_CACHE_BYTES * EVICT_TO)
+    # Oldest first until enough bytes are freed
+    victims = []
+    for key, size in conn.execute("SELECT cache_key, size FROM extraction_cache ORDER BY last_used"):
+        victims.append((key,))
+        excess -= size
+        if excess <= 0:
+            break
+    conn.executemany("DELETE FROM extraction_cache WHERE cache_key = ?", victims)
+    _bump(conn, "evictions", len(victims))
+
+
+def cached_extraction(content: bytes, engine: str, extract: Callable[[], Optional[Extraction]]) -> Tuple[Optional[Extraction], bool]:
+    """
+    Returns (result, hit): the cached result for `content` under `engine`,
+    or else extract() stored for next time. A None result (failed
+    extraction) is not cached.
+    """
+    cached = get_cached(content, engine)
+    if cached is not None:
+        return cached, True
+    result = extract()
+    if result is not None:
+        put_cached(content, engine, *result)
+    return result, False
+
+
+# ================= MAINTENANCE =================
+def cache_stats() -> Dict[str, Any]:
+    """Entry count, stored bytes and hit/miss/eviction counters since the cache was created."""
+    conn = _get_conn()
+    entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extraction_cache").fetchone()
+    counters = dict(conn.execute("SELECT name, value FROM extraction_cache_stats").fetchall())
+    hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+    return {
+        "entries": entries,
+        "bytes": size,
+        "max_bytes": MAX_CACHE_BYTES,
+        "hits": hits,
+        "misses": misses,
+        "evictions": counters.get("evictions", 0),
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+    }
+
+
+def clear_cache(engine: Optional[str] = None) -> int:
+    """Drops all entries (or those of one engine string); counters are kept."""
+    conn = _get_conn()
+    if engine is None:
+        return conn.execute("DELETE FROM extraction_cache").rowcount
+    return conn.execute("DELETE FROM extraction_cache WHERE engine = ?", (engine,)).rowcount
+
+
+# ================= ENGINE STRINGS =================
+@lru_cache(maxsize=None)
+def _tesseract_version() -> str:
+    import pytesseract  # type: ignore
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return "unknown"
+
+
+def tesseract_engine() -> str:
+    """
+    Engine string for the Tesseract + parse_receipt path: the Tesseract
+    version, a hash of the preprocessing settings, PARSER_VERSION and the
+    loaded category keywords and vendor templates.
+    """
+    from ocr.category_classifier import get_category_matcher
+    from ocr.image_preprocessing import DEFAULT_CONFIG
+    from ocr.templates import get_template_registry
+    from ocr.text_parser import PARSER_VERSION
+    preprocess = hashlib.sha256(repr(DEFAULT_CONFIG).encode()).hexdigest()[:8]
+    categories = get_category_matcher().digest[:8]
+    templates = get_template_registry().digest[:8]
+    return (
+        f"tesseract-{_tesseract_version()}/pre-{preprocess}/parser-{PARSER_VERSION}"
+        f"/cat-{categories}/tpl-{templates}"
+    )
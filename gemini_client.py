@@ -1,7 +1,13 @@
 import json  # Standard IDE sync complete
+import hashlib
 import google.generativeai as genai  # type: ignore
 from ai.prompts import RECEIPT_EXTRACTION_PROMPT, DATA_ANALYSIS_PROMPT, CHAT_WITH_DATA_PROMPT  # type: ignore
 
+# Extraction cache engine string; changes with the prompt (and with
+# EXTRACTION_VERSION, bumped when extract_receipt's post-processing changes)
+EXTRACTION_VERSION = 1
+EXTRACTION_ENGINE = f"gemini-v{EXTRACTION_VERSION}/prompt-{hashlib.sha256(RECEIPT_EXTRACTION_PROMPT.encode()).hexdigest()[:8]}"
+
 class GeminiClient:
     """
     Client for interacting with Google Gemini 1.5 Flash for receipt analysis.
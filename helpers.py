@@ -83,4 +83,32 @@ def normalize_items(items):
     if isinstance(items, list):
         return [i for i in items if isinstance(i, dict)]
 
-    return []
\ No newline at end of file
+    return []
+
+
+# -------------------------------------------------
+# KEYWORD TRIE REGEX
+# -------------------------------------------------
+
+def keyword_trie_pattern(words) -> str:
+    """
+    Regex source matching any of `words` literally, factored on common
+    prefixes so each text position is tested once per character instead
+    of once per word. Greedy: at a position it matches the longest word.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node) -> str:
+        if "" in node and len(node) == 1:
+            return ""
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # A word may end here: the rest is optional
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
\ No newline at end of file
@@ -20,8 +20,8 @@ def generate_ai_insights(df, lang="en") -> str:
         total_spend = df["amount"].sum()
         transaction_count = len(df)
         
-        top_vendor = df.groupby("vendor")["amount"].sum().idxmax() if not df.empty else "N/A"
-        top_category = df.groupby("category")["amount"].sum().idxmax() if "category" in df.columns else "N/A"
+        top_vendor = df.groupby("vendor", observed=True)["amount"].sum().idxmax() if not df.empty else "N/A"
+        top_category = df.groupby("category", observed=True)["amount"].sum().idxmax() if "category" in df.columns else "N/A"
         
         # Get last 5 transactions for context
         recent_tx = df.sort_values("date", ascending=False).head(5)[["date", "vendor", "amount", "category"]].to_string(index=False)
@@ -1,4 +1,5 @@
 from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from typing import List, Optional
 from pydantic import BaseModel
 import sys
@@ -7,7 +8,10 @@ import os
 # Add project root to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from database.queries import fetch_all_receipts, search_receipts, get_receipt_by_id
+from database.db import init_db
+from database.queries import get_receipt_by_id, fetch_receipts_page, iter_receipts, count_receipts, search_receipts_fulltext
+from database.queries import changes_since, pending_changes, commit_consumer_offset
+from ui.auth_page import verify_user
 from datetime import datetime
 import uvicorn
 
@@ -17,6 +21,23 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Apply pending schema migrations (a single PRAGMA read when current)
+init_db()
+
+# --- Auth ---
+# HTTP Basic with the app's email/password accounts. The email is the
+# owner every query is scoped to, so callers only ever see their own receipts.
+security = HTTPBasic()
+
+def current_owner(credentials: HTTPBasicCredentials = Depends(security)) -> str:
+    if not verify_user(credentials.username, credentials.password):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid email or password",
+            headers={"WWW-Authenticate": "Basic"}
+        )
+    return credentials.username
+
 # --- Schemas ---
 class ReceiptBase(BaseModel):
     bill_id: str
@@ -27,6 +48,13 @@ class ReceiptBase(BaseModel):
     subtotal: float
     category: str
 
+class ReceiptChange(BaseModel):
+    seq: int
+    op: str
+    bill_id: str
+    changed_at: str
+    receipt: Optional[ReceiptBase] = None
+
 class ERPExportResponse(BaseModel):
     erp_system: str
     sync_status: str
@@ -43,36 +71,89 @@ def read_root():
 
 @app.get("/api/v1/receipts", response_model=List[ReceiptBase])
 def get_receipts(
+    q: Optional[str] = None,
     vendor: Optional[str] = None,
     category: Optional[str] = None,
     start_date: Optional[str] = None,
-    end_date: Optional[str] = None
+    end_date: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    after_date: Optional[str] = None,
+    after_bill_id: Optional[str] = None,
+    owner: str = Depends(current_owner)
 ):
-    """Fetch receipts for external systems (ERP)"""
+    """
+    Fetch receipts for external systems (ERP).
+    Keyset-paginated: pass the date and bill_id of the last receipt
+    as after_date / after_bill_id to get the next page.
+    `q` runs a ranked full-text prefix search (bill ID, vendor, category)
+    and returns the top `limit` matches instead.
+    """
+    after = (after_date, after_bill_id) if after_date and after_bill_id else None
     try:
-        if any([vendor, category, start_date, end_date]):
-            results = search_receipts(vendor=vendor, category=category, start_date=start_date, end_date=end_date)
-        else:
-            results = fetch_all_receipts()
-        return results
+        if q:
+            return search_receipts_fulltext(
+                q,
+                limit=limit,
+                owner=owner,
+                vendor=vendor,
+                category=category,
+                start_date=start_date,
+                end_date=end_date
+            )
+        return fetch_receipts_page(
+            after=after,
+            limit=limit,
+            owner=owner,
+            vendor=vendor,
+            category=category,
+            start_date=start_date,
+            end_date=end_date
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/v1/receipts/{bill_id}", response_model=ReceiptBase)
-def get_receipt(bill_id: str):
+def get_receipt(bill_id: str, owner: str = Depends(current_owner)):
     """Focus on single record for detailed ERP mapping"""
-    receipt = get_receipt_by_id(bill_id)
+    receipt = get_receipt_by_id(bill_id, owner=owner)
     if not receipt:
         raise HTTPException(status_code=404, detail="Receipt not found")
     return receipt
 
+@app.get("/api/v1/changes", response_model=List[ReceiptChange])
+def get_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=5000),
+    owner: str = Depends(current_owner)
+):
+    """
+    Change feed for incremental consumers: inserts, updates and deletes
+    after sequence number `since`, oldest first. Pass the last `seq` back
+    as `since` to continue.
+    """
+    return changes_since(since, limit=limit, owner=owner)
+
 @app.post("/api/v1/erp/sync", response_model=ERPExportResponse)
-def sync_to_erp(system: str = "SAP"):
+def sync_to_erp(system: str = "SAP", incremental: bool = False, owner: str = Depends(current_owner)):
     """
     Simulated ERP Synchronization Endpoint.
     Formats data for common ERP schemas (SAP, Oracle, NetSuite).
+    With incremental=true only receipts changed since this system's last
+    incremental sync are exported, and the sync position is saved.
     """
-    receipts = fetch_all_receipts()
+    if incremental:
+        consumer = f"erp:{system}:{owner}"
+        changes = pending_changes(consumer, limit=5000, owner=owner)
+        # Latest state per receipt; deleted receipts have nothing to export
+        latest = {c["bill_id"]: c["receipt"] for c in changes}
+        receipts = [r for r in latest.values() if r is not None]
+        total_records = len(latest)
+        if changes:
+            commit_consumer_offset(consumer, changes[-1]["seq"])
+        receipts = receipts[:5]
+    else:
+        total_records = count_receipts(owner=owner)
+        receipts = list(iter_receipts(limit=5, owner=owner))
     
     # Simulate mapping to ERP JSON structure
     if system == "ERPNext":
@@ -88,7 +169,7 @@ def sync_to_erp(system: str = "SAP"):
                     "rate": r["amount"],
                     "amount": r["amount"],
                     "description": f"Receipt {r['bill_id']} from {r['vendor']}"
-                } for r in receipts[:5]
+                } for r in receipts
             ]
         }
     else:
@@ -106,7 +187,7 @@ def sync_to_erp(system: str = "SAP"):
                     "GrossAmount": r["amount"],
                     "TaxAmount": r["tax"],
                     "Currency": "INR"
-                } for r in receipts[:5] # Sample first 5
+                } for r in receipts # Sample first 5
             ]
         }
     
@@ -114,7 +195,7 @@ def sync_to_erp(system: str = "SAP"):
         "erp_system": system,
         "sync_status": "SUCCESS",
         "sync_time": datetime.now().isoformat(),
-        "exported_records": len(receipts),
+        "exported_records": total_records,
         "payload_preview": erp_payload
     }
 
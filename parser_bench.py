@@ -0,0 +1,132 @@
+"""
+Microbenchmark for ocr/text_parser.py.
+
+Times parse_receipt over a corpus of OCR texts: synthetic receipts in
+the shapes Tesseract produces (headers, bill IDs, item lines, quantity
+lines, tax and total lines, some noise), or the stored OCR text of real
+receipts with --from-db. With --against, a second parser module (for
+example an older text_parser.py from git) is timed on the same corpus
+and every output is compared, so a parser optimization can be shown to
+be both faster and unchanged.
+
+    python -m ocr.parser_bench
+    git show HEAD~1:text_parser.py > /tmp/old_parser.py
+    python -m ocr.parser_bench --against /tmp/old_parser.py
+
+Exits with status 1 if --against finds a different output.
+"""
+import argparse
+import importlib.util
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Any, Callable, List, Optional
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+VENDORS = ["FRESH MART", "Apollo Pharmacy", "Cafe Coffee Day", "Zudio Trends", "HP Fuel Station", "City Kitchen", "Walmart", "Target"]
+ITEMS = ["Milk 1L", "Brown Bread", "Cappuccino", "Paracetamol 500", "T-Shirt", "Petrol", "Basmati Rice 5kg", "Eggs (12)", "Orange Juice"]
+NOISE = ["Thank you! Visit again", "GSTIN 29ABCDE1234F1Z5", "Ph: 080-2345 6789", "*** CUSTOMER COPY ***", "Cashier: 04  Till: 2"]
+
+
+# ================= CORPUS =================
+def synthetic_texts(count: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    texts = []
+    for i in range(count):
+        lines = [rng.choice(VENDORS), rng.choice(["TAX INVOICE", "Cash Receipt", "Original"])]
+        lines.append(rng.choice([f"Invoice No: INV-{i:06d}", f"Receipt # {rng.randint(10000, 99999)}", f"Bill No. {i}"]))
+        lines.append(rng.choice([f"Date: {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024", f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"]))
+        subtotal = 0.0
+        for _ in range(rng.randint(2, 30)):
+            price = round(rng.uniform(5, 900), 2)
+            subtotal += price
+            if rng.random() < 0.2:
+                lines.append(f"{rng.randint(2, 5)} x {price / 2:.2f}")
+            lines.append(f"{rng.choice(ITEMS)}  {price:.2f}")
+        tax = round(subtotal * 0.09, 2)
+        lines += [f"Sub Total {subtotal:.2f}", f"CGST 9% {tax:.2f}", f"SGST 9% {tax:.2f}", f"TOTAL {subtotal + 2 * tax:,.2f}"]
+        lines += [rng.choice(["Cash", "Card **** 4821"]) + f" {subtotal + 2 * tax:.2f}", rng.choice(NOISE), rng.choice(NOISE)]
+        texts.append("\n".join(lines))
+    return texts
+
+
+def stored_texts(limit: int) -> List[str]:
+    from database.queries import iter_ocr_text_batches
+    texts: List[str] = []
+    for batch in iter_ocr_text_batches():
+        texts.extend(row["text"] for row in batch)
+        if len(texts) >= limit:
+            break
+    return texts[:limit]
+
+
+def load_parser(path: str) -> Callable[[str], Any]:
+    """parse_receipt from a parser module file outside the package."""
+    spec = importlib.util.spec_from_file_location("reference_text_parser", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.parse_receipt
+
+
+# ================= TIMING =================
+def time_parser(parse: Callable[[str], Any], texts: List[str], rounds: int) -> float:
+    """Median over `rounds` passes of the corpus, in microseconds per text."""
+    for text in texts[:100]:
+        parse(text)
+    per_text = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for text in texts:
+            parse(text)
+        per_text.append((time.perf_counter() - started) * 1e6 / len(texts))
+    return statistics.median(per_text)
+
+
+def differences(parse: Callable[[str], Any], reference: Callable[[str], Any], texts: List[str]) -> List[int]:
+    """Indexes of texts the two parsers disagree on (same seed for generated bill IDs)."""
+    found = []
+    for index, text in enumerate(texts):
+        random.seed(index)
+        ours = parse(text)
+        random.seed(index)
+        if ours != reference(text):
+            found.append(index)
+    return found
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Microbenchmark for parse_receipt")
+    parser.add_argument("--count", type=int, default=5000, help="corpus size")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--from-db", action="store_true", help="use stored OCR text instead of synthetic receipts")
+    parser.add_argument("--against", help="path of another text_parser.py to compare with")
+    args = parser.parse_args(argv)
+
+    from ocr.text_parser import parse_receipt
+    texts = stored_texts(args.count) if args.from_db else synthetic_texts(args.count)
+    if not texts:
+        print("no OCR texts to parse")
+        return 1
+    lines = sum(t.count("\n") + 1 for t in texts)
+    print(f"corpus: {len(texts):,} texts, {lines / len(texts):.1f} lines on average")
+
+    current = time_parser(parse_receipt, texts, args.rounds)
+    print(f"  current    {current:9.1f} us/text  {1e6 / current:10,.0f} texts/s")
+    if not args.against:
+        return 0
+
+    reference = load_parser(args.against)
+    before = time_parser(reference, texts, args.rounds)
+    print(f"  reference  {before:9.1f} us/text  {1e6 / before:10,.0f} texts/s")
+    print(f"  speedup    {before / current:9.2f}x")
+    mismatched = differences(parse_receipt, reference, texts)
+    for index in mismatched[:10]:
+        print(f"  DIFFERENT  text #{index}")
+    return 1 if mismatched else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
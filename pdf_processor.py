@@ -1,20 +1,127 @@
-import logging
+"""
+PDF rasterization for OCR.
+
+Pages are rendered one at a time with pdftoppm (pdf2image) from a single
+temp copy of the PDF, on a small thread pool that stays at most
+RENDER_AHEAD pages ahead of the consumer. OCR of page 1 therefore starts
+while later pages are still rendering, and peak memory is bounded by a
+few pages regardless of the document length.
+"""
 import os
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional
+
+from config.config import IMAGE_DPI, GRAYSCALE, POPPLER_PATH  # type: ignore
+
+# Pages rendered ahead of the page being consumed (also the render threads)
+RENDER_AHEAD = 2
+# Joins page texts; Tesseract's own page separator
+PAGE_BREAK = "\f"
+
+
+def _poppler_path() -> Optional[str]:
+    return POPPLER_PATH if POPPLER_PATH and os.path.isdir(POPPLER_PATH) else None
+
+
+@contextmanager
+def _pdf_file(pdf_bytes: bytes) -> Iterator[str]:
+    """The PDF written once to a temp file, so each page render reads it from disk."""
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+        yield path
+    finally:
+        os.unlink(path)
+
+
+def _page_count(path: str) -> int:
+    from pdf2image import pdfinfo_from_path  # type: ignore
+    return int(pdfinfo_from_path(path, poppler_path=_poppler_path())["Pages"])
+
+
+def _render_page(path: str, page: int, dpi: int, grayscale: bool) -> Any:
+    from pdf2image import convert_from_path  # type: ignore
+    (image,) = convert_from_path(
+        path, dpi=dpi, first_page=page, last_page=page, grayscale=grayscale, poppler_path=_poppler_path()
+    )
+    return image
+
+
+def pdf_page_count(pdf_bytes: bytes) -> int:
+    with _pdf_file(pdf_bytes) as path:
+        return _page_count(path)
+
+
+def iter_pdf_pages(
+    pdf_bytes: bytes,
+    dpi: int = IMAGE_DPI,
+    grayscale: bool = GRAYSCALE,
+    render_ahead: int = RENDER_AHEAD,
+    max_pages: Optional[int] = None
+) -> Iterator[Any]:
+    """
+    Yields the pages of a PDF as PIL images, in order. At most
+    `render_ahead` pages are rendered (and held) beyond the one yielded.
+    """
+    with _pdf_file(pdf_bytes) as path:
+        count = _page_count(path)
+        if max_pages is not None:
+            count = min(count, max_pages)
+        pages = iter(range(1, count + 1))
+        with ThreadPoolExecutor(max_workers=max(1, render_ahead)) as pool:
+            pending: deque = deque()
+            try:
+                for page in pages:
+                    pending.append(pool.submit(_render_page, path, page, dpi, grayscale))
+                    if len(pending) > render_ahead:
+                        break
+                while pending:
+                    image = pending.popleft().result()
+                    next_page = next(pages, None)
+                    if next_page is not None:
+                        pending.append(pool.submit(_render_page, path, next_page, dpi, grayscale))
+                    yield image
+                    del image
+            finally:
+                # Consumer stopped early: don't render pages nobody will read
+                for future in pending:
+                    future.cancel()
 
-LOG_DIR = "logs"
-os.makedirs(LOG_DIR, exist_ok=True)
 
-LOG_FILE = os.path.join(LOG_DIR, "app.log")
+def pdf_first_page(pdf_bytes: bytes, dpi: int = IMAGE_DPI) -> Any:
+    """The first page only (previews, thumbnails, single-image extractors)."""
+    for image in iter_pdf_pages(pdf_bytes, dpi=dpi, grayscale=False, render_ahead=1, max_pages=1):
+        return image
+    raise ValueError("PDF has no pages")
 
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(message)s"
-)
 
-def log_info(message: str):
-    logging.info(message)
+def pdf_to_images(pdf_bytes: bytes, dpi: int = IMAGE_DPI, max_pages: Optional[int] = None) -> List[Any]:
+    """
+    Every page as a list. Holds all pages in memory at once; prefer
+    iter_pdf_pages() or ocr_pdf() for anything but short documents.
+    """
+    return list(iter_pdf_pages(pdf_bytes, dpi=dpi, grayscale=False, max_pages=max_pages))
 
 
-def log_error(message: str):
-    logging.error(message)
\ No newline at end of file
+def ocr_pdf(
+    pdf_bytes: bytes,
+    ocr_page: Callable[[Any], str],
+    on_page: Optional[Callable[[int, Any], None]] = None,
+    dpi: int = IMAGE_DPI
+) -> str:
+    """
+    OCRs every page with `ocr_page(image)` while the following pages render,
+    and returns the page texts joined with PAGE_BREAK, so a multi-page
+    invoice is parsed as one receipt. `on_page(page_number, image)` is
+    called before each page is OCRed (e.g. to keep page 1 as a preview).
+    """
+    texts = []
+    for number, image in enumerate(iter_pdf_pages(pdf_bytes, dpi=dpi), 1):
+        if on_page:
+            on_page(number, image)
+        texts.append(ocr_page(image))
+    return PAGE_BREAK.join(texts)
@@ -1,154 +1,907 @@
-from database.db import get_db
-from typing import List, Dict, Any, Optional
+from database.db import get_db, transaction, FINGERPRINT_SQL, FTS_DETAILS_SQL, to_cents, iso_date, date_ordinal
+from database.db import archived_years, attach_archives, archive_path, ARCHIVE_SCHEMA_PREFIX, MAX_ATTACHED_ARCHIVES
+from database.blob_store import put_blob, make_thumbnail, blob_path, thumbnail_path, remove_unreferenced_blobs
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+import heapq
+import itertools
+import logging
+import zlib
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# Stored columns written on insert (money in integer cents)
+RECEIPT_COLUMNS = (
+    "bill_id", "vendor", "date", "date_ord", "amount_cents", "tax_cents", "subtotal_cents", "category", "owner_id"
+)
+REQUIRED_FIELDS = ("bill_id", "vendor", "date", "amount", "tax")
+
+def _checked_date(value: Any) -> str:
+    """ISO form of a receipt date; ValueError when it is not a real date."""
+    if date_ordinal(value) is None:
+        raise ValueError(f"Invalid date: {value!r} (expected YYYY-MM-DD)")
+    return iso_date(value)
+
+
+# Public receipt keys -> stored (column, value converter) pairs, for updates
+UPDATABLE_FIELDS = {
+    "vendor": (("vendor", lambda v: str(v).strip()),),
+    "date": (("date", _checked_date), ("date_ord", date_ordinal)),
+    "amount": (("amount_cents", to_cents),),
+    "tax": (("tax_cents", to_cents),),
+    "subtotal": (("subtotal_cents", to_cents),),
+    "category": (("category", str),),
+}
+
+# Bound parameters per IN (...) chunk, well under SQLite's variable limit
+SQL_CHUNK_SIZE = 500
+
+
+def _chunks(values: List[Any], size: int = SQL_CHUNK_SIZE):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+# ================= OWNER SCOPING =================
+# Every function takes `owner` (the signed-in user's email). Readers and
+# writers given an owner only touch that user's receipts; owner=None reads
+# across all users and writes to the unowned ('') partition. Receipts are
+# keyed by (owner, bill_id): bill IDs only need to be unique per owner.
+def _owner_clause(owner: Optional[str], column: str = "owner_id") -> Tuple[List[str], List[Any]]:
+    if owner is None:
+        return [], []
+    return [f"{column} = ?"], [owner]
+
+
+def _write_owner_clause(owner: Optional[str]) -> Tuple[List[str], List[Any]]:
+    # Updates and deletes never span owners: owner=None means unowned receipts
+    return _owner_clause(owner or "")
+
+
+def _receipt_row(data: Dict[str, Any], owner: Optional[str] = None) -> Tuple[Any, ...]:
+    """
+    Validates a receipt dict and returns it as an INSERT parameter tuple.
+    Raises ValueError on missing or non-numeric fields.
+    """
+    missing = [f for f in REQUIRED_FIELDS if data.get(f) in (None, "")]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+    try:
+        amount = to_cents(data["amount"])
+        tax = to_cents(data["tax"])
+        subtotal = to_cents(data.get("subtotal") or 0)
+    except ValueError:
+        raise ValueError("Amount, tax and subtotal must be numeric")
+
+    return (
+        str(data["bill_id"]).strip(),
+        str(data["vendor"]).strip(),
+        _checked_date(data["date"]),
+        date_ordinal(data["date"]),
+        amount,
+        tax,
+        subtotal,
+        data.get("category") or "Uncategorized",
+        owner or "",
+    )
+
+# ================= LINE ITEMS =================
+ITEM_COLUMNS = ("owner_id", "bill_id", "line_no", "name", "qty", "unit_price_cents", "line_total_cents")
+
+
+def _first(item: Dict[str, Any], *keys: str) -> Any:
+    for key in keys:
+        if item.get(key) not in (None, ""):
+            return item[key]
+    return None
+
+
+def _item_rows(owner_id: str, bill_id: str, items: Optional[Iterable[Any]]) -> List[Tuple[Any, ...]]:
+    """
+    Normalizes extracted items (parse_receipt / Gemini {"Item", "Price"} or
+    {name, qty, unit_price, line_total}) into receipt_items rows.
+    A lone "Price" is treated as the line total. Unusable entries are skipped.
+    """
+    rows: List[Tuple[Any, ...]] = []
+    for item in items or []:
+        if not isinstance(item, dict):
+            continue
+        name = _first(item, "name", "Item", "item", "description", "Description")
+        if not name or not str(name).strip():
+            continue
+        try:
+            qty = float(_first(item, "qty", "Qty", "quantity", "Quantity") or 1)
+            unit = _first(item, "unit_price", "Unit Price", "price_each", "rate")
+            total = _first(item, "line_total", "Line Total", "total", "Total", "amount", "Price", "price")
+            if total is not None:
+                total_cents = to_cents(total)
+                unit_cents = to_cents(unit) if unit is not None else int(round(total_cents / qty)) if qty else total_cents
+            elif unit is not None:
+                unit_cents = to_cents(unit)
+                total_cents = int(round(unit_cents * qty))
+            else:
+                continue
+        except (TypeError, ValueError, ZeroDivisionError):
+            continue
+        rows.append((owner_id, bill_id, len(rows) + 1, str(name).strip(), qty, unit_cents, total_cents))
+    return rows
+
+
+def _write_items(
+    db,
+    items_by_key: Dict[Tuple[str, str], Optional[Iterable[Any]]],
+    replace: bool = False,
+    schema: str = "main"
+):
+    """
+    Bulk-inserts line items for the given (owner_id, bill_id) receipts of
+    partition `schema` on the caller's connection/transaction and refreshes
+    their full-text details. With replace=True existing items of those
+    receipts are removed first.
+    """
+    if replace and items_by_key:
+        db.executemany(f"DELETE FROM {schema}.receipt_items WHERE owner_id = ? AND bill_id = ?", list(items_by_key))
+
+    rows = [row for (owner_id, bill_id), items in items_by_key.items() for row in _item_rows(owner_id, bill_id, items)]
+    if rows:
+        db.executemany(
+            f"INSERT INTO {schema}.receipt_items ({', '.join(ITEM_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(ITEM_COLUMNS))})",
+            rows,
+        )
+    refreshed = set(items_by_key) if replace else {r[:2] for r in rows}
+    db.executemany(
+        f"""
+        UPDATE {schema}.receipts_fts SET details = (
+            SELECT {FTS_DETAILS_SQL.format(schema=schema)} FROM {schema}.receipts r WHERE r.owner_id = ? AND r.bill_id = ?
+        )
+        WHERE rowid = (SELECT rowid FROM {schema}.receipts WHERE owner_id = ? AND bill_id = ?)
+        """,
+        [(o, b, o, b) for o, b in refreshed],
+    )
+
 
 # ================= SAVE RECEIPT =================
-def save_receipt(data):
+def save_receipt(data, items: Optional[List[Dict[str, Any]]] = None, owner: Optional[str] = None):
     """
     Save receipt to database.
     Assumes data = {
         bill_id, vendor, date, amount, tax, subtotal
     }
+    Line items, if given, are stored in receipt_items in the same transaction.
+    The receipt belongs to `owner`.
     """
-    db = get_db()
-    
     # Ensure subtotal/category exist
     if "subtotal" not in data:
         data["subtotal"] = 0.0
     if "category" not in data:
         data["category"] = "Uncategorized"
 
-    db.execute(
-        """
-        INSERT INTO receipts (bill_id, vendor, date, amount, tax, subtotal, category)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            data["bill_id"],
-            data["vendor"],
-            data["date"],
-            float(data["amount"]),
-            float(data["tax"]),
-            float(data["subtotal"]),
-            data["category"],
-        ),
+    row = _receipt_row(data, owner)
+    with transaction() as db:
+        db.execute(
+            f"""
+            INSERT INTO receipts ({', '.join(RECEIPT_COLUMNS)})
+            VALUES ({', '.join('?' * len(RECEIPT_COLUMNS))})
+            """,
+            row,
+        )
+        if items:
+            _write_items(db, {(row[-1], row[0]): items})
+
+
+# ================= BULK SAVE =================
+def save_receipts_bulk(
+    records: Iterable[Dict[str, Any]],
+    update_existing: bool = False,
+    owner: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Saves many receipts in a single transaction.
+    Each record is validated, deduplicated within the batch (bill ID and
+    vendor + date + amount) and against `owner`'s receipts, then written
+    with one executemany INSERT ... ON CONFLICT(owner_id, bill_id).
+    With update_existing=True rows whose bill_id `owner` already stored are
+    upserted; otherwise they are reported as duplicates and left untouched.
+    Other owners' receipts never count as duplicates.
+    An "items" list on a record is stored in receipt_items in the same
+    transaction (replacing the old items of upserted receipts).
+
+    Returns one outcome per input record, in input order:
+        {"index", "bill_id", "status": inserted|updated|duplicate|invalid, "error"}
+    """
+    outcomes: List[Dict[str, Any]] = []
+    rows: List[Tuple[Any, ...]] = []
+    row_outcomes: List[Dict[str, Any]] = []
+    row_items: List[Any] = []
+    seen_ids = set()
+    seen_fingerprints = set()
+
+    # 1. Validate and dedupe within the batch
+    for index, record in enumerate(records):
+        outcome: Dict[str, Any] = {"index": index, "bill_id": record.get("bill_id"), "status": None, "error": None}
+        outcomes.append(outcome)
+        try:
+            row = _receipt_row(record, owner)
+        except ValueError as e:
+            outcome["status"] = "invalid"
+            outcome["error"] = str(e)
+            continue
+
+        fingerprint = (row[1].lower(), row[2], row[4])
+        if row[0] in seen_ids or fingerprint in seen_fingerprints:
+            outcome["status"] = "duplicate"
+            outcome["error"] = "Duplicate within batch"
+            continue
+        seen_ids.add(row[0])
+        seen_fingerprints.add(fingerprint)
+        outcome["bill_id"] = row[0]
+        rows.append(row)
+        row_outcomes.append(outcome)
+        row_items.append(record.get("items"))
+
+    if not rows:
+        return outcomes
+
+    conflict = (
+        "DO UPDATE SET vendor = excluded.vendor, date = excluded.date, date_ord = excluded.date_ord, "
+        "amount_cents = excluded.amount_cents, "
+        "tax_cents = excluded.tax_cents, subtotal_cents = excluded.subtotal_cents, category = excluded.category"
+        if update_existing else "DO NOTHING"
     )
-    db.commit()
+    owner_id = owner or ""
+
+    with transaction() as db:
+        # 2. Dedupe against the owner's stored receipts
+        existing = set()
+        for chunk in _chunks([r[0] for r in rows]):
+            cur = db.execute(
+                f"SELECT bill_id FROM receipts WHERE owner_id = ? AND bill_id IN ({','.join('?' * len(chunk))})",
+                [owner_id, *chunk]
+            )
+            existing.update(r["bill_id"] for r in cur.fetchall())
+
+        fingerprint_hits = _fingerprint_hits([(r[1], r[2], r[4]) for r in rows], owner=owner_id)
+
+        to_write = []
+        items_by_key: Dict[Tuple[str, str], Any] = {}
+        for row, outcome, fingerprint_hit, items in zip(rows, row_outcomes, fingerprint_hits, row_items):
+            if row[0] in existing:
+                if update_existing:
+                    outcome["status"] = "updated"
+                    to_write.append(row)
+                    if items is not None:
+                        items_by_key[(owner_id, row[0])] = items
+                else:
+                    outcome["status"] = "duplicate"
+                    outcome["error"] = "Bill ID already exists"
+            elif fingerprint_hit:
+                outcome["status"] = "duplicate"
+                outcome["error"] = "Same vendor, date and amount already exists"
+            else:
+                outcome["status"] = "inserted"
+                to_write.append(row)
+                if items:
+                    items_by_key[(owner_id, row[0])] = items
+
+        # 3. One statement, one commit
+        db.executemany(
+            f"""
+            INSERT INTO receipts ({', '.join(RECEIPT_COLUMNS)})
+            VALUES ({', '.join('?' * len(RECEIPT_COLUMNS))})
+            ON CONFLICT(owner_id, bill_id) {conflict}
+            """,
+            to_write,
+        )
+        _write_items(db, items_by_key, replace=update_existing)
+
+    return outcomes
 
 
 # ================= DUPLICATE CHECK (ROBUST) =================
-def check_receipt_duplicate(bill_id, vendor, date, amount):
+def check_receipt_duplicate(bill_id, vendor, date, amount, owner: Optional[str] = None):
     """
     Check for duplicates with high reliability (>=95%).
-    Checks:
+    Both checks only look at `owner`'s receipts (owner=None checks all):
     1. Exact Bill ID match (if valid)
     2. Combination of Vendor + Date + Amount (fallback)
     """
-    db = get_db()
-    
     # 1. Check Bill ID if it exists and looks valid (not temp/default)
     if bill_id and len(bill_id) > 2 and "REC-" not in bill_id:
-        cur = db.execute("SELECT 1 FROM receipts WHERE bill_id = ?", (bill_id,))
-        if cur.fetchone():
+        if receipt_exists(bill_id, owner):
             return True
 
     # 2. Check Logic Fingerprint (Vendor + Date + Amount)
     # This catches duplicates where OCR missed the specific Bill ID char but data is same
     try:
-        cur = db.execute(
-            "SELECT 1 FROM receipts WHERE vendor = ? AND date = ? AND abs(amount - ?) < 0.01",
-            (vendor, date, float(amount))
-        )
-        if cur.fetchone():
-            return True
-    except:
-        pass
-        
-    return False
+        return find_fingerprint_duplicates([{"vendor": vendor, "date": date, "amount": amount}], owner=owner)[0]
+    except (TypeError, ValueError):
+        return False
+
+
+def find_fingerprint_duplicates(records: List[Dict[str, Any]], owner: Optional[str] = None) -> List[bool]:
+    """
+    Batched fingerprint check: for each {vendor, date, amount} record, True if
+    a stored receipt of `owner` has the same normalized vendor, date and
+    amount in cents. Every record is one seek on idx_owner_fingerprint, plus
+    one in the archive of its year when that year is archived.
+    """
+    return _fingerprint_hits(
+        [(str(r["vendor"]), iso_date(r["date"]), to_cents(r["amount"])) for r in records], owner=owner
+    )
 
 
-def receipt_exists(bill_id):
-    """Legacy wrapper for backward compatibility"""
+def _fingerprint_hits(keys: List[Tuple[str, str, int]], owner: Optional[str] = None) -> List[bool]:
+    """
+    Probes idx_owner_fingerprint for (vendor, ISO date, cents) keys in the
+    hot partition, then the keys still unmatched in their year's archive
+    (inside a transaction only archives already attached are probed).
+    """
     db = get_db()
-    cur = db.execute("SELECT 1 FROM receipts WHERE bill_id = ?", (bill_id,))
+    probe = FINGERPRINT_SQL.format(vendor="?", date="?", cents="?")
+    owner_clauses, owner_params = _owner_clause(owner)
+    scope = "".join(f" AND {c}" for c in owner_clauses)
+
+    def probe_partition(schema: str, partition_keys: List[Tuple[str, str, int]]) -> List[bool]:
+        found: List[bool] = []
+        # 3 parameters per key
+        for chunk in _chunks(partition_keys, SQL_CHUNK_SIZE // 3):
+            values = ", ".join(f"({probe})" for _ in chunk)
+            params: List[Any] = [value for key in chunk for value in key] + owner_params
+            cur = db.execute(
+                f"""
+                WITH probe(fp) AS (VALUES {values})
+                SELECT EXISTS (SELECT 1 FROM {schema}.receipts WHERE fingerprint = probe.fp{scope}) FROM probe
+                """,
+                params
+            )
+            found.extend(bool(r[0]) for r in cur.fetchall())
+        return found
+
+    hits = probe_partition("main", keys)
+
+    archived = set(archived_years())
+    by_year: Dict[int, List[int]] = {}
+    for index, key in enumerate(keys):
+        year = _year(key[1])
+        if not hits[index] and year in archived:
+            by_year.setdefault(year, []).append(index)
+    if by_year and db.in_transaction:
+        attached = {r[1] for r in db.execute("PRAGMA database_list")}
+        by_year = {y: i for y, i in by_year.items() if f"{ARCHIVE_SCHEMA_PREFIX}{y}" in attached}
+    for year, indexes in by_year.items():
+        schema = f"{ARCHIVE_SCHEMA_PREFIX}{year}" if db.in_transaction else attach_archives(db, [year])[0]
+        for index, hit in zip(indexes, probe_partition(schema, [keys[i] for i in indexes])):
+            hits[index] = hit
+
+    return hits
+
+
+def receipt_exists(bill_id, owner: Optional[str] = None):
+    """True if `owner` already stored this bill ID (owner=None: any owner)."""
+    db = get_db()
+    clauses, params = _owner_clause(owner)
+    cur = db.execute(
+        " AND ".join(["SELECT 1 FROM receipts WHERE bill_id = ?", *clauses]), (bill_id, *params)
+    )
     return cur.fetchone() is not None
 
 
-# ================= FETCH ALL RECEIPTS =================
-def fetch_all_receipts() -> List[Dict[str, Any]]:
+# ================= ROW MAPPING =================
+RECEIPT_FIELDS = "bill_id, vendor, date, amount, tax, subtotal, category"
+RECEIPT_SELECT = f"SELECT {RECEIPT_FIELDS} FROM receipts"
+
+
+def _row_to_receipt(r) -> Dict[str, Any]:
+    """Maps a receipts row (selected via RECEIPT_SELECT) to the public dict shape."""
+    return {
+        "bill_id": r["bill_id"],
+        "vendor": r["vendor"],
+        "date": r["date"],
+        "amount": float(r["amount"]),
+        "tax": float(r["tax"]),
+        "subtotal": float(r["subtotal"]) if r["subtotal"] is not None else 0.0,
+        "category": r["category"] or "Uncategorized",
+    }
+
+
+def fts_query(text: str, column: Optional[str] = None) -> str:
     """
-    Returns list of dicts ordered by date DESC
+    Turns free user input into a safe FTS5 prefix query.
+    'big baz' -> '"big"* "baz"*' (all terms, each as a prefix).
     """
-    db = get_db()
-    
-    try:
-        cur = db.execute(
-            "SELECT bill_id, vendor, date, amount, tax, subtotal, category FROM receipts ORDER BY date DESC"
-        )
-    except:
-        cur = db.execute(
-            "SELECT bill_id, vendor, date, amount, tax, 0.0 as subtotal, 'Uncategorized' as category FROM receipts ORDER BY date DESC"
-        )
+    terms = [t.replace('"', "") for t in text.split()]
+    expr = " ".join(f'"{t}"*' for t in terms if t)
+    if column and expr:
+        return f"{column} : ({expr})"
+    return expr
 
-    rows = cur.fetchall()
 
-    return [
-        {
-            "bill_id": r["bill_id"],
-            "vendor": r["vendor"],
-            "date": r["date"],
-            "amount": float(r["amount"]),
-            "tax": float(r["tax"]),
-            "subtotal": float(r["subtotal"]) if ("subtotal" in r.keys() and r["subtotal"] is not None) else 0.0,
-            "category": r["category"] if ("category" in r.keys() and r["category"]) else "Uncategorized",
-        }
-        for r in rows
+def _required_ordinal(value: Any) -> int:
+    ordinal = date_ordinal(value)
+    if ordinal is None:
+        raise ValueError(f"Invalid date: {value!r}")
+    return ordinal
+
+
+def _receipt_filters(
+    owner: Optional[str] = None,
+    vendor: Optional[str] = None,
+    category: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    schema: str = "main"
+) -> Tuple[List[str], List[Any]]:
+    """
+    Builds WHERE clauses and parameters shared by search and paging readers.
+    `schema` is the partition being read (its full-text index is used).
+    """
+    # owner_id = ? comes first: it leads every receipts index
+    clauses, params = _owner_clause(owner)
+
+    if vendor and fts_query(vendor):
+        # Prefix match through the FTS index instead of an unindexable LIKE '%x%'
+        clauses.append(f"rowid IN (SELECT rowid FROM {schema}.receipts_fts WHERE receipts_fts MATCH ?)")
+        params.append(fts_query(vendor, column="vendor"))
+
+    if category and category != "All":
+        clauses.append("category = ?")
+        params.append(category)
+
+    # Dates and money compare on the numeric columns so the covering
+    # (date_ord, amount_cents) / (category, date_ord, amount_cents) indexes apply
+    if start_date:
+        clauses.append("date_ord >= ?")
+        params.append(_required_ordinal(start_date))
+
+    if end_date:
+        clauses.append("date_ord <= ?")
+        params.append(_required_ordinal(end_date))
+
+    if min_amount is not None:
+        clauses.append("amount_cents >= ?")
+        params.append(to_cents(min_amount))
+
+    if max_amount is not None:
+        clauses.append("amount_cents <= ?")
+        params.append(to_cents(max_amount))
+
+    return clauses, params
+
+
+# ================= PARTITIONED READS =================
+# Receipts live in the hot `receipts` table plus per-year archive files
+# (see database/db.py). Readers prune archive years outside the
+# requested date range and UNION ALL the partitions that remain; the hot
+# partition is always read since late receipts for old years land there.
+def _year(value: Any) -> Optional[int]:
+    return int(iso_date(value)[:4]) if date_ordinal(value) is not None else None
+
+
+def _partition_groups(start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[List[int]]:
+    """
+    Archive years that can hold receipts in the date range, grouped so each
+    group can be attached at once. The first group is read together with
+    the hot partition.
+    """
+    first = _year(start_date) if start_date else None
+    last = _year(end_date) if end_date else None
+    years = [
+        y for y in reversed(archived_years())
+        if (first is None or y >= first) and (last is None or y <= last)
     ]
+    return [years[i:i + MAX_ATTACHED_ARCHIVES] for i in range(0, len(years), MAX_ATTACHED_ARCHIVES)] or [[]]
 
 
-# ================= GET ONE RECEIPT =================
-def get_receipt_by_id(bill_id: str) -> Optional[Dict[str, Any]]:
-    """Returns a single receipt as a dict or None"""
+def _each_partition():
+    """Hot partition, then archives newest first, attached one at a time."""
+    yield "main"
     db = get_db()
-    cur = db.execute(
-        "SELECT * FROM receipts WHERE bill_id = ?",
-        (bill_id,)
+    for year in reversed(archived_years()):
+        yield from attach_archives(db, [year])
+
+
+# ================= PARTITIONED WRITES =================
+# Updates and deletes reach archived receipts through their attached
+# partition; TEMP triggers keep the rollups and change log in step (see
+# database/db.py). Archives cannot be attached inside a transaction, so
+# there only those already attached are written (the writer thread
+# attaches the most recent ones before every group commit).
+def _archive_year(schema: str) -> int:
+    return int(schema[len(ARCHIVE_SCHEMA_PREFIX):])
+
+
+def _writable_partitions():
+    db = get_db()
+    if db.in_transaction:
+        return ["main"] + [r[1] for r in db.execute("PRAGMA database_list") if r[1].startswith(ARCHIVE_SCHEMA_PREFIX)]
+    return _each_partition()
+
+
+def _locate_receipts(bill_ids: Iterable[str], owner: Optional[str] = None) -> Dict[str, List[str]]:
+    """Groups the bill IDs of `owner`'s receipts by the partition holding them (archives first, main last)."""
+    db = get_db()
+    clauses, params = _write_owner_clause(owner)
+    remaining = list(dict.fromkeys(bill_ids))
+    located: Dict[str, List[str]] = {}
+    for schema in _writable_partitions():
+        if not remaining:
+            break
+        found = set()
+        for chunk in _chunks(remaining):
+            where = " AND ".join([f"bill_id IN ({','.join('?' * len(chunk))})", *clauses])
+            found.update(r[0] for r in db.execute(f"SELECT bill_id FROM {schema}.receipts WHERE {where}", [*chunk, *params]))
+        if found:
+            located[schema] = [b for b in remaining if b in found]
+            remaining = [b for b in remaining if b not in found]
+    main = located.pop("main", [])
+    located["main"] = main
+    return located
+
+
+def _attached(located: Dict[str, List[str]]):
+    """Yields (schema, bill_ids) of located receipts, re-attaching archives detached since."""
+    db = get_db()
+    for schema, bill_ids in located.items():
+        if schema != "main" and not db.in_transaction:
+            attach_archives(db, [_archive_year(schema)])
+        yield schema, bill_ids
+
+
+def _read_partitioned(
+    template: str,
+    tail_params: Iterable[Any] = (),
+    outer: str = "{union}",
+    outer_params: Iterable[Any] = (),
+    after: Optional[Tuple[str, ...]] = None,
+    key=None,
+    reverse: bool = False,
+    raw: bool = False,
+    **filters: Any
+):
+    """
+    Runs `template` over every partition in the filters' date range and
+    returns an iterator of rows (tuples if raw=True).
+
+    The template may use {receipts}, {items}, {fts} (the partition's tables)
+    and {where} (its filter clauses); `tail_params` follow each partition's
+    filter parameters. Several partitions are combined as `outer`, whose
+    {union} is the UNION ALL of the per-partition statements. When the
+    archives cannot all be attached at once, each group is read separately
+    and the sorted group results are merged by `key`.
+    """
+    db = get_db()
+    groups = _partition_groups(filters.get("start_date"), filters.get("end_date"))
+    results = []
+    for i, years in enumerate(groups):
+        schemas = (["main"] if i == 0 else []) + attach_archives(db, years)
+        statements: List[str] = []
+        params: List[Any] = []
+        for schema in schemas:
+            clauses, part_params = _receipt_filters(schema=schema, **filters)
+            if after:
+                clauses.append(_cursor_clause(filters.get("owner")))
+                part_params.extend(_cursor_params(after, filters.get("owner")))
+            statements.append(template.format(
+                receipts=f"{schema}.receipts",
+                items=f"{schema}.receipt_items",
+                fts=f"{schema}.receipts_fts",
+                where=" WHERE " + " AND ".join(clauses) if clauses else "",
+            ))
+            params.extend(part_params)
+            params.extend(tail_params)
+
+        query = statements[0]
+        if len(statements) > 1:
+            query = outer.format(union=" UNION ALL ".join(f"SELECT * FROM ({s})" for s in statements))
+            params.extend(outer_params)
+
+        cur = db.cursor()
+        if raw:
+            cur.row_factory = None
+        cur.execute(query, params)
+        if len(groups) == 1:
+            return cur
+        # Fetch before the next group may detach this one's archives
+        results.append(cur.fetchall())
+
+    return heapq.merge(*results, key=key, reverse=reverse) if key else itertools.chain(*results)
+
+
+# ================= KEYSET CURSORS =================
+# Bill IDs are unique per owner only, so receipts are ordered (and cursors
+# are keyed) by (date, bill_id, owner_id). Within one owner's receipts the
+# owner is constant and (date, bill_id) is enough.
+KEYSET_ORDER = "date DESC, bill_id DESC, owner_id DESC"
+
+
+def _cursor_clause(owner: Optional[str]) -> str:
+    return "(date, bill_id) < (?, ?)" if owner is not None else "(date, bill_id, owner_id) < (?, ?, ?)"
+
+
+def _cursor_params(after: Tuple[str, ...], owner: Optional[str]) -> List[Any]:
+    # A (date, bill_id) cursor without an owner skips the rest of its ties
+    return list(after[:2]) if owner is not None else [*after[:2], after[2] if len(after) > 2 else ""]
+
+
+# ================= FETCH ALL RECEIPTS =================
+def fetch_all_receipts(owner: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Returns list of dicts ordered by date DESC.
+    Prefer iter_receipts / iter_receipt_chunks for large vaults.
+    """
+    return list(iter_receipts(owner=owner))
+
+
+# ================= KEYSET PAGINATION =================
+def fetch_receipts_page(
+    after: Optional[Tuple[str, ...]] = None,
+    limit: int = 100,
+    **filters: Any
+) -> List[Dict[str, Any]]:
+    """
+    Returns up to `limit` receipts ordered by (date DESC, bill_id DESC,
+    owner DESC), starting strictly after the `after` cursor.
+    Pass the (date, bill_id) of the last row as `after` to get the next
+    page of one owner's receipts; across owners (owner=None) the cursor is
+    (date, bill_id, owner), see iter_receipt_chunks.
+    Accepts the same filters as search_receipts, including owner.
+    """
+    return _receipts_page(after, limit, **filters)[0]
+
+
+def _receipts_page(
+    after: Optional[Tuple[str, ...]],
+    limit: int,
+    **filters: Any
+) -> Tuple[List[Dict[str, Any]], Optional[Tuple[str, str, str]]]:
+    """fetch_receipts_page plus the (date, bill_id, owner) cursor of its last row."""
+    order = f" ORDER BY {KEYSET_ORDER} LIMIT ?"
+    rows = list(itertools.islice(_read_partitioned(
+        f"SELECT {RECEIPT_FIELDS}, owner_id FROM {{receipts}}{{where}}{order}", (int(limit),),
+        outer="{union}" + order, outer_params=(int(limit),),
+        after=after, key=lambda r: (r["date"], r["bill_id"], r["owner_id"]), reverse=True,
+        **filters
+    ), int(limit)))
+    cursor = (rows[-1]["date"], rows[-1]["bill_id"], rows[-1]["owner_id"]) if rows else None
+    return [_row_to_receipt(r) for r in rows], cursor
+
+
+def iter_receipt_chunks(
+    chunk_size: int = 1000,
+    after: Optional[Tuple[str, ...]] = None,
+    **filters: Any
+):
+    """
+    Generator yielding lists of up to chunk_size receipts, newest first.
+    Each chunk is one keyset query, so memory stays bounded by chunk_size.
+    """
+    while True:
+        page, after = _receipts_page(after, chunk_size, **filters)
+        if not page:
+            return
+        yield page
+        if len(page) < chunk_size:
+            return
+
+
+def iter_receipts(
+    after: Optional[Tuple[str, ...]] = None,
+    limit: Optional[int] = None,
+    chunk_size: int = 1000,
+    **filters: Any
+):
+    """
+    Generator yielding receipts one at a time, newest first, starting after
+    the (date, bill_id[, owner]) cursor and stopping after `limit` rows
+    (None = all).
+    """
+    remaining = limit
+    if remaining is not None:
+        chunk_size = min(chunk_size, remaining)
+    for chunk in iter_receipt_chunks(chunk_size=chunk_size, after=after, **filters):
+        for receipt in chunk:
+            if remaining is not None:
+                if remaining <= 0:
+                    return
+                remaining -= 1
+            yield receipt
+
+
+def count_receipts(**filters: Any) -> int:
+    """Returns the number of receipts matching the search_receipts filters."""
+    rows = _read_partitioned(
+        "SELECT COUNT(*) AS n FROM {receipts}{where}", outer="SELECT SUM(n) FROM ({union})", **filters
     )
-    row = cur.fetchone()
-    if row:
-        return {
-            "bill_id": row["bill_id"],
-            "vendor": row["vendor"],
-            "date": row["date"],
-            "amount": float(row["amount"]),
-            "tax": float(row["tax"]),
-            "subtotal": float(row["subtotal"]) if ("subtotal" in row.keys() and row["subtotal"] is not None) else 0.0,
-            "category": row["category"] if ("category" in row.keys() and row["category"]) else "Uncategorized",
-        }
+    return sum(r[0] for r in rows)
+
+
+# ================= DATAFRAME LOADER =================
+# Public column -> stored column read for it
+FRAME_COLUMNS = {
+    "bill_id": "bill_id",
+    "vendor": "vendor",
+    "date": "date_ord",
+    "amount": "amount_cents",
+    "tax": "tax_cents",
+    "subtotal": "subtotal_cents",
+    "category": "category",
+    "amount_cents": "amount_cents",
+    "tax_cents": "tax_cents",
+    "subtotal_cents": "subtotal_cents",
+}
+DEFAULT_FRAME_COLUMNS = ("bill_id", "vendor", "date", "amount", "tax", "subtotal", "category")
+CATEGORICAL_COLUMNS = ("vendor", "category")
+
+# date_ordinal() of 1970-01-01
+UNIX_EPOCH_ORDINAL = 2440587
+
+
+def fetch_receipts_frame(
+    filters: Optional[Dict[str, Any]] = None,
+    columns: Iterable[str] = DEFAULT_FRAME_COLUMNS,
+    chunk_size: int = 10000,
+    owner: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Loads receipts straight into a DataFrame, newest first.
+    Rows are read as plain tuples in chunks and accumulated column-wise
+    (no per-row dicts). vendor/category become categoricals, money columns
+    float64 (or int64 for *_cents), and date datetime64.
+    `filters` takes the search_receipts keyword filters. The frame's
+    memory footprint in bytes is stored in df.attrs["memory_bytes"].
+    """
+    columns = list(columns)
+    unknown = [c for c in columns if c not in FRAME_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    stored = list(dict.fromkeys(FRAME_COLUMNS[c] for c in columns))
+
+    # Trailing sort columns order the partition union; zip() below ignores them
+    reader = iter(_read_partitioned(
+        f"SELECT {', '.join(stored)}, date AS sort_date, bill_id AS sort_bill, owner_id AS sort_owner "
+        f"FROM {{receipts}}{{where}} ORDER BY {KEYSET_ORDER}",
+        outer="{union} ORDER BY sort_date DESC, sort_bill DESC, sort_owner DESC",
+        key=lambda r: (r[-3], r[-2], r[-1]), reverse=True, raw=True,
+        **{"owner": owner, **(filters or {})}
+    ))
+
+    values: Dict[str, List[Any]] = {c: [] for c in stored}
+    # Categorical columns are dictionary-encoded while reading
+    codes: Dict[str, Dict[Any, int]] = {c: {} for c in CATEGORICAL_COLUMNS if c in values}
+    while True:
+        rows = list(itertools.islice(reader, chunk_size))
+        if not rows:
+            break
+        for name, col in zip(stored, zip(*rows)):
+            if name in codes:
+                lookup = codes[name]
+                if name == "category":
+                    col = [v or "Uncategorized" for v in col]
+                values[name].extend(lookup.setdefault(v, len(lookup)) for v in col)
+            else:
+                values[name].extend(col)
+
+    data: Dict[str, Any] = {}
+    for column in columns:
+        source = FRAME_COLUMNS[column]
+        raw = values[source]
+        if column in CATEGORICAL_COLUMNS:
+            data[column] = pd.Categorical.from_codes(
+                np.asarray(raw, dtype=np.int32), categories=list(codes[source])
+            )
+        elif column == "date":
+            days = np.asarray(raw, dtype=np.float64) - UNIX_EPOCH_ORDINAL
+            data[column] = pd.to_datetime(days, unit="D", origin="unix")
+        elif column.endswith("_cents"):
+            data[column] = np.asarray(raw, dtype=np.int64)
+        elif source.endswith("_cents"):
+            data[column] = np.asarray(raw, dtype=np.int64) / 100
+        else:
+            data[column] = np.asarray(raw, dtype=object)
+
+    df = pd.DataFrame(data, columns=columns)
+    df.attrs["memory_bytes"] = int(df.memory_usage(deep=True).sum())
+    logger.info("Loaded %d receipts into a %.1f KB frame", len(df), df.attrs["memory_bytes"] / 1024)
+    return df
+
+
+# ================= GET ONE RECEIPT =================
+def get_receipt_by_id(bill_id: str, owner: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Returns a single receipt as a dict or None (also None if it belongs to
+    another owner). Archived receipts are found too.
+    """
+    db = get_db()
+    clauses, params = _owner_clause(owner)
+    where = " AND ".join(["bill_id = ?", *clauses])
+    for schema in _each_partition():
+        row = db.execute(
+            f"SELECT {RECEIPT_FIELDS} FROM {schema}.receipts WHERE {where}",
+            (bill_id, *params)
+        ).fetchone()
+        if row:
+            return _row_to_receipt(row)
     return None
 
 
 # ================= UPDATE RECEIPT =================
-def update_receipt(bill_id: str, update_data: Dict[str, Any]) -> bool:
-    """Updates specific fields for a receipt"""
-    db = get_db()
-    
-    fields = []
-    values = []
-    
+def update_receipt(bill_id: str, update_data: Dict[str, Any], owner: Optional[str] = None) -> bool:
+    """Updates specific fields for a receipt (archived ones included)"""
+    return update_receipts({bill_id: update_data}, owner=owner) > 0
+
+
+def _update_assignments(update_data: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+    """Maps public field updates to "column = ?" assignments and converted values."""
+    fields: List[str] = []
+    values: List[Any] = []
     for key, value in update_data.items():
         if value is not None:
-            fields.append(f"{key} = ?")
-            values.append(value)
-    
-    if not fields:
-        return False
-    
-    values.append(bill_id)
-    query = f"UPDATE receipts SET {', '.join(fields)} WHERE bill_id = ?"
-    
-    db.execute(query, values)
-    db.commit()
-    return True
+            if key not in UPDATABLE_FIELDS:
+                raise ValueError(f"Cannot update field: {key}")
+            for column, convert in UPDATABLE_FIELDS[key]:
+                fields.append(f"{column} = ?")
+                values.append(convert(value))
+    return fields, values
+
+
+# ================= BULK UPDATE =================
+def update_receipts(
+    changes: Dict[str, Dict[str, Any]],
+    owner: Optional[str] = None,
+    items: Optional[Dict[str, List[Dict[str, Any]]]] = None
+) -> int:
+    """
+    Applies {bill_id: {field: value}} updates, one transaction per
+    partition holding the receipts (usually just the hot one).
+    Receipts changing the same set of fields share one executemany statement.
+    Receipts of other owners are left untouched (owner=None updates
+    unowned receipts only).
+    `items` ({bill_id: items}) replaces the line items of those receipts in
+    the same transactions.
+    Archived receipts are updated in their archive but must keep its year
+    (ValueError otherwise, before anything is written), so date-range
+    reads keep finding them.
+    Returns the number of receipts updated.
+    """
+    clauses, params = _write_owner_clause(owner)
+    where = " AND ".join(["bill_id = ?", *clauses])
+    assignments = {bill_id: _update_assignments(update_data) for bill_id, update_data in changes.items()}
+    located = _locate_receipts([*changes, *(items or {})], owner)
+    for schema, bill_ids in located.items():
+        if schema == "main":
+            continue
+        for bill_id in bill_ids:
+            new_date = (changes.get(bill_id) or {}).get("date")
+            if new_date is not None and _year(new_date) != _archive_year(schema):
+                raise ValueError(f"Archived receipt {bill_id} can only be re-dated within {_archive_year(schema)}")
+
+    updated = 0
+    for schema, bill_ids in _attached(located):
+        statements: Dict[Tuple[str, ...], List[List[Any]]] = {}
+        for bill_id in bill_ids:
+            fields, values = assignments.get(bill_id, ([], []))
+            if fields:
+                statements.setdefault(tuple(fields), []).append(values + [bill_id, *params])
+
+        with transaction() as db:
+            for fields, rows in statements.items():
+                cur = db.executemany(f"UPDATE {schema}.receipts SET {', '.join(fields)} WHERE {where}", rows)
+                updated += cur.rowcount
+            with_items = [b for b in bill_ids if items and b in items]
+            if with_items:
+                items_by_key: Dict[Tuple[str, str], Any] = {}
+                for chunk in _chunks(with_items):
+                    chunk_where = " AND ".join([f"bill_id IN ({','.join('?' * len(chunk))})", *clauses])
+                    cur = db.execute(
+                        f"SELECT owner_id, bill_id FROM {schema}.receipts WHERE {chunk_where}", [*chunk, *params]
+                    )
+                    items_by_key.update(((r[0], r[1]), items[r[1]]) for r in cur.fetchall())
+                _write_items(db, items_by_key, replace=True, schema=schema)
+    return updated
 
 
 # ================= SEARCH RECEIPTS (OPTIMIZED) =================
@@ -158,73 +911,626 @@ def search_receipts(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     min_amount: Optional[float] = None,
-    max_amount: Optional[float] = None
+    max_amount: Optional[float] = None,
+    owner: Optional[str] = None
 ) -> List[Dict[str, Any]]:
     """
     Search receipts with dynamic SQL filtering (Server-side optimization).
     Uses indexed columns for better performance.
     """
+    return list(iter_receipts(
+        owner=owner,
+        vendor=vendor,
+        category=category,
+        start_date=start_date,
+        end_date=end_date,
+        min_amount=min_amount,
+        max_amount=max_amount,
+    ))
+
+
+# ================= FULL-TEXT SEARCH =================
+def search_receipts_fulltext(text: str, limit: int = 100, **filters: Any) -> List[Dict[str, Any]]:
+    """
+    Ranked full-text search over bill ID, vendor, category and receipt
+    details using the receipts_fts index. Every term is matched as a prefix;
+    results are ordered by BM25 relevance. Accepts the search_receipts filters,
+    including owner.
+    """
+    match = fts_query(text)
+    if not match:
+        return []
+
+    rows = _read_partitioned(
+        "SELECT r.*, bm25(receipts_fts) AS rank FROM {fts} "
+        f"JOIN (SELECT rowid AS rid, {RECEIPT_FIELDS} FROM {{receipts}}{{where}}) r "
+        "ON r.rid = receipts_fts.rowid "
+        "WHERE receipts_fts MATCH ? ORDER BY rank LIMIT ?",
+        (match, int(limit)),
+        outer="{union} ORDER BY rank LIMIT ?", outer_params=(int(limit),),
+        key=lambda r: r["rank"],
+        **filters
+    )
+    return [_row_to_receipt(r) for r in itertools.islice(rows, int(limit))]
+
+
+# ================= DELETE ONE RECEIPT =================
+def delete_receipt(bill_id, owner: Optional[str] = None) -> int:
+    return delete_receipts([bill_id], owner=owner)
+
+
+# ================= BULK DELETE =================
+def delete_receipts(bill_ids: Iterable[str], owner: Optional[str] = None) -> int:
+    """
+    Deletes many receipts (and their line items, images and OCR text)
+    using chunked IN (...) statements, archived ones included: one
+    transaction per archive involved, then one for the hot partition.
+    Receipts of other owners are skipped (owner=None deletes unowned
+    receipts only).
+    Returns the number of receipts deleted.
+    """
+    ids = list(dict.fromkeys(bill_ids))
+    clauses, params = _write_owner_clause(owner)
+    deleted = 0
+    for schema, located_ids in _attached(_locate_receipts(ids, owner)):
+        with transaction() as db:
+            for chunk in _chunks(located_ids):
+                where = " AND ".join([f"bill_id IN ({','.join('?' * len(chunk))})", *clauses])
+                cur = db.execute(f"DELETE FROM {schema}.receipts WHERE {where}", [*chunk, *params])
+                deleted += cur.rowcount
+            if schema == "main":
+                # Images and OCR text of archived receipts live in main too
+                for chunk in _chunks(ids):
+                    where = " AND ".join([f"bill_id IN ({','.join('?' * len(chunk))})", *clauses])
+                    db.execute(f"DELETE FROM receipt_images WHERE {where}", [*chunk, *params])
+                    db.execute(f"DELETE FROM receipt_ocr_text WHERE {where}", [*chunk, *params])
+    return deleted
+
+
+# ================= CLEAR ALL RECEIPTS =================
+def clear_all_receipts(owner: Optional[str] = None):
+    """
+    Deletes every receipt of `owner` (the unowned ones with owner=None),
+    archived ones included, with their items, images and OCR text; the
+    rollups follow through the delete triggers. Archive files left empty
+    are removed. Must be called outside a transaction.
+    """
+    # receipts has no AUTOINCREMENT key, so there is no sqlite_sequence row to reset
+    clauses, params = _write_owner_clause(owner)
     db = get_db()
-    
-    query = "SELECT * FROM receipts WHERE 1=1"
-    params: List[Any] = []
-    
-    if vendor:
-        query += " AND vendor LIKE ?"
-        params.append(f"%{vendor}%")
-    
-    if category and category != "All":
-        query += " AND category = ?"
-        params.append(category)
-    
-    if start_date:
-        query += " AND date >= ?"
-        params.append(start_date)
-    
-    if end_date:
-        query += " AND date <= ?"
-        params.append(end_date)
-    
-    if min_amount is not None:
-        query += " AND amount >= ?"
-        params.append(min_amount)
-    
-    if max_amount is not None:
-        query += " AND amount <= ?"
-        params.append(max_amount)
-    
-    query += " ORDER BY date DESC"
-    
-    cur = db.execute(query, params)
-    rows = cur.fetchall()
-    
+    emptied = []
+    for schema in _each_partition():
+        with transaction():
+            db.execute(" WHERE ".join([f"DELETE FROM {schema}.receipts", *clauses]), params)
+            if schema == "main":
+                db.execute(" WHERE ".join(["DELETE FROM receipt_images", *clauses]), params)
+                db.execute(" WHERE ".join(["DELETE FROM receipt_ocr_text", *clauses]), params)
+        if schema != "main" and not db.execute(f"SELECT 1 FROM {schema}.receipts LIMIT 1").fetchone():
+            emptied.append(schema)
+
+    attached = {r[1] for r in db.execute("PRAGMA database_list")}
+    for schema in emptied:
+        if schema in attached:
+            db.execute(f"DETACH DATABASE {schema}")
+        try:
+            archive_path(_archive_year(schema)).unlink()
+        except OSError as e:
+            # Another connection may still have it open; an empty archive is harmless
+            logger.warning("Could not remove empty archive %s: %s", schema, e)
+
+
+# ================= UNOWNED (LEGACY) RECEIPTS =================
+def claim_unowned_receipts(owner: str) -> int:
+    """
+    Assigns receipts saved before receipts had owners (owner_id '') to
+    `owner`, archived ones included, together with their line items,
+    images and OCR text. Unowned receipts whose bill ID `owner` already
+    uses stay unowned. Returns the number of receipts claimed.
+    """
+    if not owner:
+        raise ValueError("An owner is required")
+    claimed = 0
+    for schema in _each_partition():
+        query = f"UPDATE OR IGNORE {schema}.receipts SET owner_id = ? WHERE owner_id = ''"
+        params = [owner]
+        if schema != "main":
+            # Uniqueness is per table, so check the hot partition explicitly
+            query += " AND bill_id NOT IN (SELECT bill_id FROM main.receipts WHERE owner_id = ?)"
+            params.append(owner)
+        # Items follow through ON UPDATE CASCADE, rollups through the update triggers
+        with transaction() as db:
+            cur = db.execute(query, params)
+        claimed += cur.rowcount
+
+    with transaction() as db:
+        for table in ("receipt_images", "receipt_ocr_text"):
+            db.execute(
+                f"""
+                UPDATE OR IGNORE {table} SET owner_id = ? WHERE owner_id = ''
+                AND NOT EXISTS (SELECT 1 FROM receipts r WHERE r.owner_id = '' AND r.bill_id = {table}.bill_id)
+                """,
+                (owner,)
+            )
+    if claimed:
+        logger.info("Assigned %d unowned receipts to %s", claimed, owner)
+    return claimed
+
+
+# ================= SPENDING ROLLUPS =================
+# Read from the trigger-maintained spend_by_* tables (see database/db.py),
+# so cost scales with the number of periods, not the number of receipts.
+def _range_clause(
+    column: str,
+    start: Optional[str],
+    end: Optional[str],
+    owner: Optional[str] = None
+) -> Tuple[str, List[Any]]:
+    clauses, params = _owner_clause(owner)
+    if start:
+        clauses.append(f"{column} >= ?")
+        params.append(start)
+    if end:
+        clauses.append(f"{column} <= ?")
+        params.append(end)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def get_spend_summary(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    owner: Optional[str] = None
+) -> Dict[str, Any]:
+    """Total spend, tax, receipt count and average for a date range (inclusive)."""
+    where, params = _range_clause("day", start_date, end_date, owner)
+    row = get_db().execute(
+        f"SELECT COALESCE(SUM(total_cents), 0), COALESCE(SUM(tax_cents), 0), COALESCE(SUM(receipt_count), 0) FROM spend_by_day{where}",
+        params
+    ).fetchone()
+    total, tax, count = row[0] / 100, row[1] / 100, int(row[2])
+    return {
+        "total": total,
+        "tax": tax,
+        "count": count,
+        "average": round(total / count, 2) if count else 0.0,
+    }
+
+
+def get_daily_totals(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    owner: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Per-day spend ordered by day."""
+    where, params = _range_clause("day", start_date, end_date, owner)
+    cur = get_db().execute(
+        f"""
+        SELECT day, SUM(total_cents) AS total_cents, SUM(tax_cents) AS tax_cents, SUM(receipt_count) AS receipt_count
+        FROM spend_by_day{where}
+        GROUP BY day ORDER BY day
+        """,
+        params
+    )
+    return [
+        {"date": r["day"], "total": r["total_cents"] / 100, "tax": r["tax_cents"] / 100, "count": r["receipt_count"]}
+        for r in cur.fetchall()
+    ]
+
+
+def get_monthly_totals(
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None,
+    owner: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Per-month (YYYY-MM) spend ordered by month; receipts without a valid date are left out."""
+    where, params = _range_clause("month", start_month, end_month, owner)
+    where += (" AND " if where else " WHERE ") + "month <> ''"
+    cur = get_db().execute(
+        f"""
+        SELECT month, SUM(total_cents) AS total_cents, SUM(tax_cents) AS tax_cents, SUM(receipt_count) AS receipt_count
+        FROM spend_by_month{where}
+        GROUP BY month ORDER BY month
+        """,
+        params
+    )
+    return [
+        {"month": r["month"], "total": r["total_cents"] / 100, "tax": r["tax_cents"] / 100, "count": r["receipt_count"]}
+        for r in cur.fetchall()
+    ]
+
+
+def get_month_spend(month: str, owner: Optional[str] = None) -> float:
+    """Total spend for one YYYY-MM month (budget tracker)."""
+    where, params = _range_clause("month", month, month, owner)
+    row = get_db().execute(f"SELECT COALESCE(SUM(total_cents), 0) FROM spend_by_month{where}", params).fetchone()
+    return row[0] / 100
+
+
+def get_category_totals(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    owner: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Spend per category for a date range, highest first."""
+    where, params = _range_clause("day", start_date, end_date, owner)
+    cur = get_db().execute(
+        f"""
+        SELECT category, SUM(total_cents) AS total_cents, SUM(tax_cents) AS tax_cents, SUM(receipt_count) AS receipt_count
+        FROM spend_by_category{where}
+        GROUP BY category ORDER BY total_cents DESC
+        """,
+        params
+    )
+    return [
+        {"category": r["category"], "total": r["total_cents"] / 100, "tax": r["tax_cents"] / 100, "count": r["receipt_count"]}
+        for r in cur.fetchall()
+    ]
+
+
+def get_vendor_totals(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: Optional[int] = None,
+    owner: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Spend per vendor for a date range, highest first."""
+    where, params = _range_clause("day", start_date, end_date, owner)
+    query = f"""
+        SELECT vendor, SUM(total_cents) AS total_cents, SUM(tax_cents) AS tax_cents, SUM(receipt_count) AS receipt_count
+        FROM spend_by_vendor{where}
+        GROUP BY vendor ORDER BY total_cents DESC
+    """
+    if limit:
+        query += " LIMIT ?"
+        params.append(int(limit))
+    cur = get_db().execute(query, params)
+    return [
+        {"vendor": r["vendor"], "total": r["total_cents"] / 100, "tax": r["tax_cents"] / 100, "count": r["receipt_count"]}
+        for r in cur.fetchall()
+    ]
+
+
+# ================= ITEM-LEVEL REPORTING =================
+def get_receipt_items(bill_id: str, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Line items of one receipt in printed order (looked up in its partition)."""
+    db = get_db()
+    clauses, params = _owner_clause(owner)
+    where = " AND ".join(["bill_id = ?", *clauses])
+    for schema in _each_partition():
+        row = db.execute(f"SELECT owner_id FROM {schema}.receipts WHERE {where}", (bill_id, *params)).fetchone()
+        if row:
+            break
+    else:
+        return []
+
+    cur = db.execute(
+        f"""
+        SELECT line_no, name, qty, unit_price_cents, line_total_cents
+        FROM {schema}.receipt_items WHERE owner_id = ? AND bill_id = ? ORDER BY line_no
+        """,
+        (row["owner_id"], bill_id)
+    )
     return [
         {
-            "bill_id": r["bill_id"],
-            "vendor": r["vendor"],
-            "date": r["date"],
-            "amount": float(r["amount"]),
-            "tax": float(r["tax"]),
-            "subtotal": float(r["subtotal"]) if ("subtotal" in r.keys() and r["subtotal"] is not None) else 0.0,
-            "category": r["category"] if ("category" in r.keys() and r["category"]) else "Uncategorized",
+            "line_no": r["line_no"],
+            "name": r["name"],
+            "qty": r["qty"],
+            "unit_price": r["unit_price_cents"] / 100,
+            "line_total": r["line_total_cents"] / 100,
         }
-        for r in rows
+        for r in cur.fetchall()
     ]
 
 
-# ================= DELETE ONE RECEIPT =================
-def delete_receipt(bill_id):
-    db = get_db()
-    db.execute(
-        "DELETE FROM receipts WHERE bill_id = ?",
-        (bill_id,)
+def get_item_spend(
+    name: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: Optional[int] = 50,
+    owner: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Spend per item name (case-insensitive), highest first, archived
+    receipts included. `name` is a prefix filter served by idx_items_name;
+    a date range joins receipts through their primary key and skips
+    archives outside it.
+    """
+    clauses, params = _owner_clause(owner, "i.owner_id")
+    join = ""
+    if name:
+        clauses.append("i.name LIKE ? ESCAPE '\\'")
+        escaped = name.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.append(f"{escaped}%")
+    if start_date or end_date:
+        join = (
+            " JOIN (SELECT owner_id, bill_id FROM {receipts}{where}) r"
+            " ON r.owner_id = i.owner_id AND r.bill_id = i.bill_id"
+        )
+
+    # Receipts are keyed by (owner, bill ID), and each lives in one partition
+    rows = _read_partitioned(
+        "SELECT i.name AS name, SUM(i.line_total_cents) AS total_cents, SUM(i.qty) AS qty, "
+        "COUNT(DISTINCT i.owner_id || char(31) || i.bill_id) AS receipt_count "
+        f"FROM {{items}} i{join}{' WHERE ' + ' AND '.join(clauses) if clauses else ''} GROUP BY i.name",
+        params,
+        outer=(
+            "SELECT name, SUM(total_cents) AS total_cents, SUM(qty) AS qty, SUM(receipt_count) AS receipt_count "
+            "FROM ({union}) GROUP BY name"
+        ),
+        start_date=start_date,
+        end_date=end_date,
     )
-    db.commit()
+    # Archives beyond one attach group come back as separate groups
+    totals: Dict[str, Dict[str, Any]] = {}
+    for r in rows:
+        entry = totals.setdefault(r["name"].lower(), {"name": r["name"], "total_cents": 0, "qty": 0, "count": 0})
+        entry["total_cents"] += r["total_cents"]
+        entry["qty"] += r["qty"]
+        entry["count"] += r["receipt_count"]
+    ranked = sorted(totals.values(), key=lambda e: e["total_cents"], reverse=True)
+    return [
+        {"name": e["name"], "total": e["total_cents"] / 100, "qty": e["qty"], "count": e["count"]}
+        for e in (ranked[:int(limit)] if limit else ranked)
+    ]
 
 
-# ================= CLEAR ALL RECEIPTS =================
-def clear_all_receipts():
+# ================= RECEIPT IMAGES =================
+# Original uploads live in the content-addressed blob store; receipt_images
+# links each receipt page to a blob digest.
+def save_receipt_image(
+    bill_id: str,
+    source: Any,
+    mime_type: Optional[str] = None,
+    page: int = 0,
+    image: Any = None,
+    owner: Optional[str] = None
+) -> str:
+    """
+    Streams `source` (bytes or a binary file object) into the blob store,
+    writes its thumbnail once (from the decoded `image` if given) and links
+    it to page `page` of the receipt. Returns the blob's SHA-256 digest.
+    """
+    digest, size = put_blob(source)
+    make_thumbnail(digest, image=image)
+    with transaction() as db:
+        db.execute(
+            """
+            INSERT INTO receipt_images (bill_id, page, owner_id, blob_sha256, mime_type, byte_size)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(owner_id, bill_id, page) DO UPDATE SET
+                blob_sha256 = excluded.blob_sha256,
+                mime_type = excluded.mime_type,
+                byte_size = excluded.byte_size
+            """,
+            (str(bill_id).strip(), page, owner or "", digest, mime_type, size),
+        )
+    return digest
+
+
+def _image_row_to_dict(r) -> Dict[str, Any]:
+    return {
+        "bill_id": r["bill_id"],
+        "page": r["page"],
+        "sha256": r["blob_sha256"],
+        "mime_type": r["mime_type"],
+        "size": r["byte_size"],
+        "path": str(blob_path(r["blob_sha256"])),
+        "thumbnail": str(thumbnail_path(r["blob_sha256"])),
+    }
+
+
+def get_receipt_images(bill_id: str, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Stored pages of one receipt in page order."""
+    clauses, params = _owner_clause(owner)
+    cur = get_db().execute(
+        "SELECT bill_id, page, blob_sha256, mime_type, byte_size FROM receipt_images WHERE "
+        + " AND ".join(["bill_id = ?", *clauses]) + " ORDER BY page",
+        (bill_id, *params)
+    )
+    return [_image_row_to_dict(r) for r in cur.fetchall()]
+
+
+def iter_receipt_images(owner: Optional[str] = None) -> Iterable[Dict[str, Any]]:
+    """
+    Every stored receipt page, ordered by blob digest so offline
+    reprocessing reads each shared blob once and walks the store's shards
+    in order. Includes pages of archived receipts.
+    """
+    clauses, params = _owner_clause(owner)
+    query = "SELECT bill_id, page, blob_sha256, mime_type, byte_size FROM receipt_images"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY blob_sha256, bill_id, page"
+    for r in get_db().execute(query, params):
+        yield _image_row_to_dict(r)
+
+
+def prune_receipt_blobs() -> int:
+    """Removes blobs no receipt links to any more; returns how many."""
+    referenced = [r[0] for r in get_db().execute("SELECT DISTINCT blob_sha256 FROM receipt_images")]
+    return remove_unreferenced_blobs(referenced)
+
+
+# ================= RAW OCR TEXT =================
+OCR_TEXT_CODEC = "zlib"
+
+
+def _compress_text(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def _decompress_text(raw: bytes, codec: str) -> str:
+    if codec != "zlib":
+        raise ValueError(f"Unknown OCR text codec: {codec}")
+    return zlib.decompress(raw).decode("utf-8")
+
+
+def save_ocr_text(bill_id: str, text: str, owner: Optional[str] = None):
+    """Stores (or replaces) the raw OCR text a receipt was parsed from."""
+    with transaction() as db:
+        db.execute(
+            """
+            INSERT INTO receipt_ocr_text (bill_id, owner_id, codec, raw, char_count)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(owner_id, bill_id) DO UPDATE SET
+                codec = excluded.codec,
+                raw = excluded.raw, char_count = excluded.char_count
+            """,
+            (str(bill_id).strip(), owner or "", OCR_TEXT_CODEC, _compress_text(text), len(text)),
+        )
+
+
+def get_ocr_text(bill_id: str, owner: Optional[str] = None) -> Optional[str]:
+    clauses, params = _owner_clause(owner)
+    row = get_db().execute(
+        "SELECT codec, raw FROM receipt_ocr_text WHERE " + " AND ".join(["bill_id = ?", *clauses]),
+        (bill_id, *params)
+    ).fetchone()
+    return _decompress_text(row["raw"], row["codec"]) if row else None
+
+
+def iter_ocr_text_batches(batch_size: int = 1000, owner: Optional[str] = None) -> Iterable[List[Dict[str, Any]]]:
+    """
+    Yields lists of {"bill_id", "owner", "text", "receipt", "items"} for hot
+    receipts that have stored OCR text, in (owner, bill_id) order. Each
+    batch is a separate keyset query, so callers may update receipts
+    between batches.
+    """
     db = get_db()
-    db.execute("DELETE FROM receipts")
-    db.execute("DELETE FROM sqlite_sequence WHERE name='receipts'")
-    db.commit()
\ No newline at end of file
+    clauses, params = _owner_clause(owner, "t.owner_id")
+    after = ("", "")
+    while True:
+        cur = db.execute(
+            f"""
+            SELECT t.codec, t.raw, t.owner_id, {', '.join('r.' + f for f in RECEIPT_FIELDS.split(', '))}
+            FROM receipt_ocr_text t JOIN receipts r ON r.owner_id = t.owner_id AND r.bill_id = t.bill_id
+            WHERE {' AND '.join(['(t.owner_id, t.bill_id) > (?, ?)', *clauses])}
+            ORDER BY t.owner_id, t.bill_id LIMIT ?
+            """,
+            (*after, *params, batch_size)
+        )
+        rows = cur.fetchall()
+        if not rows:
+            return
+        ids_by_owner: Dict[str, List[str]] = {}
+        for r in rows:
+            ids_by_owner.setdefault(r["owner_id"], []).append(r["bill_id"])
+        items: Dict[Tuple[str, str], List[Dict[str, Any]]] = {(r["owner_id"], r["bill_id"]): [] for r in rows}
+        for owner_id, ids in ids_by_owner.items():
+            for chunk in _chunks(ids):
+                item_rows = db.execute(
+                    f"""
+                    SELECT bill_id, name, line_total_cents FROM receipt_items
+                    WHERE owner_id = ? AND bill_id IN ({','.join('?' * len(chunk))}) ORDER BY bill_id, line_no
+                    """,
+                    [owner_id, *chunk]
+                )
+                for r in item_rows:
+                    items[(owner_id, r["bill_id"])].append({"name": r["name"], "line_total": r["line_total_cents"] / 100})
+        yield [
+            {
+                "bill_id": r["bill_id"],
+                "owner": r["owner_id"],
+                "text": _decompress_text(r["raw"], r["codec"]),
+                "receipt": _row_to_receipt(r),
+                "items": items[(r["owner_id"], r["bill_id"])],
+            }
+            for r in rows
+        ]
+        after = (rows[-1]["owner_id"], rows[-1]["bill_id"])
+
+
+# ================= CHANGE LOG (CDC) =================
+def changes_since(seq: int = 0, limit: int = 1000, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Returns up to `limit` receipt changes with seq greater than `seq`, oldest
+    first: {"seq", "op": insert|update|delete, "bill_id", "owner_id",
+    "changed_at", "receipt"}. "receipt" is the receipt's current state
+    (None once deleted), archived receipts included. Pass the last seq back
+    in to read the next batch.
+    """
+    clauses, params = _owner_clause(owner, "c.owner_id")
+    where = " AND ".join(["c.seq > ?", *clauses])
+    cur = get_db().execute(
+        f"""
+        SELECT c.seq, c.op, c.bill_id AS change_bill_id, c.owner_id, c.changed_at,
+               r.bill_id, r.vendor, r.date, r.amount, r.tax, r.subtotal, r.category
+        FROM receipt_changes c
+        LEFT JOIN receipts r ON r.bill_id = c.bill_id AND r.owner_id = c.owner_id
+        WHERE {where}
+        ORDER BY c.seq LIMIT ?
+        """,
+        [int(seq), *params, int(limit)]
+    )
+    rows = cur.fetchall()
+    # Receipts missing from the hot partition may have been archived since
+    archived = _receipts_by_key(list(dict.fromkeys(
+        (r["owner_id"], r["change_bill_id"]) for r in rows if r["bill_id"] is None and r["op"] != "delete"
+    )))
+    return [
+        {
+            "seq": r["seq"],
+            "op": r["op"],
+            "bill_id": r["change_bill_id"],
+            "owner_id": r["owner_id"],
+            "changed_at": r["changed_at"],
+            "receipt": None if r["op"] == "delete" else (
+                _row_to_receipt(r) if r["bill_id"] is not None else archived.get((r["owner_id"], r["change_bill_id"]))
+            ),
+        }
+        for r in rows
+    ]
+
+
+def _receipts_by_key(keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Current state of the (owner_id, bill_id) receipts, read from every partition."""
+    found: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    # 2 parameters per key and partition
+    for chunk in _chunks(keys, SQL_CHUNK_SIZE // 2):
+        rows = _read_partitioned(
+            f"SELECT r.owner_id, {', '.join('r.' + f for f in RECEIPT_FIELDS.split(', '))} "
+            f"FROM (VALUES {', '.join('(?, ?)' for _ in chunk)}) k "
+            "JOIN {receipts} r ON r.owner_id = k.column1 AND r.bill_id = k.column2",
+            [value for key in chunk for value in key],
+        )
+        found.update(((r["owner_id"], r["bill_id"]), _row_to_receipt(r)) for r in rows)
+    return found
+
+
+def get_consumer_offset(consumer: str) -> int:
+    """Last change seq the named consumer has committed (0 if it never ran)."""
+    row = get_db().execute("SELECT seq FROM consumer_offsets WHERE consumer = ?", (consumer,)).fetchone()
+    return row["seq"] if row else 0
+
+
+def commit_consumer_offset(consumer: str, seq: int):
+    """Records that `consumer` has processed every change up to `seq`. Offsets never move backwards."""
+    with transaction() as db:
+        db.execute(
+            """
+            INSERT INTO consumer_offsets (consumer, seq) VALUES (?, ?)
+            ON CONFLICT(consumer) DO UPDATE SET
+                seq = max(seq, excluded.seq), updated_at = CURRENT_TIMESTAMP
+            """,
+            (consumer, int(seq))
+        )
+
+
+def pending_changes(consumer: str, limit: int = 1000, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Changes the named consumer has not committed yet (see changes_since)."""
+    return changes_since(get_consumer_offset(consumer), limit=limit, owner=owner)
+
+
+def prune_changes(before_seq: Optional[int] = None) -> int:
+    """
+    Deletes change-log entries every consumer has already processed
+    (seq <= the lowest committed offset), or up to `before_seq` if given.
+    Returns the number of entries removed.
+    """
+    with transaction() as db:
+        if before_seq is None:
+            row = db.execute("SELECT MIN(seq) FROM consumer_offsets").fetchone()
+            if row[0] is None:
+                return 0
+            before_seq = row[0]
+        cur = db.execute("DELETE FROM receipt_changes WHERE seq <= ?", (int(before_seq),))
+    return cur.rowcount
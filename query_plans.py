@@ -0,0 +1,336 @@
+"""
+Query-plan regression checks and latency benchmark for database/queries.py.
+
+Seeds synthetic databases (10k, 100k and 1M receipts by default, cached
+between runs, the oldest year moved to an archive partition), then calls
+every public read function with realistic arguments. Every SELECT a call issues is captured and checked with
+EXPLAIN QUERY PLAN: a SCAN of a real table (a full table or full index
+walk) fails the check unless the case allows it. Latency percentiles are
+compared with a JSON baseline so local runs flag regressions.
+
+    python -m database.query_plans                       # check and compare
+    python -m database.query_plans --sizes 10000 --update-baseline
+    python -m database.query_plans --plans-only          # skip timing
+
+Exits with status 1 on a plan failure or a latency regression.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+DEFAULT_WORKDIR = Path("bench_data")
+DEFAULT_BASELINE = Path("query_baseline.json")
+
+OWNERS = [f"user{i}@example.com" for i in range(20)]
+OWNER = OWNERS[3]
+CATEGORIES = ["Food", "Grocery", "Utility", "Medical", "Travel", "Shopping", "Entertainment", "Uncategorized"]
+VENDOR_WORDS = ["Fresh", "City", "Royal", "Green", "Star", "Metro", "Apollo", "Cafe", "Mart", "Kitchen", "Fuel", "Trends"]
+ITEM_NAMES = ["milk", "bread", "coffee", "rice", "petrol", "shirt", "tablet", "ticket", "eggs", "juice"]
+SEED_BATCH = 5000
+
+
+# ================= SYNTHETIC DATA =================
+def _vendors(rng: random.Random) -> List[str]:
+    return sorted({f"{rng.choice(VENDOR_WORDS)} {rng.choice(VENDOR_WORDS)} {i % 17}" for i in range(300)})
+
+
+def _synthetic_receipts(count: int, seed: int = 42):
+    """Receipts spread over 20 owners and the last three years, 0-3 items each."""
+    rng = random.Random(seed)
+    vendors = _vendors(rng)
+    start = date.today() - timedelta(days=3 * 365)
+    for i in range(count):
+        amount = round(rng.lognormvariate(6, 1), 2)
+        items = [
+            {"name": rng.choice(ITEM_NAMES), "qty": 1, "line_total": round(amount / 4, 2)}
+            for _ in range(rng.randint(0, 3))
+        ]
+        yield OWNERS[i % len(OWNERS)], {
+            "bill_id": f"SYN-{i:08d}",
+            "vendor": rng.choice(vendors),
+            "date": (start + timedelta(days=rng.randrange(3 * 365))).isoformat(),
+            "amount": amount,
+            "tax": round(amount * 0.05, 2),
+            "subtotal": round(amount * 0.95, 2),
+            "category": rng.choice(CATEGORIES),
+            "items": items,
+        }
+
+
+def _seed(count: int):
+    from database.queries import save_receipts_bulk, save_ocr_text
+    by_owner: Dict[str, List[Dict[str, Any]]] = {}
+    done = 0
+    for owner, record in _synthetic_receipts(count):
+        by_owner.setdefault(owner, []).append(record)
+        done += 1
+        if done % SEED_BATCH == 0 or done == count:
+            for batch_owner, records in by_owner.items():
+                save_receipts_bulk(records, owner=batch_owner)
+            by_owner.clear()
+            print(f"  seeded {done}/{count}", end="\r", flush=True)
+    for i in range(0, count, 97):
+        save_ocr_text(f"SYN-{i:08d}", f"Receipt SYN-{i:08d}\nTotal 100.00\n", owner=OWNERS[i % len(OWNERS)])
+    print()
+
+
+def _seed_archive():
+    """Moves the oldest seeded year into an archive_YYYY partition so partitioned reads are checked."""
+    from database.db import archive_receipts
+    archive_receipts(date.today().year - 2, progress=lambda *args: None)
+
+
+# ================= CASES =================
+class Case(NamedTuple):
+    name: str
+    call: Callable[[], Any]
+    # Tables this case may legitimately read in full
+    scans: Tuple[str, ...] = ()
+
+
+def _cases() -> List[Case]:
+    from database import queries as q
+    from database.db import archived_years
+    today = date.today()
+    start, end = (today - timedelta(days=90)).isoformat(), today.isoformat()
+    month = today.strftime("%Y-%m")
+    year = archived_years()[0]
+    archive_start, archive_end = f"{year}-01-01", f"{year + 1}-12-31"
+    sample = q.fetch_receipts_page(limit=1, owner=OWNER)[0]
+    archived = q.fetch_receipts_page(limit=1, owner=OWNER, start_date=f"{year}-01-01", end_date=f"{year}-12-31")[0]
+    page = q.fetch_receipts_page(limit=50, owner=OWNER)
+    cursor = (page[-1]["date"], page[-1]["bill_id"])
+    probes = [{"vendor": sample["vendor"], "date": sample["date"], "amount": sample["amount"] + i} for i in range(50)]
+    archived_probes = [
+        {"vendor": archived["vendor"], "date": archived["date"], "amount": archived["amount"] + i} for i in range(50)
+    ]
+    seq = max(0, q.changes_since(0, limit=1)[0]["seq"] if q.changes_since(0, limit=1) else 0)
+
+    return [
+        Case("receipt_exists", lambda: q.receipt_exists(sample["bill_id"], None)),
+        Case("receipt_exists_owner", lambda: q.receipt_exists(sample["bill_id"], owner=OWNER)),
+        Case("check_receipt_duplicate", lambda: q.check_receipt_duplicate(
+            "NEW-1", sample["vendor"], sample["date"], sample["amount"], owner=OWNER)),
+        Case("find_fingerprint_duplicates_50", lambda: q.find_fingerprint_duplicates(probes, owner=OWNER)),
+        Case("find_fingerprint_duplicates_archived_50", lambda: q.find_fingerprint_duplicates(
+            archived_probes, owner=OWNER)),
+        Case("get_receipt_by_id", lambda: q.get_receipt_by_id(sample["bill_id"], owner=OWNER)),
+        Case("get_receipt_items", lambda: q.get_receipt_items(sample["bill_id"], owner=OWNER)),
+        Case("fetch_receipts_page", lambda: q.fetch_receipts_page(limit=50, owner=OWNER)),
+        Case("fetch_receipts_page_after", lambda: q.fetch_receipts_page(after=cursor, limit=50, owner=OWNER)),
+        Case("fetch_receipts_page_range", lambda: q.fetch_receipts_page(
+            limit=50, owner=OWNER, start_date=start, end_date=end)),
+        # Spans the archive and the hot partition (UNION ALL)
+        Case("fetch_receipts_page_archive_range", lambda: q.fetch_receipts_page(
+            limit=50, owner=OWNER, start_date=archive_start, end_date=archive_end)),
+        Case("iter_receipts", lambda: list(q.iter_receipts(limit=500, chunk_size=200, owner=OWNER))),
+        Case("iter_receipt_chunks", lambda: list(itertools.islice(
+            q.iter_receipt_chunks(chunk_size=200, owner=OWNER), 3))),
+        Case("count_receipts_owner", lambda: q.count_receipts(owner=OWNER)),
+        Case("count_receipts_range", lambda: q.count_receipts(owner=OWNER, start_date=start, end_date=end)),
+        Case("count_receipts_archive_range", lambda: q.count_receipts(
+            owner=OWNER, start_date=archive_start, end_date=archive_end)),
+        Case("search_vendor", lambda: q.search_receipts(vendor=sample["vendor"].split()[0], owner=OWNER)),
+        Case("search_category_range", lambda: q.search_receipts(
+            category=sample["category"], start_date=start, end_date=end, owner=OWNER)),
+        Case("search_amount_range", lambda: q.search_receipts(
+            start_date=start, end_date=end, min_amount=100, max_amount=500, owner=OWNER)),
+        Case("search_fulltext", lambda: q.search_receipts_fulltext("coffee", limit=50, owner=OWNER)),
+        Case("fetch_receipts_frame_range", lambda: q.fetch_receipts_frame(
+            {"start_date": start, "end_date": end}, owner=OWNER)),
+        Case("fetch_receipts_frame_owner", lambda: q.fetch_receipts_frame(owner=OWNER)),
+        Case("get_spend_summary", lambda: q.get_spend_summary(start, end, owner=OWNER)),
+        Case("get_daily_totals", lambda: q.get_daily_totals(start, end, owner=OWNER)),
+        Case("get_monthly_totals", lambda: q.get_monthly_totals(owner=OWNER)),
+        Case("get_month_spend", lambda: q.get_month_spend(month, owner=OWNER)),
+        Case("get_category_totals", lambda: q.get_category_totals(start, end, owner=OWNER)),
+        Case("get_vendor_totals", lambda: q.get_vendor_totals(start, end, limit=10, owner=OWNER)),
+        Case("get_item_spend_prefix", lambda: q.get_item_spend(name="cof")),
+        # Per-owner item spend groups every item of the owner's receipts
+        Case("get_item_spend_owner_range", lambda: q.get_item_spend(start_date=start, end_date=end, owner=OWNER)),
+        Case("changes_since", lambda: q.changes_since(seq, limit=500, owner=OWNER)),
+        Case("pending_changes", lambda: q.pending_changes("query_plans", limit=500, owner=OWNER)),
+        Case("iter_ocr_text_batches", lambda: next(q.iter_ocr_text_batches(100, owner=OWNER), None)),
+        Case("get_ocr_text", lambda: q.get_ocr_text("SYN-00000000", owner=OWNERS[0])),
+        Case("get_receipt_images", lambda: q.get_receipt_images(sample["bill_id"], owner=OWNER)),
+        # Unscoped full reads are full scans by definition
+        Case("count_receipts_all", lambda: q.count_receipts(), scans=("receipts",)),
+        Case("get_monthly_totals_all", lambda: q.get_monthly_totals(), scans=("spend_by_month",)),
+    ]
+
+
+# ================= PLAN CHECKS =================
+_SCAN = re.compile(r"^SCAN (?:\w+\.)?(\w+)")
+# FROM/JOIN table [AS] alias, so plan lines naming an alias map to the table
+_TABLE_ALIAS = re.compile(r"\b(?:FROM|JOIN)\s+(?:\w+\.)?(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+
+
+def _real_tables(db) -> set:
+    """Ordinary tables, excluding full-text virtual tables and their shadow tables."""
+    rows = db.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table'").fetchall()
+    virtual = [name for name, sql in rows if (sql or "").upper().startswith("CREATE VIRTUAL")]
+    return {
+        name for name, sql in rows
+        if name not in virtual and not any(name.startswith(f"{v}_") for v in virtual)
+    }
+
+
+def capture_statements(call: Callable[[], Any]) -> List[str]:
+    """Runs `call` and returns the SELECTs it issued, with parameters inlined."""
+    from database.db import get_db
+    db = get_db()
+    statements: List[str] = []
+    db.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        db.set_trace_callback(None)
+    return [s for s in statements if s.lstrip().upper().startswith(("SELECT", "WITH"))]
+
+
+def check_plan(case: Case, tables: set) -> List[str]:
+    """Returns one message per disallowed full scan in the case's query plans."""
+    from database.db import get_db
+    db = get_db()
+    problems = []
+    for sql in capture_statements(case.call):
+        aliases = {alias: table for table, alias in _TABLE_ALIAS.findall(sql) if alias}
+        plan = [r[3] for r in db.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        for detail in plan:
+            m = _SCAN.match(detail)
+            table = m and aliases.get(m.group(1), m.group(1))
+            if table in tables and table not in case.scans:
+                problems.append(f"{detail}  <-  {' '.join(sql.split())[:160]}")
+    return problems
+
+
+# ================= LATENCY =================
+def _percentile(sorted_ms: Sequence[float], pct: float) -> float:
+    index = min(len(sorted_ms) - 1, max(0, round(pct / 100 * len(sorted_ms)) - 1))
+    return sorted_ms[index]
+
+
+def measure(call: Callable[[], Any], repeat: int, warmup: int = 3) -> Dict[str, float]:
+    for _ in range(warmup):
+        call()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {f"p{p}_ms": round(_percentile(timings, p), 3) for p in (50, 95, 99)}
+
+
+def regressions(
+    current: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+    min_delta_ms: float
+) -> List[str]:
+    """Cases whose p95 grew by more than `tolerance`x and `min_delta_ms`."""
+    found = []
+    for name, stats in current.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if stats["p95_ms"] > before["p95_ms"] * tolerance and stats["p95_ms"] - before["p95_ms"] > min_delta_ms:
+            found.append(f"{name}: p95 {before['p95_ms']:.2f} ms -> {stats['p95_ms']:.2f} ms")
+    return found
+
+
+# ================= DRIVER =================
+def run_size(size: int, workdir: Path, repeat: int, plans_only: bool) -> Tuple[List[str], Dict[str, Dict[str, float]]]:
+    """
+    Runs every case against the cached `size`-row database in a child
+    process (DB_PATH is fixed at import time). Returns (plan problems,
+    latency stats per case).
+    """
+    import subprocess
+    db_path = workdir / f"receipts_{size}.db"
+    env = dict(os.environ, RECEIPTS_DB_PATH=str(db_path))
+    args = [sys.executable, "-m", "database.query_plans", "--worker", str(size), "--repeat", str(repeat)]
+    if plans_only:
+        args.append("--plans-only")
+    out = subprocess.run(args, env=env, stdout=subprocess.PIPE, check=True, cwd=os.getcwd()).stdout
+    result = json.loads(out.decode().strip().splitlines()[-1])
+    return result["problems"], result["latency"]
+
+
+def _worker(size: int, repeat: int, plans_only: bool):
+    from database.db import init_db, get_db, archived_years
+    from database.queries import count_receipts
+    workdir = Path(os.environ["RECEIPTS_DB_PATH"]).parent
+    workdir.mkdir(parents=True, exist_ok=True)
+    init_db()
+    if count_receipts() < size:
+        print(f"seeding {size} receipts into {os.environ['RECEIPTS_DB_PATH']}", file=sys.stderr)
+        _seed(size)
+    if not archived_years():
+        # Also covers databases cached before archives were seeded
+        _seed_archive()
+        get_db().execute("ANALYZE")
+        get_db().commit()
+
+    tables = _real_tables(get_db())
+    problems: List[str] = []
+    latency: Dict[str, Dict[str, float]] = {}
+    for case in _cases():
+        problems.extend(f"{case.name}: {p}" for p in check_plan(case, tables))
+        if not plans_only:
+            latency[case.name] = measure(case.call, repeat)
+    print(json.dumps({"problems": problems, "latency": latency}))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN checks and latency baseline for database/queries.py")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--workdir", type=Path, default=DEFAULT_WORKDIR, help="where seeded databases are cached")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed p95 growth factor")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore p95 growth below this")
+    parser.add_argument("--plans-only", action="store_true")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        _worker(args.worker, args.repeat, args.plans_only)
+        return 0
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    failed = False
+    for size in args.sizes:
+        problems, latency = run_size(size, args.workdir, args.repeat, args.plans_only)
+        print(f"== {size:,} receipts")
+        for problem in problems:
+            print(f"  PLAN  {problem}")
+        for name, stats in latency.items():
+            print(f"  {name:<32} p50 {stats['p50_ms']:8.2f}  p95 {stats['p95_ms']:8.2f}  p99 {stats['p99_ms']:8.2f} ms")
+        slow = regressions(latency, baseline.get(str(size), {}), args.tolerance, args.min_delta_ms)
+        for line in slow:
+            print(f"  SLOWER  {line}")
+        failed = failed or bool(problems) or bool(slow)
+        if args.update_baseline and latency:
+            baseline[str(size)] = latency
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True))
+        print(f"baseline written to {args.baseline}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
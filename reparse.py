@@ -0,0 +1,195 @@
+"""
+Re-runs the current receipt parser over the raw OCR text stored for every
+receipt, so parser and template fixes reach existing receipts without
+re-running OCR.
+
+    python -m ocr.reparse                         # dry run, prints the diff report
+    python -m ocr.reparse --report diff.csv       # also write the report as CSV
+    python -m ocr.reparse --apply                 # write the changes
+    python -m ocr.reparse --fields vendor,amount  # re-parse these fields instead
+
+Only fields users cannot edit in the dashboard (date, subtotal and line
+items) are re-parsed by default, so hand corrections of vendor, category,
+amount and tax survive; list those in --fields to overwrite them anyway.
+Receipts whose text has no readable date keep their stored date.
+"""
+import argparse
+import csv
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ocr.text_parser import parse_receipt
+from database.db import init_db, to_cents, iso_date
+from database.queries import iter_ocr_text_batches, update_receipts
+
+logger = logging.getLogger(__name__)
+
+# Receipt fields compared and rewritten (bill_id is the key and never changes)
+REPARSED_FIELDS = ("vendor", "date", "amount", "tax", "subtotal", "category")
+MONEY_FIELDS = ("amount", "tax", "subtotal")
+# Fields the dashboard lets users correct by hand
+EDITABLE_FIELDS = ("vendor", "category", "amount", "tax")
+# Re-parsed unless --fields says otherwise; "items" stands for the line items
+DEFAULT_FIELDS = tuple(f for f in REPARSED_FIELDS if f not in EDITABLE_FIELDS) + ("items",)
+
+
+# ---------- HELPERS ----------
+
+def _parse(text: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    # Runs in the worker processes; no today's-date fallback, see diff_receipt
+    return parse_receipt(text, date_fallback=False)
+
+
+def _normalized(field: str, value: Any) -> Any:
+    if field in MONEY_FIELDS:
+        return to_cents(value or 0)
+    if field == "date":
+        return iso_date(value)
+    return str(value or "").strip()
+
+
+def _item_key(items: List[Dict[str, Any]]) -> List[Tuple[str, int]]:
+    keys = []
+    for item in items:
+        name = item.get("name") or item.get("Item")
+        total = item.get("line_total", item.get("Price"))
+        if name and total is not None:
+            keys.append((str(name).strip().lower(), to_cents(total)))
+    return keys
+
+
+def diff_receipt(
+    receipt: Dict[str, Any],
+    items: List[Dict[str, Any]],
+    parsed: Dict[str, Any],
+    parsed_items: List[Dict[str, Any]],
+    fields: Iterable[str] = DEFAULT_FIELDS
+) -> Dict[str, Tuple[Any, Any]]:
+    """
+    Returns {field: (stored, reparsed)} for every one of `fields` whose
+    value would change; "items" is included when the line items differ.
+    A date the parser did not find (None) is not a change.
+    """
+    changed = {}
+    for field in REPARSED_FIELDS:
+        if field not in fields or (field == "date" and parsed.get(field) is None):
+            continue
+        if _normalized(field, receipt.get(field)) != _normalized(field, parsed.get(field)):
+            changed[field] = (receipt.get(field), parsed.get(field))
+    if "items" in fields and _item_key(items) != _item_key(parsed_items):
+        changed["items"] = (len(items), len(parsed_items))
+    return changed
+
+
+# ---------- RE-PARSE JOB ----------
+
+def reparse_receipts(
+    apply: bool = False,
+    owner: Optional[str] = None,
+    workers: Optional[int] = None,
+    batch_size: int = 1000,
+    progress: Optional[Callable[[int, int], None]] = None,
+    fields: Iterable[str] = DEFAULT_FIELDS
+) -> List[Dict[str, Any]]:
+    """
+    Parses the stored OCR text of every hot receipt in a process pool,
+    batch by batch, and compares `fields` (see DEFAULT_FIELDS) with the
+    stored values. With apply=True each batch's changes are written with
+    one update_receipts() call per owner.
+    `progress(parsed, changed)` is called after every batch.
+
+    Returns the diff report: one {"owner", "bill_id", "field", "old", "new"}
+    row per changed field.
+    """
+    fields = tuple(fields)
+    unknown = set(fields) - set(REPARSED_FIELDS) - {"items"}
+    if unknown:
+        raise ValueError(f"Cannot re-parse field(s): {', '.join(sorted(unknown))}")
+    report: List[Dict[str, Any]] = []
+    parsed_count = 0
+    changed_count = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch in iter_ocr_text_batches(batch_size, owner=owner):
+            chunksize = max(1, len(batch) // ((workers or os.cpu_count() or 1) * 4))
+            results = pool.map(_parse, [entry["text"] for entry in batch], chunksize=chunksize)
+
+            # Bill IDs are only unique per owner, so updates are grouped by owner
+            changes: Dict[str, Dict[str, Dict[str, Any]]] = {}
+            new_items: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+            for entry, (parsed, parsed_items) in zip(batch, results):
+                changed = diff_receipt(entry["receipt"], entry["items"], parsed, parsed_items, fields)
+                if not changed:
+                    continue
+                changed_count += 1
+                for field, (old, new) in changed.items():
+                    report.append({
+                        "owner": entry["owner"], "bill_id": entry["bill_id"], "field": field, "old": old, "new": new
+                    })
+                changes.setdefault(entry["owner"], {})[entry["bill_id"]] = {
+                    f: parsed.get(f) for f in changed if f != "items"
+                }
+                if "items" in changed:
+                    new_items.setdefault(entry["owner"], {})[entry["bill_id"]] = parsed_items
+
+            if apply:
+                for entry_owner, owner_changes in changes.items():
+                    update_receipts(owner_changes, owner=entry_owner, items=new_items.get(entry_owner))
+            parsed_count += len(batch)
+            if progress:
+                progress(parsed_count, changed_count)
+
+    return report
+
+
+def write_report(report: List[Dict[str, Any]], path: str):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["owner", "bill_id", "field", "old", "new"])
+        writer.writeheader()
+        writer.writerows(report)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Re-parse stored OCR text with the current parser.")
+    parser.add_argument("--apply", action="store_true", help="write the changes (default: dry run)")
+    parser.add_argument("--owner", help="only re-parse this user's receipts")
+    parser.add_argument("--workers", type=int, help="parser processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--fields",
+        default=",".join(DEFAULT_FIELDS),
+        help=f"comma-separated fields to re-parse, from {', '.join(REPARSED_FIELDS)}, items "
+             f"(default: {','.join(DEFAULT_FIELDS)}; the others may hold hand corrections)"
+    )
+    parser.add_argument("--report", help="write the diff report to this CSV file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    init_db()
+    report = reparse_receipts(
+        apply=args.apply,
+        owner=args.owner,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        fields=[f.strip() for f in args.fields.split(",") if f.strip()],
+        progress=lambda parsed, changed: logger.info("parsed %d receipts, %d changed", parsed, changed),
+    )
+
+    by_field: Dict[str, int] = {}
+    for row in report:
+        by_field[row["field"]] = by_field.get(row["field"], 0) + 1
+    for field, count in sorted(by_field.items()):
+        logger.info("%-10s %d changed", field, count)
+    if args.report:
+        write_report(report, args.report)
+        logger.info("diff report written to %s", args.report)
+    if not args.apply and report:
+        logger.info("dry run: re-run with --apply to write the changes")
+
+
+if __name__ == "__main__":
+    main()
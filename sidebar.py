@@ -6,6 +6,7 @@ from config.translations import get_text, get_available_languages  # type: ignor
 def render_sidebar():
     """Render sidebar with navigation and settings"""
     lang = st.session_state.get("language", "en")
+    owner = st.session_state.get("user_email")
     
     with st.sidebar:
         # App branding
@@ -91,7 +92,7 @@ def render_sidebar():
         with st.expander(f"⚙️ {get_text(lang, 'settings')}"):
             if st.button("🗑 Clear All Data", type="secondary", use_container_width=True):
                 if st.session_state.get("confirm_delete", False):
-                    clear_all_receipts()
+                    clear_all_receipts(owner=owner)
                     st.toast("All receipts deleted!", icon="🗑")
                     st.session_state["confirm_delete"] = False
                     st.rerun()
@@ -114,21 +115,12 @@ def render_sidebar():
         # BUDGET LIMIT TRACKER
         st.markdown("### 💰 Monthly Budget")
         
-        # Get current month spending
-        from database.queries import fetch_all_receipts
+        # Get current month spending (single-row rollup lookup)
+        from database.queries import get_month_spend
         from datetime import datetime
-        import pandas as pd
         
-        receipts = fetch_all_receipts()
         current_month = datetime.now().strftime("%Y-%m")
-        
-        if receipts:
-            df = pd.DataFrame(receipts)
-            df["date"] = pd.to_datetime(df["date"])
-            current_month_df = df[df["date"].dt.strftime("%Y-%m") == current_month]
-            current_spend = current_month_df["amount"].sum()
-        else:
-            current_spend = 0
+        current_spend = get_month_spend(current_month, owner=owner)
         
         # Budget input
         budget_limit = st.number_input(
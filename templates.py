@@ -1,6 +1,51 @@
+"""
+Vendor layout templates.
+
+Templates are loaded from the JSON (or, with PyYAML installed, YAML) files
+in TEMPLATE_DIR, each holding one template object or a list of them;
+files are read in name order and the first template whose vendor_pattern
+matches a receipt wins. The directory is re-checked at most every
+RELOAD_CHECK_INTERVAL seconds and reloaded when a file is added, removed
+or changed; a broken edit is logged and the previous templates stay in use.
+
+Matching does not try every vendor pattern: templates are indexed by
+keywords (given in the file, or taken from a plain-literal vendor
+pattern such as "(?i)walmart"), one trie regex finds the keywords present
+in the text in a single pass, and only those templates, plus any without
+keywords, have their vendor pattern checked.
+"""
+import hashlib
+import json
+import logging
 import re
-from dataclasses import dataclass
-from typing import List, Optional, Pattern
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+from config.config import TEMPLATE_DIR  # type: ignore
+from utils.helpers import keyword_trie_pattern  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+RELOAD_CHECK_INTERVAL = 2.0                # seconds between directory checks
+TEMPLATE_SUFFIXES = (".json", ".yaml", ".yml")
+FIELD_PATTERNS = ("bill_id", "date", "total", "tax", "line_item")
+
+_LEADING_FLAGS = re.compile(r"^\(\?([aiLmsu]+)\)")
+_REGEX_SPECIAL = set(".^$*+?{}[]\\|()")
+
+
+def _literal_keywords(vendor_pattern: str) -> List[str]:
+    """[the literal] for patterns like "(?i)walmart", else [] (not indexable)."""
+    m = _LEADING_FLAGS.match(vendor_pattern)
+    body = vendor_pattern[m.end():] if m else vendor_pattern
+    if not body or _REGEX_SPECIAL.intersection(body):
+        return []
+    return [body.casefold()]
+
 
 @dataclass
 class ReceiptTemplate:
@@ -14,44 +59,198 @@ class ReceiptTemplate:
     tax_pattern: Optional[str] = None
     bill_id_pattern: Optional[str] = None
     line_item_pattern: Optional[str] = None
+    # Words (case-insensitive) of which every text the vendor pattern matches
+    # contains at least one; derived from literal vendor patterns if omitted
+    keywords: Optional[List[str]] = None
+    source: str = ""
+    _compiled: Dict[str, Pattern] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._compiled["vendor"] = re.compile(self.vendor_pattern)
+        for name in FIELD_PATTERNS:
+            pattern = getattr(self, f"{name}_pattern")
+            if pattern:
+                self._compiled[name] = re.compile(pattern)
+        if self.keywords is None:
+            self.keywords = _literal_keywords(self.vendor_pattern)
+
+    def matches(self, text: str) -> bool:
+        return self._compiled["vendor"].search(text) is not None
+
+    def search(self, field_name: str, text: str) -> Optional[re.Match]:
+        """Match of the `<field_name>_pattern` in text; None if there is no such pattern or no match."""
+        pattern = self._compiled.get(field_name)
+        return pattern.search(text) if pattern else None
+
+
+class TemplateRegistry:
+    """An immutable, indexed set of templates; safe to share between threads."""
+
+    def __init__(self, templates: List[ReceiptTemplate], signature: Tuple = (), digest: str = ""):
+        self.templates = templates
+        self.signature = signature
+        self.digest = digest
+        self.loaded_at = time.time()
+
+        index: Dict[str, set] = {}
+        self.unindexed: List[int] = []
+        for position, template in enumerate(templates):
+            if template.keywords:
+                for keyword in template.keywords:
+                    index.setdefault(keyword.casefold(), set()).add(position)
+            else:
+                self.unindexed.append(position)
+        # The trie regex reports the longest keyword at a position; shorter
+        # keywords that are its prefixes start there too
+        self._candidates: Dict[str, frozenset] = {
+            keyword: frozenset().union(*(index[keyword[:end]] for end in range(1, len(keyword) + 1) if keyword[:end] in index))
+            for keyword in index
+        }
+        self._keywords = re.compile(f"(?=({keyword_trie_pattern(sorted(index))}))") if index else None
+
+    def candidates(self, text: str) -> List[int]:
+        """Positions of the templates whose vendor pattern can match `text`, in priority order."""
+        found = set(self.unindexed)
+        if self._keywords is not None:
+            for m in self._keywords.finditer(text.casefold()):
+                found |= self._candidates[m.group(1)]
+        return sorted(found)
 
-# Define common templates
-TEMPLATES: List[ReceiptTemplate] = [
-    ReceiptTemplate(
-        name="Walmart",
-        vendor_pattern=r"(?i)walmart",
-        date_pattern=r"(\d{2}/\d{2}/\d{2,4})",  # MM/DD/YY
-        total_pattern=r"(?i)\btotal\s+due\s+\$?\s*(\d+\.\d{2})",
-        tax_pattern=r"(?i)tax\s+\d+\s*\$?\s*(\d+\.\d{2})",
-        bill_id_pattern=r"(?i)tc#\s*(\d+)"
-    ),
-    ReceiptTemplate(
-        name="Target",
-        vendor_pattern=r"(?i)target",
-        date_pattern=r"(\d{2}/\d{2}/\d{4})",
-        total_pattern=r"(?i)\btotal\s+\$?\s*(\d+\.\d{2})",
-        bill_id_pattern=r"(?i)receipt#\s*([a-zA-Z0-9-]+)"
-    ),
-    ReceiptTemplate(
-        name="Costco",
-        vendor_pattern=r"(?i)costco",
-        date_pattern=r"(\d{2}/\d{2}/\d{4})",
-        total_pattern=r"(?i)total\s+owned\s+\$?\s*(\d+\.\d{2})",
-    ),
-    ReceiptTemplate(
-        name="Amazon",
-        vendor_pattern=r"(?i)amazon",
-        date_pattern=r"(?i)shipped on\s+(\w+\s+\d{1,2},\s+\d{4})",
-        total_pattern=r"(?i)grand total:\s*\$?\s*(\d+\.\d{2})",
-        bill_id_pattern=r"(?i)order #\s*([0-9-]{10,})",
-    ),
-    # Generic fallback templates if needed
-]
+    def match(self, text: str) -> Tuple[Optional[ReceiptTemplate], int]:
+        """(first matching template or None, number of vendor patterns tried)."""
+        tried = 0
+        for position in self.candidates(text):
+            tried += 1
+            if self.templates[position].matches(text):
+                return self.templates[position], tried
+        return None, tried
+
+
+# ================= LOADING =================
+def _template_files(directory: Path) -> List[Path]:
+    if not directory.is_dir():
+        return []
+    return sorted(p for p in directory.iterdir() if p.suffix.lower() in TEMPLATE_SUFFIXES and p.is_file())
+
+
+def _signature(directory: Path) -> Tuple:
+    """Changes whenever a template file is added, removed or modified."""
+    signature = []
+    for path in _template_files(directory):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        signature.append((path.name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _parse_file(path: Path, raw: bytes) -> List[Dict[str, Any]]:
+    if path.suffix.lower() == ".json":
+        data = json.loads(raw.decode("utf-8"))
+    else:
+        try:
+            import yaml  # type: ignore
+        except ImportError:
+            raise ValueError(f"{path.name}: PyYAML is required for YAML templates")
+        data = yaml.safe_load(raw)
+    if data is None:
+        return []
+    return data if isinstance(data, list) else [data]
+
+
+def load_templates(directory: Optional[Path] = None) -> TemplateRegistry:
+    """Reads every template file in `directory` (TEMPLATE_DIR); raises ValueError on an invalid file."""
+    directory = Path(directory or TEMPLATE_DIR)
+    signature = _signature(directory)
+    sha = hashlib.sha256()
+    templates: List[ReceiptTemplate] = []
+    seen: Dict[str, str] = {}
+    for path in _template_files(directory):
+        raw = path.read_bytes()
+        sha.update(path.name.encode() + b"\0" + raw)
+        try:
+            entries = _parse_file(path, raw)
+            for entry in entries:
+                template = ReceiptTemplate(**entry, source=path.name)
+                if template.name in seen:
+                    raise ValueError(f"template {template.name!r} is already defined in {seen[template.name]}")
+                seen[template.name] = path.name
+                templates.append(template)
+        except (TypeError, ValueError, re.error) as e:
+            raise ValueError(f"{path.name}: {e}") from e
+    return TemplateRegistry(templates, signature, sha.hexdigest())
+
+
+# ================= ACTIVE REGISTRY =================
+_registry: Optional[TemplateRegistry] = None
+_registry_lock = threading.Lock()
+_last_check = 0.0
+_rejected_signature: Optional[Tuple] = None
+
+_stats_lock = threading.Lock()
+_matches: Counter = Counter()
+_misses = 0
+_patterns_tried = 0
+
+
+def get_template_registry() -> TemplateRegistry:
+    """The loaded templates, reloaded first if the template files changed."""
+    global _registry, _last_check, _rejected_signature
+    now = time.monotonic()
+    if _registry is not None and now - _last_check < RELOAD_CHECK_INTERVAL:
+        return _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = load_templates()
+        elif now - _last_check >= RELOAD_CHECK_INTERVAL:
+            signature = _signature(Path(TEMPLATE_DIR))
+            if signature not in (_registry.signature, _rejected_signature):
+                try:
+                    _registry = load_templates()
+                    logger.info("Reloaded %d receipt templates", len(_registry.templates))
+                except (OSError, ValueError):
+                    # Keep matching with the previous templates until the file is fixed
+                    _rejected_signature = signature
+                    logger.exception("Template reload failed; keeping the previous templates")
+        _last_check = now
+    return _registry
+
+
+def reload_templates() -> TemplateRegistry:
+    """Loads the template files now, regardless of the reload interval."""
+    global _registry, _last_check
+    registry = load_templates()
+    with _registry_lock:
+        _registry = registry
+        _last_check = time.monotonic()
+    return registry
 
 
 def get_matching_template(text: str) -> Optional[ReceiptTemplate]:
     """Finds the first template that matches the vendor pattern in the text."""
-    for tmpl in TEMPLATES:
-        if re.search(tmpl.vendor_pattern, text):
-            return tmpl
-    return None
+    global _misses, _patterns_tried
+    template, tried = get_template_registry().match(text)
+    with _stats_lock:
+        _patterns_tried += tried
+        if template is None:
+            _misses += 1
+        else:
+            _matches[template.name] += 1
+    return template
+
+
+def template_stats() -> Dict[str, Any]:
+    """How often each template fired since start-up, and what matching cost."""
+    registry = get_template_registry()
+    with _stats_lock:
+        lookups = sum(_matches.values()) + _misses
+        return {
+            "templates": len(registry.templates),
+            "unindexed": len(registry.unindexed),
+            "loaded_at": registry.loaded_at,
+            "lookups": lookups,
+            "misses": _misses,
+            "matches": dict(_matches.most_common()),
+            "patterns_tried_per_lookup": _patterns_tried / lookups if lookups else 0.0,
+        }
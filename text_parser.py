@@ -2,6 +2,67 @@ import re
 from datetime import datetime
 import random
 
+from ocr.category_classifier import categorize
+from ocr.templates import get_matching_template
+
+# Bump whenever parse_receipt output changes for the same text, so cached
+# extraction results (ocr/extraction_cache.py) are not reused
+PARSER_VERSION = 3
+
+
+# ---------- PATTERNS ----------
+# Compiled once at import: bulk re-parses call parse_receipt millions of times
+
+_NUMBER = re.compile(r"\d+[.,]?\d*")
+_QUANTITY = re.compile(r"\d+\s*x\s*\d+")
+_ITEM_LINE = re.compile(r"(.+?)\s+(\d+[.,]?\d*)$")
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+_DATE_PATTERNS = (
+    re.compile(r"\b(\d{4}-\d{2}-\d{2})\b"),          # 2024-01-27
+    re.compile(r"\b(\d{2}/\d{2}/\d{4})\b"),          # 27/01/2024
+    re.compile(r"\b(\d{2}-\d{2}-\d{4})\b"),          # 27-01-2024
+)
+# Month-name dates captured by vendor templates
+_MONTH_NAME_FORMATS = ("%B %d, %Y", "%b %d, %Y", "%d %B %Y", "%d %b %Y")  # March 5, 2024 / 5 Mar 2024
+
+# Reordered and added word boundaries to prevent partial matches like 'action' from 'Transaction'
+_BILL_PREFIXES = r"(?:transaction|invoice|receipt|order|ticket|bill|inv|rec|txn|trans)"
+_BILL_PATTERNS = (
+    re.compile(rf"(?i)\b{_BILL_PREFIXES}\b\s*(?:no|id|number|#)?\s*[:.-]?\s*([a-zA-Z0-9/-]+)"),
+    re.compile(r"(?i)#\s*([a-zA-Z0-9/-]+)"),
+    re.compile(r"(?i)\b(?:inv|rec|txn)\b\s*[:.-]?\s*([a-zA-Z0-9/-]+)"),
+)
+
+# ---------- LINE CLASSIFIER ----------
+# One scan per line finds every tag keyword (whole words, as the \b...\b
+# rules they replace); the group name is the tag. No keyword belongs to
+# two groups, and "sub total" is found as "sub" so that "total" is still
+# seen as a word of its own. The lookahead on the keywords' first letters
+# rejects most positions before the alternation is tried.
+BILL_ID, TOTAL, TAX, SUBTOTAL, ITEM = 1, 2, 4, 8, 16
+
+_LINE_KEYWORDS_PATTERN = (
+    r"\b(?=[bcdginoprstv])(?:"
+    r"(?P<bill_id>transaction|invoice|receipt|order|ticket|bill|inv|rec|txn|trans)"
+    r"|(?P<total>total|tot|due|payable)"
+    r"|(?P<tax>tax|gst|vat|cgst|sgst)"
+    r"|(?P<subtotal>subtotal|subttl|subtot|stot|net\s*amount|net\s*amt|taxable|sub)"
+    r")\b"
+)
+# Substrings (not whole words) that rule a line out as an item
+_NON_ITEM_PATTERN = r"total|subtotal|subttl|tax|vat|gst|change|cash|card|due"
+
+# ASCII lines are matched lowercased with case-sensitive patterns, several
+# times faster than IGNORECASE; other lines keep Unicode case folding
+# (IGNORECASE also matches e.g. the long s to "s", lower() does not).
+_LINE_KEYWORDS = re.compile(_LINE_KEYWORDS_PATTERN)
+_LINE_KEYWORDS_FOLD = re.compile(_LINE_KEYWORDS_PATTERN, re.IGNORECASE)
+_NON_ITEM = re.compile(_NON_ITEM_PATTERN)
+_NON_ITEM_FOLD = re.compile(_NON_ITEM_PATTERN, re.IGNORECASE)
+_TAG_BITS = {"bill_id": BILL_ID, "total": TOTAL, "tax": TAX, "subtotal": SUBTOTAL}
+
+_GENERIC_HEADERS = frozenset({"tax invoice", "cash receipt", "bill of supply", "estimate", "original", "trans"})
 
 # ---------- HELPERS ----------
 
@@ -26,18 +87,13 @@ def _default_bill_id():
     return f"BILL-{random.randint(100000, 999999)}"
 
 
-def _extract_date(text):
+def _extract_date(text, fallback=True):
     """
-    NLP-style date extraction (multiple formats)
+    NLP-style date extraction (multiple formats).
+    Without a match returns today's date, or None with fallback=False.
     """
-    patterns = [
-        r"\b(\d{4}-\d{2}-\d{2})\b",          # 2024-01-27
-        r"\b(\d{2}/\d{2}/\d{4})\b",          # 27/01/2024
-        r"\b(\d{2}-\d{2}-\d{4})\b",          # 27-01-2024
-    ]
-
-    for p in patterns:
-        m = re.search(p, text)
+    for p in _DATE_PATTERNS:
+        m = p.search(text)
         if m:
             raw = m.group(1)
             try:
@@ -49,17 +105,84 @@ def _extract_date(text):
                 pass
 
     # fallback → today
-    return datetime.today().strftime("%Y-%m-%d")
+    return datetime.today().strftime("%Y-%m-%d") if fallback else None
 
 
-from ocr.templates import get_matching_template
+def apply_date_fallback(data):
+    """
+    Gives a parse_receipt(date_fallback=False) result today's date if it
+    has none. Cached parse results keep the date missing, so the fallback
+    is applied on the day they are used.
+    """
+    if data and not data.get("date"):
+        data["date"] = datetime.today().strftime("%Y-%m-%d")
+    return data
+
+
+def _month_name_date(raw):
+    """Month-name date ("March 5, 2024", "5 Mar 2024") as YYYY-MM-DD, or None."""
+    raw = " ".join(raw.split())
+    for fmt in _MONTH_NAME_FORMATS:
+        try:
+            return datetime.strptime(raw, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    return None
+
+
+def _line_amount(nums):
+    """
+    Amount on a total/tax/subtotal line: the last number with a decimal
+    separator, else two trailing groups read as "12 50" -> 12.50, else the
+    last number.
+    """
+    dotted = [n for n in nums if "." in n or "," in n]
+    if dotted:
+        return _clean_amount(dotted[-1])
+    if len(nums) >= 2 and len(nums[-1]) == 2:
+        return _clean_amount(f"{nums[-2]}.{nums[-1]}")
+    return _clean_amount(nums[-1])
+
+
+def _bill_id_candidate(line):
+    for p in _BILL_PATTERNS:
+        m = p.search(line)
+        if m:
+            candidate = m.group(1)
+            if candidate and len(candidate) > 2 and not any(kw in candidate.lower() for kw in ['total', 'tax', 'date', 'amount', 'item']):
+                return candidate
+    return None
+
+
+def _classify_line(line):
+    """
+    Tags a line once, as a bit set of BILL_ID (a bill ID pattern may
+    match), TOTAL, TAX, SUBTOTAL and ITEM (not ruled out as an item line).
+    """
+    if line.isascii():
+        subject, keywords, non_item = line.lower(), _LINE_KEYWORDS, _NON_ITEM
+    else:
+        subject, keywords, non_item = line, _LINE_KEYWORDS_FOLD, _NON_ITEM_FOLD
+    tags = 0
+    for m in keywords.finditer(subject):
+        tags |= _TAG_BITS[m.lastgroup]
+    if "#" in line:
+        tags |= BILL_ID
+    if non_item.search(subject) is None and _QUANTITY.search(line) is None:
+        tags |= ITEM
+    return tags
+
 
 # ---------- MAIN PARSER ----------
 
-def parse_receipt(text: str):
+def parse_receipt(text: str, date_fallback: bool = True):
     """
     Returns structured data and item list from raw OCR text.
     First tries template-based parsing, then falls back to generic rules.
+    Every line is classified once (bill ID, total, tax, subtotal, item)
+    and its numbers are extracted at most once.
+    A receipt without a readable date gets today's date, or None with
+    date_fallback=False.
     """
     
     # Try template-based parsing first
@@ -68,47 +191,71 @@ def parse_receipt(text: str):
     
     if template:
         # Extract fields using template patterns
-        if template.bill_id_pattern:
-            m = re.search(template.bill_id_pattern, text)
-            if m: template_data['bill_id'] = m.group(1)
-            
-        if template.date_pattern:
-            m = re.search(template.date_pattern, text)
-            if m: template_data['date'] = m.group(1) # Note: might need normalization
-            
-        if template.total_pattern:
-            m = re.search(template.total_pattern, text)
-            if m: template_data['amount'] = _clean_amount(m.group(1))
+        m = template.search("bill_id", text)
+        if m: template_data['bill_id'] = m.group(1)
 
-        if template.tax_pattern:
-            m = re.search(template.tax_pattern, text)
-            if m: template_data['tax'] = _clean_amount(m.group(1))
+        m = template.search("date", text)
+        if m: template_data['date'] = m.group(1) # Note: might need normalization
+
+        m = template.search("total", text)
+        if m: template_data['amount'] = _clean_amount(m.group(1))
+
+        m = template.search("tax", text)
+        if m: template_data['tax'] = _clean_amount(m.group(1))
 
         template_data['vendor'] = template.name
 
     lines = [l.strip() for l in text.splitlines() if l.strip()]
 
-    # ---------- BILL ID ----------
     bill_id = template_data.get('bill_id')
-    if not bill_id:
-        # Reordered and added word boundaries to prevent partial matches like 'action' from 'Transaction'
-        bill_prefixes = r"(?:transaction|invoice|receipt|order|ticket|bill|inv|rec|txn|trans)"
-        bill_patterns = [
-            rf"(?i)\b{bill_prefixes}\b\s*(?:no|id|number|#)?\s*[:.-]?\s*([a-zA-Z0-9/-]+)",
-            r"(?i)#\s*([a-zA-Z0-9/-]+)",
-            r"(?i)\b(?:inv|rec|txn)\b\s*[:.-]?\s*([a-zA-Z0-9/-]+)"
-        ]
-        
-        for l in lines:
-            for p in bill_patterns:
-                m = re.search(p, l)
-                if m:
-                    candidate = m.group(1)
-                    if candidate and len(candidate) > 2 and not any(kw in candidate.lower() for kw in ['total', 'tax', 'date', 'amount', 'item']):
-                        bill_id = candidate
-                        break
-            if bill_id:
-                break
+    template_total = template_data.get('amount')
+    template_tax = template_data.get('tax')
+
+    total = 0.0
+    tax = 0.0
+    subtotal = 0.0
+    item_lines = []
+
+    # ---------- SINGLE PASS OVER LINES ----------
+    for l in lines:
+        tags = _classify_line(l)
+        nums = None
+
+        # BILL ID (first line with a usable candidate)
+        if not bill_id and tags & BILL_ID:
+            bill_id = _bill_id_candidate(l)
+
+        # TOTAL (last total line wins)
+        if not template_total and tags & TOTAL:
+            nums = _NUMBER.findall(l)
+            if nums:
+                total = _line_amount(nums)
+
+        # TAX (all tax lines add up)
+        if not template_tax and tags & TAX and "invoice" not in l.lower():
+            if nums is None:
+                nums = _NUMBER.findall(l)
+            if nums:
+                tax += _line_amount(nums)
+
+        # SUBTOTAL (last subtotal line wins)
+        if tags & SUBTOTAL:
+            if nums is None:
+                nums = _NUMBER.findall(l)
+            if nums:
+                subtotal = _line_amount(nums)
+
+        # ITEM candidates; the price bound needs the final total
+        if tags & ITEM:
+            m = _ITEM_LINE.match(l)
+            if m:
+                item_lines.append((m.group(1).strip(), _clean_amount(m.group(2))))
+
+    if lines:
+        if template_total:
+            total = template_total
+        if template_tax:
+            tax = template_tax
 
     if not bill_id:
         bill_id = _default_bill_id()
@@ -117,25 +264,20 @@ def parse_receipt(text: str):
     vendor = template_data.get('vendor')
     if not vendor:
         vendor = "Unknown Vendor"
-        generic_headers = ["tax invoice", "cash receipt", "bill of supply", "estimate", "original", "trans"]
-        
-        # Using simple loop to avoid slice indexing lint errors
-        for i, line_text in enumerate(lines):
-            if i >= 3:
-                break
-            if line_text.lower().strip() not in generic_headers and len(line_text) > 3:
+        for line_text in lines[:3]:
+            if line_text.lower() not in _GENERIC_HEADERS and len(line_text) > 3:
                 vendor = line_text
                 break
 
     # ---------- DATE ----------
     date = template_data.get('date')
     if not date:
-        date = _extract_date(text)
+        date = _extract_date(text, date_fallback)
     else:
         # Basic normalization for template dates
         try:
             # Try some common formats or just return as is if it looks okay
-            if re.match(r"\d{4}-\d{2}-\d{2}", date):
+            if _ISO_DATE.match(date):
                 pass 
             elif "/" in date:
                 parts = date.split("/")
@@ -149,66 +291,19 @@ def parse_receipt(text: str):
                     if int(mm) > 12:
                          mm, dd = dd, mm
                          
-                    date = f"{yyyy}-{mm}-{dd}"
+                    date = f"{int(yyyy):04d}-{int(mm):02d}-{int(dd):02d}"
+            else:
+                # e.g. Amazon's "Shipped on March 5, 2024"
+                date = _month_name_date(date) or _extract_date(text, date_fallback)
         except:
-             date = _extract_date(text)
-
-    # ---------- FINANCIALS ----------
-    total = 0.0
-    tax = 0.0
-    subtotal = 0.0
+             date = _extract_date(text, date_fallback)
 
-    for l in lines:
-        # TOTAL
-        if template_data.get('amount'):
-            total = template_data['amount']
-        elif re.search(r"(?i)\b(total|tot|due|payable)\b", l):
-            nums = re.findall(r"\d+[.,]?\d*", l)
-            if nums:
-                dotted = [n for n in nums if "." in n or "," in n]
-                if dotted:
-                    total = _clean_amount(dotted[-1])
-                else:
-                    if len(nums) >= 2 and len(nums[-1]) == 2:
-                        total = _clean_amount(f"{nums[-2]}.{nums[-1]}")
-                    else:
-                        total = _clean_amount(nums[-1])
-        
-        # TAX
-        if template_data.get('tax'):
-             tax = template_data['tax']
-        elif re.search(r"(?i)\b(tax|gst|vat|cgst|sgst)\b", l):
-            if "invoice" not in l.lower():
-                 nums = re.findall(r"\d+[.,]?\d*", l)
-                 if nums:
-                     current_tax = 0.0
-                     dotted = [n for n in nums if "." in n or "," in n]
-                     if dotted:
-                         current_tax = _clean_amount(dotted[-1])
-                     elif len(nums) >= 2 and len(nums[-1]) == 2:
-                         current_tax = _clean_amount(f"{nums[-2]}.{nums[-1]}")
-                     else:
-                         current_tax = _clean_amount(nums[-1])
-                     tax += current_tax
-
-        # SUBTOTAL
-        if re.search(r"(?i)\b(sub\s*total|sub\s*ttl|sub\s*tot|stot|net\s*amount|net\s*amt|taxable|sub)\b", l):
-            nums = re.findall(r"\d+[.,]?\d*", l)
-            if nums:
-                dotted = [n for n in nums if "." in n or "," in n]
-                if dotted:
-                    subtotal = _clean_amount(dotted[-1])
-                elif len(nums) >= 2 and len(nums[-1]) == 2:
-                    subtotal = _clean_amount(f"{nums[-2]}.{nums[-1]}")
-                else:
-                    subtotal = _clean_amount(nums[-1])
-
-    # Validation & Fallbacks
+    # ---------- FINANCIALS: VALIDATION & FALLBACKS ----------
     if tax > total and total > 0:
         tax = 0.0
 
     if total == 0.0:
-        nums = re.findall(r"\d+[.,]?\d*", text)
+        nums = _NUMBER.findall(text)
         if nums:
              dotted = [n for n in nums if "." in n]
              if dotted:
@@ -220,51 +315,14 @@ def parse_receipt(text: str):
         subtotal = total - tax
 
     # ---------- ITEMS ----------
-    items = []
-    for l in lines:
-        if re.search(r"\d+\s*x\s*\d+", l):
-            continue
-        if re.search(r"(?i)(total|subtotal|subttl|tax|vat|gst|change|cash|card|due)", l):
-            continue
-
-        m = re.match(r"(.+?)\s+(\d+[.,]?\d*)$", l)
-        if m:
-            name = m.group(1).strip()
-            price = _clean_amount(m.group(2))
-            if 0 < price < total and len(name) > 2:
-                items.append({
-                    "Item": name,
-                    "Price": price
-                })
+    items = [
+        {"Item": name, "Price": price}
+        for name, price in item_lines
+        if 0 < price < total and len(name) > 2
+    ]
 
     # ---------- CATEGORY DETECTION (Rule-based) ----------
-    def _extract_category(text, vendor):
-        text_lower = text.lower()
-        vendor_lower = vendor.lower()
-        
-        keywords = {
-            "Utility": ["power", "electricity", "water", "gas", "bescom", "tata power", "bill", "supply", "electric"],
-            "Food": ["restaurant", "cafe", "kitchen", "hotel", "dining", "burger", "pizza", "swiggy", "zomato", "coffee", "tea", "bistro", "foods"],
-            "Grocery": ["mart", "super market", "fresh", "store", "vegetable", "fruit", "market", "grocer", "kirana", "basket"],
-            "Medical": ["pharmacy", "hospital", "clinic", "doctor", "dr.", "medplus", "apollo", "pharma", "health", "medical"],
-            "Travel": ["fuel", "petrol", "diesel", "station", "pump", "uber", "ola", "rapido", "ride", "trip", "travel"],
-            "Shopping": ["retail", "fashion", "clothing", "trends", "zudio", "apparel", "garment", "mall", "shoe", "footwear"],
-            "Entertainment": ["movie", "cinema", "theatre", "show", "entertainment", "game", "fun"]
-        }
-        
-        # Check vendor name first (higher priority)
-        for cat, kw_list in keywords.items():
-            if any(k in vendor_lower for k in kw_list):
-                return cat
-                
-        # Check entire text
-        for cat, kw_list in keywords.items():
-            if any(k in text_lower for k in kw_list):
-                return cat
-                
-        return "Uncategorized"
-
-    category = _extract_category(text, vendor)
+    category = categorize(text, vendor)
 
     # ---------- FINAL DATA ----------
     data = {
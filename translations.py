@@ -40,6 +40,15 @@ TRANSLATIONS = {
         "upload_receipt_header": "📤 Upload Receipt",
         "upload_label": "Upload receipt image or PDF",
         "upload_info": "Please upload a receipt image or PDF to begin",
+        "batch_mode": "Batch upload (many receipts at once)",
+        "batch_upload_label": "Upload receipt images or PDFs",
+        "batch_upload_info": "Select all the receipts to process; they are read in parallel",
+        "batch_process_btn": "📄 Extract & Save All",
+        "batch_file": "File",
+        "batch_status": "Status",
+        "batch_message": "Message",
+        "batch_saved": "Receipts saved",
+        "extraction_cache_hit": "Loaded from the extraction cache (this file was processed before)",
         "converting_pdf": "Converting PDF to image...",
         "pdf_error": "Could not convert PDF to image",
         "original_image": "Original Image",
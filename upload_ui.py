@@ -3,9 +3,10 @@ from PIL import Image  # type: ignore
 import pytesseract  # type: ignore
 import pandas as pd  # type: ignore
 
-from ocr.text_parser import parse_receipt  # type: ignore
+from ocr.text_parser import apply_date_fallback, parse_receipt  # type: ignore
 from ui.validation_ui import validate_receipt  # type: ignore
-from database.queries import save_receipt, receipt_exists  # type: ignore
+from database.queries import save_receipt_image, save_ocr_text, save_receipts_bulk, receipt_exists  # type: ignore
+from database.writer import submit_save_receipt, submit_write  # type: ignore
 from config.translations import get_text  # type: ignore
 
 import pytesseract
@@ -17,10 +18,84 @@ pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tessera
 # Optional but prevents language errors
 os.environ["TESSDATA_PREFIX"] = r"C:\Program Files\Tesseract-OCR\tessdata"
 
+def render_batch_upload(lang, owner):
+    """Many receipts at once: parallel OCR, then one bulk insert."""
+    from ocr.batch_ocr import UploadedReceipt, ocr_receipts
+
+    uploaded_files = st.file_uploader(
+        get_text(lang, "batch_upload_label"),
+        type=["png", "jpg", "jpeg", "pdf"],
+        accept_multiple_files=True,
+        key="batch_uploader"
+    )
+
+    if not uploaded_files:
+        st.info(get_text(lang, "batch_upload_info"))
+        return
+
+    if not st.button(f"{get_text(lang, 'batch_process_btn')} ({len(uploaded_files)})", use_container_width=True):
+        return
+
+    uploads = [UploadedReceipt(f.name, f.getvalue(), f.type) for f in uploaded_files]
+    results = [None] * len(uploads)
+    progress = st.progress(0.0)
+    status = st.empty()
+
+    # ================= PARALLEL OCR + PARSE =================
+    for done, result in enumerate(ocr_receipts(uploads), 1):
+        results[result["index"]] = result
+        progress.progress(done / len(uploads), text=f"{done}/{len(uploads)} · {result['name']}")
+        if result["error"]:
+            status.warning(f"{result['name']}: {result['error']}")
+
+    # ================= BULK SAVE =================
+    parsed = [r for r in results if r["data"]]
+    records = [{**r["data"], "items": r["items"]} for r in parsed]
+    outcomes = submit_write(save_receipts_bulk, records, owner=owner).result() if records else []
+
+    rows = []
+    text_writes = []
+    for result, outcome in zip(parsed, outcomes):
+        result["outcome"] = outcome
+        if outcome["status"] == "inserted":
+            upload = uploads[result["index"]]
+            save_receipt_image(outcome["bill_id"], upload.content, mime_type=upload.mime_type, image=result["preview"], owner=owner)
+            text_writes.append(submit_write(save_ocr_text, outcome["bill_id"], result["text"], owner=owner))
+    for future in text_writes:
+        future.result()
+
+    for result in results:
+        data = result["data"] or {}
+        outcome = result.get("outcome") or {}
+        rows.append({
+            get_text(lang, "batch_file"): result["name"],
+            get_text(lang, "batch_status"): outcome.get("status") or "error",
+            get_text(lang, "bill_id"): outcome.get("bill_id") or data.get("bill_id"),
+            get_text(lang, "vendor"): data.get("vendor"),
+            get_text(lang, "date"): data.get("date"),
+            get_text(lang, "amount_inr"): data.get("amount"),
+            get_text(lang, "batch_message"): result["error"] or outcome.get("error") or "",
+        })
+
+    saved = sum(1 for r in parsed if r["outcome"]["status"] == "inserted")
+    status.empty()
+    if saved == len(uploads):
+        st.success(f"{get_text(lang, 'batch_saved')}: {saved}/{len(uploads)}")
+    else:
+        st.warning(f"{get_text(lang, 'batch_saved')}: {saved}/{len(uploads)}")
+    st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+
+
 def render_upload_ui():
     lang = st.session_state.get("language", "en")
+    owner = st.session_state.get("user_email")
     st.header(get_text(lang, "upload_receipt_header"))
 
+    batch_mode = st.toggle(get_text(lang, "batch_mode"), key="upload_batch_mode")
+    if batch_mode:
+        render_batch_upload(lang, owner)
+        return
+
     uploaded = st.file_uploader(
         get_text(lang, "upload_label"),
         type=["png", "jpg", "jpeg", "pdf"]
@@ -32,17 +107,17 @@ def render_upload_ui():
 
     # ================= IMAGE PROCESSING =================
     if uploaded.type == "application/pdf":
-        from ocr.pdf_processor import pdf_to_images
+        from ocr.pdf_processor import pdf_first_page
         with st.spinner(get_text(lang, "converting_pdf")):
             try:
-                pdf_images = pdf_to_images(uploaded.read())
-                if not pdf_images:
-                    st.error(get_text(lang, "pdf_error"))
-                    return
-                img = pdf_images[0] # Take first page
+                # Page 1 for the preview and AI extraction; OCR reads every page
+                img = pdf_first_page(uploaded.getvalue())
+            except ValueError:
+                st.error(get_text(lang, "pdf_error"))
+                return
             except Exception as e:
                 st.error(f"PDF Processing Error: {e}")
-                st.info("Ensure Poppler is installed and path is correct in `ocr/pdf_processor.py`.")
+                st.info("Ensure Poppler is installed and POPPLER_PATH is correct in `config/config.py`.")
                 return
     else:
         img = Image.open(uploaded)
@@ -52,8 +127,12 @@ def render_upload_ui():
         st.image(img, caption=get_text(lang, "original_image"), use_container_width=True)
 
     with col2:
-        gray = img.convert("L")
-        st.image(gray, caption=get_text(lang, "processed_image"), use_container_width=True)
+        # The exact image Tesseract will read
+        from ocr.image_preprocessing import preprocess_image
+        timings = {}
+        processed = preprocess_image(img, timings=timings)
+        st.image(processed, caption=get_text(lang, "processed_image"), use_container_width=True)
+        st.caption(" · ".join(f"{stage} {ms:.0f} ms" for stage, ms in timings.items()))
 
     st.divider()
 
@@ -63,20 +142,31 @@ def render_upload_ui():
 
     data = None
     items = []
+    text = None
     
     api_key = st.session_state.get("GEMINI_API_KEY")
     use_ai = bool(api_key)
 
+    # Results are cached by upload hash + engine, so re-uploads skip extraction
+    from ocr.extraction_cache import cached_extraction, tesseract_engine
+    content = uploaded.getvalue()
+    cache_hit = False
+
     with st.spinner(get_text(lang, "extracting_data")):
         if use_ai:
-            from ai.gemini_client import GeminiClient
-            try:
-                client = GeminiClient(api_key)
+            from ai.gemini_client import GeminiClient, EXTRACTION_ENGINE
+
+            def extract_ai():
                 # Gemini takes PIL image directly
-                result = client.extract_receipt(img)
-                if result:
-                    items = result.pop("items", [])
-                    data = result
+                result = GeminiClient(api_key).extract_receipt(img)
+                if not result:
+                    return None
+                return result, result.pop("items", []), None
+
+            try:
+                extraction, cache_hit = cached_extraction(content, EXTRACTION_ENGINE, extract_ai)
+                if extraction:
+                    data, items, _ = extraction
                     st.success(get_text(lang, "ai_success"))
             except Exception as e:
                 st.error(f"AI Extraction failed: {e}. Falling back to OCR.")
@@ -84,16 +174,29 @@ def render_upload_ui():
 
         if not data:
             # Fallback to Tesseract
-            import numpy as np
-            import cv2
-            # Use image_preprocessing if available
             from ocr.image_preprocessing import preprocess_image
-            gray_preprocessed = preprocess_image(img)
-            text = pytesseract.image_to_string(gray_preprocessed)
-            if not text.strip():
+
+            def extract_ocr():
+                if uploaded.type == "application/pdf":
+                    # All pages, OCRed as they render, merged into one receipt
+                    from ocr.pdf_processor import ocr_pdf
+                    ocr_text = ocr_pdf(content, lambda page: pytesseract.image_to_string(preprocess_image(page)))
+                else:
+                    ocr_text = pytesseract.image_to_string(preprocess_image(img))
+                if not ocr_text.strip():
+                    return None
+                # Cached without today's date, which would be stale on a later re-upload
+                return (*parse_receipt(ocr_text, date_fallback=False), ocr_text)
+
+            extraction, cache_hit = cached_extraction(content, tesseract_engine(), extract_ocr)
+            if not extraction:
                 st.error(get_text(lang, "no_text_error"))
                 return
-            data, items = parse_receipt(text)
+            data, items, text = extraction
+            apply_date_fallback(data)
+
+    if cache_hit:
+        st.caption(get_text(lang, "extraction_cache_hit"))
 
     st.session_state["LAST_EXTRACTED_RECEIPT"] = data
 
@@ -282,17 +385,30 @@ def render_upload_ui():
     st.divider()
 
     # ================= DUPLICATE CHECK & SAVE =================
-    if receipt_exists(data["bill_id"]):
+    if receipt_exists(data["bill_id"], owner):
         st.error(get_text(lang, "duplicate_error"))
         return
     else:
         st.success(get_text(lang, "no_duplicate_success"))
 
-    validation = validate_receipt(data)
+    validation = validate_receipt(data, owner=owner)
     st.session_state["LAST_VALIDATION_REPORT"] = validation
     
-    # Save receipt
-    save_receipt(data)
+    # Save receipt together with its line items (group-committed with
+    # concurrent sessions' writes by the writer thread)
+    try:
+        submit_save_receipt(data, items, owner=owner).result()
+    except ValueError as e:
+        # e.g. a date the parser could not normalize
+        st.error(f"Receipt not saved: {e}")
+        return
+
+    # Keep the original upload so it can be re-processed without re-uploading
+    uploaded.seek(0)
+    save_receipt_image(data["bill_id"], uploaded, mime_type=uploaded.type, image=img, owner=owner)
+    # ...and the OCR text, so parser fixes can be re-applied (ocr/reparse.py)
+    if text:
+        submit_write(save_ocr_text, data["bill_id"], text, owner=owner).result()
 
     if validation["passed"]:
         st.success(get_text(lang, "validation_passed_save"))
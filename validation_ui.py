@@ -1,4 +1,4 @@
-from typing import Any, Dict  # type: ignore
+from typing import Any, Dict, Optional  # type: ignore
 import streamlit as st  # type: ignore
 from datetime import datetime  # type: ignore
 from database.queries import fetch_all_receipts, receipt_exists  # type: ignore
@@ -9,7 +9,7 @@ EXPECTED_TAX_RATE = 0.08   # 8%
 TOLERANCE = 0.05           # 5% tolerance
 
 
-def validate_receipt(data: dict, skip_duplicate: bool = False) -> dict:
+def validate_receipt(data: dict, skip_duplicate: bool = False, owner: Optional[str] = None) -> dict:
     results = []
     passed = True
 
@@ -133,7 +133,7 @@ def validate_receipt(data: dict, skip_duplicate: bool = False) -> dict:
 
     # ---------- Duplicate Detection ----------
     if not skip_duplicate:
-        if receipt_exists(data.get("bill_id")):
+        if receipt_exists(data.get("bill_id"), owner):
             results.append({
                 "status": "error",
                 "title": "Duplicate Detection",
@@ -195,7 +195,7 @@ def validation_ui():
     tax_input = c4.text_input("Tax")
 
     if st.button("Run Validation", use_container_width=True):
-        receipts = fetch_all_receipts()
+        receipts = fetch_all_receipts(owner=st.session_state.get("user_email"))
         match: dict[str, Any] | None = None
 
         for r_raw in receipts:
@@ -231,7 +231,7 @@ def validation_ui():
 
         # Explicitly declare match as dict for type checker
         match_data: dict[str, Any] = match # type: ignore
-        stored_report = validate_receipt(match_data, skip_duplicate=True)
+        stored_report = validate_receipt(match_data, skip_duplicate=True, owner=st.session_state.get("user_email"))
 
         st.subheader(f"🧪 Validation for {match_data.get('bill_id', 'Unknown')}")
 
@@ -0,0 +1,206 @@
+"""
+Single writer thread with group commit for receipts.db.
+
+Streamlit sessions (threads of one process) submit write operations to an
+in-process queue instead of each opening its own write transaction. The
+writer thread drains the queue in windows of up to MAX_BATCH operations
+or MAX_DELAY seconds and runs each window in one BEGIN IMMEDIATE ... COMMIT,
+so concurrent uploads share one commit and never contend for the lock
+with each other. Callers get a concurrent.futures.Future that resolves
+once their operation is committed.
+
+Writers in other processes (the FastAPI server) can still hold the lock;
+BEGIN IMMEDIATE is retried with jittered exponential backoff on top of
+SQLite's busy_timeout.
+"""
+import atexit
+import logging
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from database.db import get_db, archived_years, attach_archives, MAX_ATTACHED_ARCHIVES
+from database.queries import save_receipt, update_receipt, delete_receipt
+
+logger = logging.getLogger(__name__)
+
+# ================= GROUP COMMIT WINDOW =================
+MAX_BATCH = 200            # operations per commit
+MAX_DELAY = 0.005          # s to wait for more operations after the first
+BUSY_RETRIES = 6
+BUSY_BACKOFF = 0.05        # s, doubled per retry
+
+_Operation = Tuple[Future, Callable[..., Any], Tuple[Any, ...], Dict[str, Any]]
+
+
+def _is_busy(error: sqlite3.OperationalError) -> bool:
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+class WriteQueue:
+    """
+    Serializes write operations onto one thread and commits them in groups.
+    Each operation runs in its own SAVEPOINT, so a failing operation only
+    fails its own future and the rest of the group still commits.
+    """
+
+    def __init__(
+        self,
+        max_batch: int = MAX_BATCH,
+        max_delay: float = MAX_DELAY,
+        retries: int = BUSY_RETRIES,
+        backoff: float = BUSY_BACKOFF
+    ):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = {"operations": 0, "commits": 0, "busy_retries": 0, "failed_commits": 0}
+        self._queue: "queue.Queue[Optional[_Operation]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="receipts-writer", daemon=True)
+        self._thread.start()
+
+    # ---------- CALLER SIDE ----------
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """
+        Queues fn(*args, **kwargs) to run on the writer thread inside a group
+        transaction. fn must write through database.db.transaction() (or
+        plain execute) and never commit itself.
+        """
+        future: Future = Future()
+        if threading.current_thread() is self._thread:
+            # Submitted from inside a queued operation: already in the group
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Write queue is closed")
+            self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def close(self, timeout: Optional[float] = None):
+        """Commits everything already queued, then stops the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(timeout)
+
+    # ---------- WRITER THREAD ----------
+    def _next_batch(self) -> Tuple[List[_Operation], bool]:
+        """Blocks for one operation, then gathers more until the window closes."""
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                op = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if op is None:
+                return batch, True
+            batch.append(op)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            if batch:
+                self._commit(batch)
+
+    def _begin(self, db: sqlite3.Connection):
+        for attempt in range(self.retries + 1):
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == self.retries:
+                    raise
+                self.stats["busy_retries"] += 1
+                time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def _commit(self, batch: List[_Operation]):
+        live = [op for op in batch if op[0].set_running_or_notify_cancel()]
+        if not live:
+            return
+
+        db = get_db()
+        outcomes: List[Tuple[Future, Any, Optional[BaseException]]] = []
+        try:
+            # Edits of archived receipts go through their attached partition,
+            # and archives cannot be attached inside the group transaction
+            attach_archives(db, archived_years()[-MAX_ATTACHED_ARCHIVES:])
+            self._begin(db)
+            for future, fn, args, kwargs in live:
+                db.execute("SAVEPOINT queued_write")
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    db.execute("ROLLBACK TO queued_write")
+                    outcomes.append((future, None, e))
+                else:
+                    outcomes.append((future, result, None))
+                db.execute("RELEASE queued_write")
+            db.commit()
+        except Exception as e:
+            if db.in_transaction:
+                db.rollback()
+            self.stats["failed_commits"] += 1
+            logger.error("Group commit of %d writes failed: %s", len(live), e)
+            for future, *_ in live:
+                future.set_exception(e)
+            return
+
+        self.stats["commits"] += 1
+        self.stats["operations"] += len(live)
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+# ================= PROCESS-WIDE QUEUE =================
+_write_queue: Optional[WriteQueue] = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue() -> WriteQueue:
+    """The process's writer, started on first use and flushed at exit."""
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteQueue()
+            atexit.register(_write_queue.close)
+        return _write_queue
+
+
+def submit_write(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    return get_write_queue().submit(fn, *args, **kwargs)
+
+
+def submit_save_receipt(data, items: Optional[List[Dict[str, Any]]] = None, owner: Optional[str] = None) -> Future:
+    return submit_write(save_receipt, data, items, owner=owner)
+
+
+def submit_update_receipt(bill_id: str, update_data: Dict[str, Any], owner: Optional[str] = None) -> Future:
+    return submit_write(update_receipt, bill_id, update_data, owner=owner)
+
+
+def submit_delete_receipt(bill_id: str, owner: Optional[str] = None) -> Future:
+    return submit_write(delete_receipt, bill_id, owner=owner)